@@ -0,0 +1,346 @@
+# anchoring.py - تسجيل بصمات التقييمات في السجل (البلوكشين) على دفعات دون انتظار
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+
+import db_pool
+import monitoring
+
+ANCHOR_BATCH_SIZE = int(os.getenv("ANCHOR_BATCH_SIZE", "256"))
+ANCHOR_WINDOW_SECONDS = float(os.getenv("ANCHOR_WINDOW_SECONDS", "5"))
+LEDGER_BACKEND = os.getenv("LEDGER_BACKEND", "local")
+# دفعة مطالَب بها منذ أكثر من هذا تُعدّ يتيمة (عملية توقفت أثناء flush) وتُطالب بها عملية أخرى
+ANCHOR_CLAIM_TIMEOUT = float(os.getenv("ANCHOR_CLAIM_TIMEOUT", "600"))
+
+
+def evaluation_digest(data):
+    """Stable sha256 of an evaluation result (key order does not matter)."""
+    raw = json.dumps(data, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+# ------ شجرة Merkle ------
+def _leaf(digest):
+    # بادئة مختلفة للأوراق والعقد الداخلية حتى لا تُزوَّر ورقة بعقدة داخلية
+    return hashlib.sha256(b"\x00" + bytes.fromhex(digest)).digest()
+
+
+def _node(left, right):
+    return hashlib.sha256(b"\x01" + left + right).digest()
+
+
+def merkle_tree(digests):
+    """Return ``(root_hex, proofs)`` for hex ``digests``; ``proofs[i]`` proves ``digests[i]``.
+
+    A proof is a list of ``[side, sibling_hex]`` steps from the leaf upwards,
+    where ``side`` says whether the sibling sits on the "L" or "R". An odd node
+    at the end of a level is carried up unchanged rather than duplicated.
+    """
+    level = [_leaf(d) for d in digests]
+    if not level:
+        raise ValueError("cannot build a Merkle tree without leaves")
+    positions = list(range(len(level)))  # موقع كل ورقة في المستوى الحالي
+    proofs = [[] for _ in level]
+    while len(level) > 1:
+        for i, pos in enumerate(positions):
+            sibling = pos ^ 1
+            if sibling < len(level):
+                proofs[i].append(["L" if sibling < pos else "R", level[sibling].hex()])
+            positions[i] = pos // 2
+        level = [_node(level[j], level[j + 1]) if j + 1 < len(level) else level[j]
+                 for j in range(0, len(level), 2)]
+    return level[0].hex(), proofs
+
+
+def verify_inclusion(digest, proof, root):
+    """Check offline that ``digest`` is a leaf of the tree with ``root``."""
+    node = _leaf(digest)
+    for side, sibling in proof:
+        sibling = bytes.fromhex(sibling)
+        node = _node(sibling, node) if side == "L" else _node(node, sibling)
+    return node.hex() == root
+
+
+# ------ السجلات ------
+class LocalLedger:
+    """Append-only stand-in for the chain, stored in SQLite, for tests and local runs."""
+
+    def __init__(self, path=os.getenv("LOCAL_LEDGER_PATH", "ledger.db"), latency=0.0):
+        self.latency = latency
+        self.pool = db_pool.ConnectionPool(path, size=2)
+        with self.pool.connection() as conn:
+            conn.execute('''CREATE TABLE IF NOT EXISTS ledger_entries
+                            (id INTEGER PRIMARY KEY,
+                             digest TEXT NOT NULL,
+                             tx_hash TEXT NOT NULL UNIQUE,
+                             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+            conn.commit()
+
+    def record(self, digest):
+        if self.latency:
+            time.sleep(self.latency)  # محاكاة زمن تأكيد المعاملة
+        with self.pool.connection() as conn:
+            row_id = conn.execute("INSERT INTO ledger_entries (digest, tx_hash) VALUES (?, '')",
+                                  (digest,)).lastrowid
+            tx_hash = "0x" + hashlib.sha256(f"{row_id}:{digest}".encode()).hexdigest()
+            conn.execute("UPDATE ledger_entries SET tx_hash = ? WHERE id = ?", (tx_hash, row_id))
+            conn.commit()
+        return tx_hash
+
+    def lookup(self, tx_hash):
+        with self.pool.connection() as conn:
+            row = conn.execute("SELECT digest FROM ledger_entries WHERE tx_hash = ?", (tx_hash,)).fetchone()
+        return row[0] if row else None
+
+
+class Web3Ledger:
+    """Sends one contract call per digest, signing locally with locally managed nonces.
+
+    The nonce is read from the node once and then incremented in-process, so
+    concurrent writers neither serialise on ``get_transaction_count`` nor pay
+    its round-trip per transaction. Any failure after a nonce was taken
+    triggers a resync: an unsent nonce would otherwise leave a gap that
+    stalls every later transaction.
+    """
+
+    def __init__(self, function="storeEvaluation", node_url=None, contract_address=None):
+        from web3 import Web3
+
+        self.w3 = Web3(Web3.HTTPProvider(node_url or os.getenv("ETH_NODE")))
+        self.contract = self.w3.eth.contract(
+            address=contract_address or os.getenv("CONTRACT_ADDRESS"),
+            abi=json.loads(os.getenv("CONTRACT_ABI", "[]"))
+        )
+        self.function = function
+        self.private_key = os.getenv("PRIVATE_KEY")
+        self.account = (self.w3.eth.account.from_key(self.private_key).address
+                        if self.private_key else self.w3.eth.default_account)
+        self._nonce = None
+        self._nonce_lock = threading.Lock()
+
+    def _next_nonce(self):
+        with self._nonce_lock:
+            if self._nonce is None:
+                self._nonce = self.w3.eth.get_transaction_count(self.account, "pending")
+            nonce = self._nonce
+            self._nonce += 1
+            return nonce
+
+    def _resync_nonce(self):
+        with self._nonce_lock:
+            self._nonce = None
+
+    def record(self, digest):
+        call = getattr(self.contract.functions, self.function)(bytes.fromhex(digest))
+        if not self.private_key:
+            return call.transact({"from": self.account}).hex()
+        nonce = self._next_nonce()
+        try:
+            tx = call.build_transaction({
+                "from": self.account,
+                "nonce": nonce,
+                "gas": 200000,
+            })
+            signed_tx = self.w3.eth.account.sign_transaction(tx, self.private_key)
+            return self.w3.eth.send_raw_transaction(signed_tx.rawTransaction).hex()
+        except Exception:
+            # لا نعرف إن وصلت المعاملة إلى العقدة: نعيد قراءة الـ nonce منها بدلاً من التخمين
+            self._resync_nonce()
+            raise
+
+
+def create_ledger(kind=LEDGER_BACKEND, **kwargs):
+    if kind == "local":
+        return LocalLedger(**kwargs)
+    if kind == "web3":
+        return Web3Ledger(**kwargs)
+    raise ValueError(f"unknown ledger backend: {kind}")
+
+
+# ------ تجميع البصمات ------
+class AnchorBatcher:
+    """Queues evaluation digests and writes many of them to the ledger in one entry.
+
+    ``submit`` only inserts a pending row and returns a proof handle; ``flush``
+    (run periodically or when a batch fills) records the Merkle root of one
+    batch on the ledger and stores each row's inclusion proof. Rows are
+    claimed with a single ``UPDATE ... RETURNING``, so flushes in different
+    processes never anchor the same row twice.
+    """
+
+    def __init__(self, ledger, pool=None, batch_size=ANCHOR_BATCH_SIZE, claim_timeout=ANCHOR_CLAIM_TIMEOUT):
+        self.ledger = ledger
+        self.pool = pool or db_pool.get_pool()
+        self.batch_size = batch_size
+        self.claim_timeout = claim_timeout
+        self._flush_lock = threading.Lock()
+        self.submitted = monitoring.counter("anchor_submitted_total", "Evaluation digests queued for anchoring")
+        self.anchored = monitoring.counter("anchor_anchored_total", "Evaluation digests anchored on the ledger")
+        self.ledger_writes = monitoring.counter("anchor_ledger_writes_total", "Ledger writes made for anchoring")
+        with self.pool.connection() as conn:
+            conn.execute('''CREATE TABLE IF NOT EXISTS evaluation_anchors
+                            (evaluation_id TEXT PRIMARY KEY,
+                             digest TEXT NOT NULL,
+                             status TEXT NOT NULL DEFAULT 'pending',
+                             batch_digest TEXT,
+                             tx_hash TEXT,
+                             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                             anchored_at TIMESTAMP)''')
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(evaluation_anchors)")}
+            if "merkle_proof" not in columns:
+                conn.execute("ALTER TABLE evaluation_anchors ADD COLUMN merkle_proof TEXT")
+            if "claim_id" not in columns:
+                conn.execute("ALTER TABLE evaluation_anchors ADD COLUMN claim_id TEXT")
+                conn.execute("ALTER TABLE evaluation_anchors ADD COLUMN claimed_at REAL")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_anchors_status ON evaluation_anchors (status, created_at)")
+            conn.commit()
+
+    def submit(self, evaluation_id, digest):
+        """Queue ``digest``; returns the pending proof handle and whether a batch is now full."""
+        with self.pool.connection() as conn:
+            conn.execute("INSERT OR IGNORE INTO evaluation_anchors (evaluation_id, digest) VALUES (?, ?)",
+                         (evaluation_id, digest))
+            pending = conn.execute("SELECT COUNT(*) FROM evaluation_anchors WHERE status = 'pending'").fetchone()[0]
+            conn.commit()
+        self.submitted.inc()
+        handle = {"evaluation_id": evaluation_id, "digest": digest, "status": "pending"}
+        # إشعار واحد عند امتلاء كل دفعة، لا عند كل إرسال بعدها
+        return handle, pending % self.batch_size == 0
+
+    def _claim(self, claim_id, now):
+        # عبارة واحدة تأخذ قفل الكتابة: لا يمكن لعمليتين المطالبة بالصف نفسه
+        with self.pool.connection() as conn:
+            rows = conn.execute(
+                "UPDATE evaluation_anchors SET status = 'anchoring', claim_id = ?, claimed_at = ? "
+                "WHERE evaluation_id IN (SELECT evaluation_id FROM evaluation_anchors "
+                "WHERE status = 'pending' OR (status = 'anchoring' AND claimed_at < ?) "
+                "ORDER BY created_at, evaluation_id LIMIT ?) "
+                "RETURNING evaluation_id, digest, created_at",
+                (claim_id, now, now - self.claim_timeout, self.batch_size)).fetchall()
+            conn.commit()
+        # RETURNING لا يضمن ترتيباً، والبراهين تعتمد على ترتيب الأوراق
+        rows.sort(key=lambda row: (row[2] or "", row[0]))
+        return [(evaluation_id, digest) for evaluation_id, digest, _ in rows]
+
+    def flush(self):
+        """Anchor up to one batch of pending digests; returns how many were anchored."""
+        with self._flush_lock:
+            claim_id = uuid.uuid4().hex
+            rows = self._claim(claim_id, time.time())
+            if not rows:
+                return 0
+            root, proofs = merkle_tree([digest for _, digest in rows])
+            try:
+                tx_hash = self.ledger.record(root)
+            except BaseException:
+                # إعادة الدفعة إلى الانتظار لتُطالب بها المحاولة التالية فوراً
+                with self.pool.connection() as conn:
+                    conn.execute("UPDATE evaluation_anchors SET status = 'pending', claim_id = NULL, "
+                                 "claimed_at = NULL WHERE claim_id = ? AND status = 'anchoring'", (claim_id,))
+                    conn.commit()
+                raise
+            self.ledger_writes.inc()
+            with self.pool.connection() as conn:
+                conn.executemany(
+                    "UPDATE evaluation_anchors SET status = 'anchored', batch_digest = ?, tx_hash = ?, "
+                    "merkle_proof = ?, anchored_at = CURRENT_TIMESTAMP WHERE evaluation_id = ? AND claim_id = ?",
+                    [(root, tx_hash, json.dumps(proof), evaluation_id, claim_id)
+                     for (evaluation_id, _), proof in zip(rows, proofs)])
+                conn.commit()
+            self.anchored.inc(len(rows))
+            return len(rows)
+
+    def proof(self, evaluation_id):
+        with self.pool.connection() as conn:
+            row = conn.execute(
+                "SELECT evaluation_id, digest, status, batch_digest, tx_hash, merkle_proof "
+                "FROM evaluation_anchors WHERE evaluation_id = ?", (evaluation_id,)).fetchone()
+        if row is None:
+            return None
+        evaluation_id, digest, status, root, tx_hash, proof = row
+        return {"evaluation_id": evaluation_id, "digest": digest, "status": status,
+                "root": root, "tx_hash": tx_hash, "proof": json.loads(proof) if proof else None}
+
+
+# ------ تثبيت الدرجات على نوافذ زمنية ------
+class GradeAnchorService:
+    """Accumulates grade digests per time window and anchors only the window's Merkle root.
+
+    ``submit`` returns a Future resolving to a receipt
+    ``{"leaf", "root", "proof", "tx_hash"}`` that ``verify_inclusion`` can
+    check offline against the on-chain root.
+    """
+
+    def __init__(self, ledger, window=ANCHOR_WINDOW_SECONDS, max_leaves=ANCHOR_BATCH_SIZE, name="grade_anchor"):
+        self.ledger = ledger
+        self.window = window
+        self.max_leaves = max_leaves
+        self._pending = []
+        self._cond = threading.Condition()
+        self._closed = False
+        self.anchored = monitoring.counter(f"{name}_leaves_total", "Grades anchored through a Merkle root")
+        self.ledger_writes = monitoring.counter(f"{name}_ledger_writes_total", "Merkle roots written to the ledger")
+        self._thread = threading.Thread(target=self._run, name=f"{name}-window", daemon=True)
+        self._thread.start()
+
+    def submit(self, digest):
+        future = Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("anchor service is closed")
+            self._pending.append((digest, future))
+            if len(self._pending) >= self.max_leaves:
+                self._cond.notify()
+        return future
+
+    def _run(self):
+        while True:
+            with self._cond:
+                deadline = time.monotonic() + self.window
+                while (not self._closed and len(self._pending) < self.max_leaves
+                       and time.monotonic() < deadline):
+                    self._cond.wait(max(0.0, deadline - time.monotonic()))
+                batch = self._pending[:self.max_leaves]
+                del self._pending[:self.max_leaves]
+                done = self._closed and not self._pending
+            if batch:
+                self._anchor(batch)
+            if done:
+                return
+
+    def _anchor(self, batch):
+        try:
+            root, proofs = merkle_tree([digest for digest, _ in batch])
+            tx_hash = self.ledger.record(root)
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        self.ledger_writes.inc()
+        self.anchored.inc(len(batch))
+        for (digest, future), proof in zip(batch, proofs):
+            future.set_result({"leaf": digest, "root": root, "proof": proof, "tx_hash": tx_hash})
+
+    def close(self, timeout=30):
+        """Anchor whatever is still pending, then stop."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join(timeout)
+
+
+_batcher = None
+_lock = threading.Lock()
+
+
+def get_batcher():
+    global _batcher
+    if _batcher is None:
+        with _lock:
+            if _batcher is None:
+                _batcher = AnchorBatcher(create_ledger())
+    return _batcher
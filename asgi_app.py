@@ -0,0 +1,341 @@
+# asgi_app.py - وضع ASGI غير المتزامن لنقاط التقييم والتدقيق والمقاييس
+"""Async serving mode for ``/api/v1/evaluate``, ``/api/v1/audit`` and ``/metrics``.
+
+``AsyncEvaluationApp`` is a plain ASGI 3 application with the same auth,
+rate-limit, cache and audit behaviour as the Flask routes in App.py, so one
+event loop can hold thousands of evaluations waiting on the model instead of
+one per gunicorn worker. Run it under any ASGI server::
+
+    uvicorn --factory asgi_app:create_app --port 5001
+
+``python asgi_app.py`` does the same with the ``ASGI_*`` settings below.
+With ``?stream=1`` or ``Accept: text/event-stream`` the evaluation is sent
+as server-sent events while the model generates it.
+"""
+import asyncio
+import http
+import json
+import logging
+import os
+from urllib.parse import parse_qs, unquote
+
+import audit_pipeline
+import audit_store
+import auth_cache
+import db_pool
+import eval_cache
+import evaluation_service
+import llm_backend
+import monitoring
+import rate_limiter
+import singleflight
+
+try:
+    from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+except ImportError:  # بدون prometheus_client تُعرض لقطة monitoring بصيغة JSON
+    CONTENT_TYPE_LATEST = generate_latest = None
+
+logger = logging.getLogger(__name__)
+
+APP_SECRET_KEY = os.getenv("APP_SECRET_KEY")
+ASGI_HOST = os.getenv("ASGI_HOST", "0.0.0.0")
+ASGI_PORT = int(os.getenv("ASGI_PORT", "5001"))
+ASGI_MAX_BODY = int(os.getenv("ASGI_MAX_BODY", str(1024 * 1024)))
+ASGI_KEEPALIVE_TIMEOUT = float(os.getenv("ASGI_KEEPALIVE_TIMEOUT", "5"))
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message, headers=()):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.headers = list(headers)
+
+
+# ------ أدوات الطلب والاستجابة ------
+def _header(scope, name):
+    for key, value in scope["headers"]:
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+def _query(scope):
+    return {k: v[-1] for k, v in parse_qs(scope["query_string"].decode("latin-1")).items()}
+
+
+def _int_arg(args, name, default=None):
+    # مثل request.args.get(name, type=int): القيمة غير الصالحة تعني الافتراضية
+    try:
+        return int(args[name])
+    except (KeyError, ValueError):
+        return default
+
+
+def _wants_event_stream(scope):
+    if _query(scope).get('stream') in ('1', 'true'):
+        return True
+    accept = _header(scope, b"accept") or ""
+    return accept.split(",")[0].split(";")[0].strip() == 'text/event-stream'
+
+
+async def _read_body(receive):
+    chunks, size = [], 0
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            raise HTTPError(400, "Client disconnected")
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if size > ASGI_MAX_BODY:
+            raise HTTPError(413, "Request body too large")
+        chunks.append(chunk)
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+
+async def send_response(send, status, body, content_type="application/json", headers=()):
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", content_type.encode()),
+                    (b"content-length", str(len(body)).encode())] + list(headers),
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def send_json(send, status, payload, headers=()):
+    await send_response(send, status, json.dumps(payload).encode(), headers=headers)
+
+
+class AsyncEvaluationApp:
+    """ASGI 3 application; ``create_app()`` builds one from the environment."""
+
+    def __init__(self, secret_key=APP_SECRET_KEY, limiter=None, db=None):
+        if not secret_key:
+            # بدون سر مشترك لن تُقبل الرموز الصادرة عن خادم Flask
+            raise ValueError("APP_SECRET_KEY must be set so tokens issued by the Flask app verify here")
+        self.token_verifier = auth_cache.TokenVerifier(secret_key)
+        self.limiter = limiter
+        self.db = db
+        self.evaluations_in_flight = singleflight.AsyncSingleFlight(name="async_evaluation_singleflight")
+        self.routes = {
+            ("POST", "/api/v1/evaluate"): self.evaluate,
+            ("GET", "/api/v1/audit"): self.audit,
+            ("GET", "/metrics"): self.metrics,
+        }
+        self.requests_in_flight = monitoring.gauge("asgi_requests_in_flight", "Requests being served by the ASGI app")
+        self.request_latency = monitoring.latency("asgi_request_seconds", "ASGI request latency")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+        handler = self.routes.get((scope["method"], scope["path"]))
+        if handler is None:
+            status = 405 if any(path == scope["path"] for _, path in self.routes) else 404
+            await send_json(send, status, {'error': http.HTTPStatus(status).phrase})
+            return
+        self.requests_in_flight.inc()
+        try:
+            with self.request_latency.time():
+                await handler(scope, receive, send)
+        except HTTPError as e:
+            await send_json(send, e.status, {'error': e.message}, e.headers)
+        finally:
+            self.requests_in_flight.dec()
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                try:
+                    self.startup()
+                except Exception as e:
+                    logger.error("ASGI startup failed: %s", e)
+                    await send({"type": "lifespan.startup.failed", "message": str(e)})
+                    return
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.shutdown()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    def startup(self):
+        if self.limiter is None:
+            self.limiter = rate_limiter.get_limiter()
+        if self.db is None:
+            self.db = db_pool.AsyncDB()
+
+    def shutdown(self):
+        if self.db is not None:
+            self.db.close()
+        audit_pipeline.shutdown()
+        eval_cache.shutdown()
+        db_pool.shutdown()
+
+    # ------ المصادقة: نفس سلوك token_required ------
+    def authenticate(self, scope):
+        token = _header(scope, b"authorization")
+        if not token:
+            logger.warning("Token missing in request")
+            raise HTTPError(401, 'Token missing')
+        try:
+            user = self.token_verifier.verify(token).user
+        except auth_cache.ExpiredSignatureError:
+            logger.warning("Expired token")
+            raise HTTPError(401, 'Token expired')
+        except auth_cache.InvalidTokenError:
+            logger.warning("Invalid token")
+            raise HTTPError(403, 'Invalid token')
+        if user is None:
+            # توقيع صحيح بلا هوية مستخدم لا يكفي للمصادقة
+            logger.warning("Token has no user claim")
+            raise HTTPError(403, 'Invalid token')
+        return user
+
+    def check_rate(self, scope, user, endpoint):
+        # قسم حرج قصير في الذاكرة المشتركة، أرخص من نقله إلى خيط
+        client = scope.get("client")
+        if self.limiter.check(ip=client[0] if client else None, user=user, endpoint=endpoint):
+            raise HTTPError(429, 'Too many requests', [(b"retry-after", b"60")])
+
+    # ------ /api/v1/evaluate ------
+    async def evaluate(self, scope, receive, send):
+        current_user = self.authenticate(scope)
+        self.check_rate(scope, current_user, '/api/v1/evaluate')
+        try:
+            data = json.loads(await _read_body(receive) or b"null")
+        except ValueError:
+            raise HTTPError(400, 'Invalid JSON')
+        if not isinstance(data, dict) or 'task' not in data:
+            raise HTTPError(400, 'Task data missing')
+        task = data['task']
+        key = evaluation_service.evaluation_key(task)
+        cache = eval_cache.get_cache()
+        if _wants_event_stream(scope):
+            await self.stream_evaluation(receive, send, current_user, task, key)
+            return
+        try:
+            result = await self.db.call(cache.get, key)
+            if result is None:
+                result = await self.evaluations_in_flight.do(key, self.evaluate_and_cache, task, key,
+                                                             timeout=evaluation_service.EVALUATION_TIMEOUT)
+            await self.log_audit(current_user, 'TASK_EVALUATION', task)
+        except TimeoutError:
+            logger.warning("AI evaluation timed out for user %s", current_user)
+            raise HTTPError(504, 'Evaluation timed out')
+        except Exception as e:
+            logger.error("Error during AI evaluation: %s", e)
+            raise HTTPError(500, 'Evaluation failed')
+        await send_json(send, 200, result)
+
+    async def evaluate_and_cache(self, task, key):
+        result = await evaluation_service.arun_evaluation(task)
+        await self.db.call(eval_cache.get_cache().set, key, result)
+        return result
+
+    async def stream_evaluation(self, receive, send, current_user, task, key):
+        """SSE: one ``token`` event per generated piece, then ``done`` with the integrity hash."""
+        cached = await self.db.call(eval_cache.get_cache().get, key)
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", b"text/event-stream"), (b"cache-control", b"no-cache"),
+                                (b"x-accel-buffering", b"no")]})
+        producer = asyncio.ensure_future(self.send_events(send, current_user, task, key, cached))
+        # الجسم قُرئ بالكامل، فلا يصل من receive بعده إلا http.disconnect
+        disconnected = asyncio.ensure_future(receive())
+        try:
+            await asyncio.wait({producer, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            disconnected.cancel()
+            if not producer.done():
+                # إلغاء المنتج يغلق طلب النموذج فيتوقف التوليد المدفوع
+                logger.info("Client left a streamed evaluation for user %s", current_user)
+                producer.cancel()
+            await asyncio.gather(producer, return_exceptions=True)
+
+    async def send_events(self, send, current_user, task, key, cached):
+        events = evaluation_service.astream_evaluation(task, cached)
+        try:
+            async for event, data in events:
+                if event == "done":
+                    if cached is None:
+                        await self.db.call(eval_cache.get_cache().set, key, data)
+                    await self.log_audit(current_user, 'TASK_EVALUATION', task)
+                    data = {'integrity_hash': data['integrity_hash']}
+                else:
+                    data = {'text': data}
+                await send({"type": "http.response.body", "more_body": True,
+                            "body": evaluation_service.sse_event(event, data).encode()})
+        except llm_backend.LLMError as e:
+            logger.error("Error during streamed AI evaluation: %s", e)
+            await send({"type": "http.response.body", "more_body": True,
+                        "body": evaluation_service.sse_event('error', {'error': 'Evaluation failed'}).encode()})
+        finally:
+            await events.aclose()
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+    async def log_audit(self, user, action, details):
+        # سياسة "block" قد تنتظر مكاناً في الطابور، فلا يُستدعى enqueue على الحلقة
+        try:
+            await self.db.call(audit_pipeline.get_pipeline("sqlite").enqueue, user, action, details)
+        except Exception as e:
+            logger.error("Failed to log audit: %s", e)
+
+    # ------ /api/v1/audit ------
+    async def audit(self, scope, receive, send):
+        self.authenticate(scope)
+        args = _query(scope)
+        user_id = _int_arg(args, 'user_id')
+        action = args.get('action')
+        cursor = args.get('cursor')
+        accept = (_header(scope, b"accept") or "").split(",")[0].split(";")[0].strip()
+        stream = args.get('format') == 'ndjson' or accept == 'application/x-ndjson'
+        try:
+            if cursor:
+                audit_store.decode_cursor(cursor)
+        except ValueError:
+            raise HTTPError(400, 'Invalid cursor')
+
+        if not stream:
+            limit = _int_arg(args, 'limit', audit_store.AUDIT_PAGE_SIZE)
+            logs, next_cursor = await self.db.run(audit_store.fetch_page, user_id, action, cursor, limit)
+            await send_json(send, 200, {'logs': logs, 'next_cursor': next_cursor})
+            return
+
+        # بث NDJSON صفحةً بصفحة: لا يُمسك اتصال من المجمع بين الدفعات ولا بين انتظار العميل
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", b"application/x-ndjson")]})
+        while True:
+            rows, cursor = await self.db.run(audit_store.fetch_page, user_id, action, cursor,
+                                             audit_store.AUDIT_MAX_PAGE_SIZE)
+            body = "".join(json.dumps(row) + "\n" for row in rows).encode()
+            await send({"type": "http.response.body", "body": body, "more_body": cursor is not None})
+            if cursor is None:
+                return
+
+    # ------ /metrics ------
+    async def metrics(self, scope, receive, send):
+        if generate_latest is not None:
+            await send_response(send, 200, generate_latest(), CONTENT_TYPE_LATEST)
+        else:
+            await send_json(send, 200, monitoring.snapshot())
+
+
+def create_app():
+    return AsyncEvaluationApp()
+
+
+def main():
+    """Serve ``create_app()`` with uvicorn; HTTP parsing is left to a hardened server."""
+    import uvicorn
+
+    logging.basicConfig(level=logging.INFO)
+    uvicorn.run(create_app(), host=ASGI_HOST, port=ASGI_PORT,
+                timeout_keep_alive=ASGI_KEEPALIVE_TIMEOUT, lifespan="on")
+
+
+if __name__ == "__main__":
+    main()
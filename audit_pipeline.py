@@ -0,0 +1,194 @@
+# audit_pipeline.py - كتابة سجلات التدقيق خارج مسار الطلب على دفعات
+import datetime
+import logging
+import os
+import queue
+import threading
+import time
+
+import db_pool
+import monitoring
+
+logger = logging.getLogger(__name__)
+
+AUDIT_QUEUE_SIZE = int(os.getenv("AUDIT_QUEUE_SIZE", "10000"))
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "256"))
+AUDIT_FLUSH_INTERVAL = float(os.getenv("AUDIT_FLUSH_INTERVAL", "0.5"))
+# block: انتظار مكان في الطابور حتى put_timeout ثم الإسقاط
+# drop: إسقاط الحدث فوراً عند الامتلاء
+# raise: رفع queue.Full للمستدعي
+AUDIT_BACKPRESSURE = os.getenv("AUDIT_BACKPRESSURE", "block")
+AUDIT_PUT_TIMEOUT = float(os.getenv("AUDIT_PUT_TIMEOUT", "0.05"))
+
+BACKPRESSURE_POLICIES = ("block", "drop", "raise")
+
+
+# ------ وجهات الكتابة ------
+class SQLiteAuditSink:
+    def __init__(self, pool=None):
+        self.pool = pool
+
+    def write_batch(self, events):
+        pool = self.pool or db_pool.get_pool()
+        with pool.connection() as conn:
+            conn.executemany(
+                "INSERT INTO audit_log (user_id, action, details, timestamp) VALUES (?, ?, ?, ?)",
+                [(e["user"], e["action"], e["details"], e["timestamp"]) for e in events],
+            )
+            conn.commit()
+
+    def close(self):
+        pass
+
+
+class FileAuditSink:
+    def __init__(self, path="audit.log", fsync=False):
+        self.path = path
+        self.fsync = fsync
+        self._file = open(path, "a", encoding="utf-8")
+
+    def write_batch(self, events):
+        self._file.write("".join(
+            f"{e['timestamp']} | {e['user']} | {e['action']}\n" for e in events))
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+
+# ------ خط الأنابيب ------
+class AuditPipeline:
+    """Bounded in-process queue drained by one thread in size/time-triggered batches."""
+
+    def __init__(self, sink, max_queue=AUDIT_QUEUE_SIZE, batch_size=AUDIT_BATCH_SIZE,
+                 flush_interval=AUDIT_FLUSH_INTERVAL, backpressure=AUDIT_BACKPRESSURE,
+                 put_timeout=AUDIT_PUT_TIMEOUT, name="audit"):
+        if backpressure not in BACKPRESSURE_POLICIES:
+            raise ValueError(f"unknown backpressure policy: {backpressure}")
+        self.sink = sink
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.backpressure = backpressure
+        self.put_timeout = put_timeout
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._closed = False
+        self._stop = threading.Event()
+        self.enqueue_latency = monitoring.latency(
+            f"{name}_enqueue_seconds", "Time spent by the request path handing off an audit event")
+        self.flush_latency = monitoring.latency(
+            f"{name}_flush_seconds", "Time spent writing one audit batch to its sink")
+        self.dropped = monitoring.counter(f"{name}_dropped_total", "Audit events dropped on a full queue")
+        self.written = monitoring.counter(f"{name}_written_total", "Audit events written to the sink")
+        self._thread = threading.Thread(target=self._run, name=f"{name}-writer", daemon=True)
+        self._thread.start()
+
+    def enqueue(self, user, action, details=""):
+        start = time.perf_counter()
+        if self._closed:
+            raise RuntimeError("audit pipeline is closed")
+        event = {
+            "user": user,
+            "action": action,
+            "details": details,
+            "timestamp": datetime.datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        accepted = True
+        try:
+            if self.backpressure == "block":
+                self._queue.put(event, timeout=self.put_timeout)
+            else:
+                self._queue.put_nowait(event)
+        except queue.Full:
+            accepted = False
+            self.dropped.inc()
+            if self.backpressure == "raise":
+                raise
+            logger.warning("Audit queue full, dropped %s event for user %s", action, user)
+        finally:
+            self.enqueue_latency.observe(time.perf_counter() - start)
+        return accepted
+
+    def _run(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while not self._stop.is_set():
+            timeout = max(0.0, deadline - time.monotonic())
+            try:
+                event = self._queue.get(timeout=timeout)
+                if event is not None:
+                    batch.append(event)
+            except queue.Empty:
+                pass
+            if batch and (len(batch) >= self.batch_size or time.monotonic() >= deadline):
+                self._flush(batch)
+                batch = []
+            if time.monotonic() >= deadline:
+                deadline = time.monotonic() + self.flush_interval
+        batch.extend(self._drain())
+        if batch:
+            self._flush(batch)
+
+    def _drain(self):
+        events = []
+        while True:
+            try:
+                event = self._queue.get_nowait()
+            except queue.Empty:
+                return events
+            if event is not None:
+                events.append(event)
+
+    def _flush(self, batch):
+        for i in range(0, len(batch), self.batch_size):
+            chunk = batch[i:i + self.batch_size]
+            try:
+                with self.flush_latency.time():
+                    self.sink.write_batch(chunk)
+                self.written.inc(len(chunk))
+            except Exception as e:
+                logger.error("Failed to write %d audit events: %s", len(chunk), e)
+
+    def qsize(self):
+        return self._queue.qsize()
+
+    def close(self, timeout=30):
+        """Stop accepting events, flush everything still queued and close the sink."""
+        if self._closed:
+            return
+        self._closed = True
+        self._stop.set()
+        # None يوقظ الخيط إن كان ينتظر طابوراً فارغاً؛ الطابور الممتلئ لا يحتاجه ولا يجب أن يحجب الإغلاق
+        try:
+            self._queue.put_nowait(None)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+        self.sink.close()
+
+
+# ------ نسخ مشتركة على مستوى العملية ------
+_pipelines = {}
+_lock = threading.Lock()
+
+
+def get_pipeline(kind="sqlite"):
+    with _lock:
+        if kind not in _pipelines:
+            if kind == "sqlite":
+                sink = SQLiteAuditSink()
+            elif kind == "file":
+                sink = FileAuditSink(os.getenv("AUDIT_LOG_PATH", "audit.log"))
+            else:
+                raise ValueError(f"unknown audit sink: {kind}")
+            _pipelines[kind] = AuditPipeline(sink, name=f"audit_{kind}")
+        return _pipelines[kind]
+
+
+def shutdown():
+    with _lock:
+        pipelines = list(_pipelines.values())
+        _pipelines.clear()
+    for pipeline in pipelines:
+        pipeline.close()
@@ -0,0 +1,97 @@
+# audit_store.py - قراءة سجل التدقيق بترقيم المفاتيح (keyset) والبث
+import base64
+import json
+
+AUDIT_PAGE_SIZE = 100
+AUDIT_MAX_PAGE_SIZE = 1000
+STREAM_FETCH_SIZE = 500
+
+AUDIT_COLUMNS = ("id", "user_id", "action", "details", "timestamp")
+
+INDEXES = (
+    "CREATE INDEX IF NOT EXISTS idx_audit_ts_id ON audit_log (timestamp, id)",
+    "CREATE INDEX IF NOT EXISTS idx_audit_user_ts_id ON audit_log (user_id, timestamp, id)",
+    "CREATE INDEX IF NOT EXISTS idx_audit_action_ts_id ON audit_log (action, timestamp, id)",
+)
+
+
+def ensure_schema(conn):
+    """Add the ``details`` column and the keyset indexes to an existing audit_log."""
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(audit_log)")}
+    if "details" not in columns:
+        conn.execute("ALTER TABLE audit_log ADD COLUMN details TEXT")
+    for statement in INDEXES:
+        conn.execute(statement)
+
+
+# ------ مؤشر الصفحة ------
+def encode_cursor(timestamp, row_id):
+    raw = json.dumps([timestamp, row_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        timestamp, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return str(timestamp), int(row_id)
+    except (ValueError, TypeError):
+        raise ValueError("invalid cursor")
+
+
+# ------ الاستعلام ------
+def _build_query(user_id=None, action=None, after=None, limit=None):
+    clauses, params = [], []
+    if user_id is not None:
+        clauses.append("user_id = ?")
+        params.append(user_id)
+    if action is not None:
+        clauses.append("action = ?")
+        params.append(action)
+    if after is not None:
+        # الأحدث أولاً: الصفحة التالية هي كل ما يسبق آخر (timestamp, id) تم إرساله
+        clauses.append("(timestamp, id) < (?, ?)")
+        params.extend(after)
+    sql = f"SELECT {', '.join(AUDIT_COLUMNS)} FROM audit_log"
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    sql += " ORDER BY timestamp DESC, id DESC"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit)
+    return sql, params
+
+
+def _as_dict(row):
+    return dict(zip(AUDIT_COLUMNS, row))
+
+
+def fetch_page(conn, user_id=None, action=None, cursor=None, limit=AUDIT_PAGE_SIZE):
+    """Return one page of audit rows and the cursor for the next page (or None)."""
+    limit = max(1, min(int(limit), AUDIT_MAX_PAGE_SIZE))
+    after = decode_cursor(cursor) if cursor else None
+    sql, params = _build_query(user_id, action, after, limit + 1)
+    rows = conn.execute(sql, params).fetchall()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = None
+    if has_more:
+        last = rows[-1]
+        next_cursor = encode_cursor(last[4], last[0])
+    return [_as_dict(row) for row in rows], next_cursor
+
+
+def iter_rows(conn, user_id=None, action=None, cursor=None):
+    """Yield every matching row from a server-side cursor, ``STREAM_FETCH_SIZE`` at a time."""
+    after = decode_cursor(cursor) if cursor else None
+    sql, params = _build_query(user_id, action, after)
+    cur = conn.execute(sql, params)
+    try:
+        while True:
+            rows = cur.fetchmany(STREAM_FETCH_SIZE)
+            if not rows:
+                break
+            for row in rows:
+                yield _as_dict(row)
+    finally:
+        cur.close()
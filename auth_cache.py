@@ -0,0 +1,232 @@
+# auth_cache.py - التحقق من JWT مرة واحدة لكل رمز مع مادة مفتاح محسوبة مسبقاً
+import base64
+import calendar
+import hashlib
+import hmac
+import json
+import threading
+import time
+from collections import OrderedDict
+
+import monitoring
+
+try:
+    from jwt import (ExpiredSignatureError, ImmatureSignatureError, InvalidAudienceError, InvalidIssuedAtError,
+                     InvalidTokenError, MissingRequiredClaimError)
+except ImportError:  # نفس أسماء أخطاء PyJWT حتى تبقى معالجات token_required كما هي
+    class InvalidTokenError(Exception):
+        pass
+
+    class ExpiredSignatureError(InvalidTokenError):
+        pass
+
+    class InvalidAudienceError(InvalidTokenError):
+        pass
+
+    class InvalidIssuedAtError(InvalidTokenError):
+        pass
+
+    class ImmatureSignatureError(InvalidTokenError):
+        pass
+
+    class MissingRequiredClaimError(InvalidTokenError):
+        def __init__(self, claim):
+            self.claim = claim
+
+        def __str__(self):
+            return f'Token is missing the "{self.claim}" claim'
+
+AUTH_CACHE_ENTRIES = 10000
+_LOCK_STRIPES = 64
+
+
+def _b64decode(segment):
+    return base64.urlsafe_b64decode(segment + "=" * (-len(segment) % 4))
+
+
+def _b64encode(raw):
+    return base64.urlsafe_b64encode(raw).rstrip(b"=")
+
+
+def _key_bytes(key):
+    return key.encode() if isinstance(key, str) else bytes(key)
+
+
+def encode_hs512(claims, key, headers=None):
+    """Sign ``claims`` as an HS512 JWT (datetime ``exp``/``iat``/``nbf`` become epoch seconds)."""
+    payload = {k: calendar.timegm(v.utctimetuple()) if hasattr(v, "utctimetuple") else v
+               for k, v in claims.items()}
+    header = {"alg": "HS512", "typ": "JWT", **(headers or {})}
+    signing_input = (_b64encode(json.dumps(header, separators=(",", ":")).encode()) + b"." +
+                     _b64encode(json.dumps(payload, separators=(",", ":")).encode()))
+    signature = hmac.new(_key_bytes(key), signing_input, hashlib.sha512).digest()
+    return (signing_input + b"." + _b64encode(signature)).decode()
+
+
+class UserContext:
+    """Authenticated identity built once per token and shared by every request carrying it."""
+
+    __slots__ = ("user", "subject", "claims", "expires_at", "key_id")
+
+    def __init__(self, claims, key_id=None):
+        self.claims = claims
+        self.user = claims.get("user")
+        self.subject = claims.get("sub")
+        self.expires_at = claims.get("exp")
+        self.key_id = key_id
+
+
+# ------ التحقق ------
+class HS512Key:
+    """HMAC-SHA512 state with the key already absorbed; each check only copies it."""
+
+    def __init__(self, key):
+        self._mac = hmac.new(_key_bytes(key), digestmod=hashlib.sha512)
+
+    def verify(self, signing_input, signature):
+        mac = self._mac.copy()
+        mac.update(signing_input)
+        return hmac.compare_digest(mac.digest(), signature)
+
+
+def parse_token(token):
+    try:
+        header_b64, payload_b64, signature_b64 = token.split(".")
+        header = json.loads(_b64decode(header_b64))
+        signature = _b64decode(signature_b64)
+    except (ValueError, AttributeError):
+        raise InvalidTokenError("Malformed token")
+    if not isinstance(header, dict) or header.get("alg") != "HS512":
+        raise InvalidTokenError("Unsupported algorithm")
+    return header, f"{header_b64}.{payload_b64}".encode(), payload_b64, signature
+
+
+def check_claims(payload_b64, now, audience=None, require_exp=False, leeway=0):
+    """Validate registered claims the way ``jwt.decode`` does for HS512 tokens."""
+    try:
+        claims = json.loads(_b64decode(payload_b64))
+    except ValueError:
+        raise InvalidTokenError("Malformed payload")
+    if not isinstance(claims, dict):
+        raise InvalidTokenError("Malformed payload")
+    exp = claims.get("exp")
+    if exp is None:
+        if require_exp:
+            raise MissingRequiredClaimError("exp")
+    elif not _is_number(exp):
+        raise InvalidTokenError("Expiration Time claim (exp) must be an integer.")
+    elif exp <= now - leeway:
+        raise ExpiredSignatureError("Signature has expired")
+    iat = claims.get("iat")
+    if iat is not None:
+        if not _is_number(iat):
+            raise InvalidIssuedAtError("Issued At claim (iat) must be an integer.")
+        if iat > now + leeway:
+            raise ImmatureSignatureError("The token is not yet valid (iat)")
+    nbf = claims.get("nbf")
+    if nbf is not None:
+        if not _is_number(nbf):
+            raise InvalidTokenError("Not Before claim (nbf) must be an integer.")
+        if nbf > now + leeway:
+            raise ImmatureSignatureError("The token is not yet valid (nbf)")
+    aud = claims.get("aud")
+    if audience is None:
+        # مثل PyJWT: رمز موجّه لجمهور محدد لا يُقبل في خدمة لم تُعرّف جمهورها
+        if "aud" in claims:
+            raise InvalidAudienceError("Invalid audience")
+    elif aud is None:
+        raise MissingRequiredClaimError("aud")
+    else:
+        auds = aud if isinstance(aud, list) else [aud]
+        if not all(isinstance(a, str) for a in auds):
+            raise InvalidAudienceError("Invalid claim format in token")
+        if audience not in auds:
+            raise InvalidAudienceError("Audience doesn't match")
+    return claims
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+class TokenVerifier:
+    """HS512 verification with a cache keyed on the token digest.
+
+    A cached context is reused until its ``exp`` passes. ``rotate`` bumps a
+    key generation so older entries are re-verified lazily; striped locks make
+    concurrent requests carrying the same token re-verify it once rather than
+    all at the same moment.
+    """
+
+    def __init__(self, key, audience=None, require_exp=False, leeway=0, max_entries=AUTH_CACHE_ENTRIES):
+        self.audience = audience
+        self.require_exp = require_exp
+        self.leeway = leeway
+        self.max_entries = max_entries
+        self._key = HS512Key(key) if key is not None else None
+        self._generation = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stripes = [threading.Lock() for _ in range(_LOCK_STRIPES)]
+        self.hits = monitoring.counter("auth_cache_hits_total", "Requests authenticated from the token cache")
+        self.misses = monitoring.counter("auth_cache_misses_total", "Requests that required full JWT verification")
+
+    def rotate(self, key):
+        new_key = HS512Key(key)
+        with self._lock:
+            self._key = new_key
+            self._generation += 1
+
+    def _cached(self, digest, now):
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                return None
+            generation, context = entry
+            if generation != self._generation or (
+                    context.expires_at is not None and context.expires_at <= now - self.leeway):
+                del self._entries[digest]
+                return None
+            self._entries.move_to_end(digest)
+            return context
+
+    def _store(self, digest, context, generation):
+        if not self.max_entries:
+            return
+        with self._lock:
+            if generation != self._generation:
+                return  # تم تدوير المفتاح أثناء التحقق
+            self._entries[digest] = (generation, context)
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def verify(self, token):
+        now = time.time()
+        digest = hashlib.blake2b(token.encode(), digest_size=16).digest()
+        context = self._cached(digest, now)
+        if context is not None:
+            self.hits.inc()
+            return context
+        with self._stripes[digest[0] % _LOCK_STRIPES]:
+            context = self._cached(digest, now)
+            if context is not None:
+                self.hits.inc()
+                return context
+            self.misses.inc()
+            with self._lock:
+                key, generation = self._key, self._generation
+            context = self._verify(token, now, key)
+            self._store(digest, context, generation)
+            return context
+
+    def _verify(self, token, now, key):
+        header, signing_input, payload_b64, signature = parse_token(token)
+        if not key.verify(signing_input, signature):
+            raise InvalidTokenError("Signature verification failed")
+        claims = check_claims(payload_b64, now, self.audience, self.require_exp, self.leeway)
+        return UserContext(claims, header.get("kid"))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,436 @@
+# backup_engine.py - نسخ احتياطية متدفقة وتزايدية ومشفرة لقاعدة SQLite
+import hashlib
+import hmac
+import json
+import os
+import sqlite3
+import struct
+import tempfile
+import threading
+import time
+import uuid
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from cryptography.exceptions import InvalidTag
+
+import db_pool
+import monitoring
+from quantum_vault import QuantumVault
+
+BACKUP_CHUNK_SIZE = int(os.getenv("BACKUP_CHUNK_SIZE", str(256 * 1024)))
+BACKUP_COMPRESSION_LEVEL = int(os.getenv("BACKUP_COMPRESSION_LEVEL", "6"))
+BACKUP_PAGES_PER_STEP = 1024
+BACKUP_DIR = os.getenv("BACKUP_DIR", "backups")
+RESTORE_WORKERS = int(os.getenv("RESTORE_WORKERS", str(os.cpu_count() or 4)))
+# مدة بقاء قفل الكتابة على الملف المستبدل: أطول من busy_timeout حتى تفشل الكتابات المتأخرة ولا تضيع بصمت
+RESTORE_FENCE_SECONDS = float(os.getenv("RESTORE_FENCE_SECONDS", "120"))
+CHUNK_MAGIC = b"QVB1"
+# MAGIC | key id (8) | nonce (12)
+CHUNK_HEADER = struct.Struct(">4s8s12s")
+
+
+class BackupError(Exception):
+    pass
+
+
+# ------ أهداف التخزين ------
+class LocalTarget:
+    """Directory-backed object store; also the local stand-in for S3."""
+
+    def __init__(self, root=BACKUP_DIR):
+        self.root = os.path.abspath(root)
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, name):
+        return os.path.join(self.root, *name.split("/"))
+
+    def exists(self, name):
+        return os.path.exists(self._path(name))
+
+    def put(self, name, data):
+        path = self._path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    def get(self, name):
+        with open(self._path(name), "rb") as f:
+            return f.read()
+
+    def list(self, prefix):
+        base = self._path(prefix)
+        if not os.path.isdir(base):
+            return []
+        return sorted(f"{prefix}/{entry}" for entry in os.listdir(base) if not entry.endswith(".part"))
+
+    def delete(self, name):
+        try:
+            os.unlink(self._path(name))
+        except FileNotFoundError:
+            pass
+
+
+class S3Target:
+    def __init__(self, bucket=None, prefix=None):
+        import boto3
+
+        self.bucket = bucket or os.getenv("BACKUP_S3_BUCKET")
+        self.prefix = (prefix if prefix is not None else os.getenv("BACKUP_S3_PREFIX", "btec-backups")).strip("/")
+        self.client = boto3.client("s3")
+
+    def _key(self, name):
+        return f"{self.prefix}/{name}" if self.prefix else name
+
+    def exists(self, name):
+        from botocore.exceptions import ClientError
+
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._key(name))
+            return True
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+    def put(self, name, data):
+        self.client.put_object(Bucket=self.bucket, Key=self._key(name), Body=data)
+
+    def get(self, name):
+        return self.client.get_object(Bucket=self.bucket, Key=self._key(name))["Body"].read()
+
+    def list(self, prefix):
+        names = []
+        strip = len(self.prefix) + 1 if self.prefix else 0
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self._key(prefix) + "/", Delimiter="/"):
+            names.extend(item["Key"][strip:] for item in page.get("Contents", []))
+        return sorted(names)
+
+    def delete(self, name):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(name))
+
+
+def database_namespace(db_path):
+    """Stable per-database prefix in the target: ``btec_rebel.db`` -> ``btec_rebel``."""
+    return os.path.splitext(os.path.basename(db_path))[0] or "database"
+
+
+def create_target(kind=None):
+    kind = kind or os.getenv("BACKUP_TARGET", "local")
+    if kind == "local":
+        return LocalTarget()
+    if kind == "s3":
+        return S3Target()
+    raise ValueError(f"unknown backup target: {kind}")
+
+
+# ------ المحرك ------
+class BackupEngine:
+    """Consistent, deduplicated, encrypted backups with constant memory.
+
+    A snapshot is taken with SQLite's online backup API (safe while the app
+    keeps writing), then read in fixed-size chunks. Each chunk is named by a
+    keyed MAC of its plaintext; chunks already in the target are skipped, the
+    rest are compressed, sealed with AES-GCM and uploaded. A backup is an
+    encrypted manifest listing its chunk names in order, so unchanged pages
+    cost nothing after the first full backup. Manifests and chunks live under
+    a per-database ``namespace``, so engines for different databases can
+    share one target without chaining onto or restoring each other's backups.
+    """
+
+    def __init__(self, vault=None, target=None, db_path=db_pool.DB_PATH, chunk_size=BACKUP_CHUNK_SIZE,
+                 compression_level=BACKUP_COMPRESSION_LEVEL, work_dir=None, namespace=None):
+        self.vault = vault or QuantumVault.from_env()
+        self.target = target or create_target()
+        self.db_path = db_path
+        self.namespace = namespace or database_namespace(db_path)
+        self.chunk_size = chunk_size
+        self.compression_level = compression_level
+        self.work_dir = work_dir or os.path.dirname(os.path.abspath(db_path))
+        self._lock = threading.Lock()
+        self.duration = monitoring.latency("backup_duration_seconds", "Wall time of a full backup run")
+        self.last_size = monitoring.gauge("backup_last_snapshot_bytes", "Size of the last database snapshot")
+        self.last_stored = monitoring.gauge("backup_last_stored_bytes",
+                                            "Bytes uploaded by the last backup after dedup and compression")
+        self.chunks_reused = monitoring.counter("backup_chunks_reused_total", "Backup chunks already present in the target")
+        self.chunks_stored = monitoring.counter("backup_chunks_stored_total", "Backup chunks uploaded")
+        self.restore_duration = monitoring.latency("restore_duration_seconds", "Wall time of a verified restore")
+
+    # ------ أسماء وتغليف القطع ------
+    def chunk_name(self, key, chunk):
+        digest = hmac.new(key.mac_key, chunk, hashlib.sha256).hexdigest()
+        return f"{self.namespace}/chunks/{key.key_id.hex()}/{digest[:2]}/{digest}"
+
+    def seal_chunk(self, key, name, chunk):
+        nonce = os.urandom(12)
+        compressed = zlib.compress(chunk, self.compression_level)
+        return CHUNK_HEADER.pack(CHUNK_MAGIC, key.key_id, nonce) + key.aead.encrypt(nonce, compressed, name.encode())
+
+    def open_chunk(self, name, sealed):
+        """Authenticate, decrypt and decompress one stored chunk, then check it against its name."""
+        if len(sealed) < CHUNK_HEADER.size:
+            raise BackupError(f"chunk {name} is truncated")
+        magic, key_id, nonce = CHUNK_HEADER.unpack_from(sealed)
+        key = self.vault.key_for_id(key_id)
+        if magic != CHUNK_MAGIC or key is None:
+            raise BackupError(f"chunk {name} has an unknown format or key")
+        try:
+            compressed = key.aead.decrypt(nonce, memoryview(sealed)[CHUNK_HEADER.size:], name.encode())
+        except InvalidTag:
+            raise BackupError(f"chunk {name} failed authentication")
+        chunk = zlib.decompress(compressed)
+        if self.chunk_name(key, chunk) != name:
+            raise BackupError(f"chunk {name} does not match its content MAC")
+        return chunk
+
+    def _fetch_chunk(self, name):
+        return self.open_chunk(name, self.target.get(name))
+
+    def snapshot(self, dest_path):
+        """Copy the live database into ``dest_path`` page by page with the online backup API."""
+        source = sqlite3.connect(self.db_path, timeout=30)
+        dest = sqlite3.connect(dest_path)
+        try:
+            source.backup(dest, pages=BACKUP_PAGES_PER_STEP)
+        finally:
+            dest.close()
+            source.close()
+
+    # ------ البيانات الوصفية ------
+    def list_backups(self):
+        """Backup ids, oldest first (ids sort by creation time)."""
+        return [name.rsplit("/", 1)[1][:-len(".manifest")]
+                for name in self.target.list(f"{self.namespace}/manifests") if name.endswith(".manifest")]
+
+    def _manifest_name(self, backup_id):
+        return f"{self.namespace}/manifests/{backup_id}.manifest"
+
+    def load_manifest(self, backup_id):
+        token = self.target.get(self._manifest_name(backup_id)).decode()
+        text = self.vault.decrypt(token)
+        if text is None:
+            raise BackupError(f"manifest {backup_id} cannot be decrypted")
+        manifest = json.loads(text)
+        # لا تُستعاد نسخة قاعدة أخرى فوق هذه القاعدة مهما كان مصدر المعرّف
+        if manifest.get("database") != self.namespace:
+            raise BackupError(f"backup {backup_id} belongs to database {manifest.get('database')!r}, "
+                              f"not {self.namespace!r}")
+        return manifest
+
+    def _save_manifest(self, manifest):
+        self.target.put(self._manifest_name(manifest["id"]),
+                        self.vault.encrypt(json.dumps(manifest, separators=(",", ":"))).encode())
+
+    # ------ النسخ ------
+    def backup(self):
+        with self._lock, self.duration.time():
+            started = time.time()
+            backups = self.list_backups()
+            parent = self.load_manifest(backups[-1]) if backups else None
+            known = set(parent["chunks"]) if parent else set()
+            key = self.vault.current
+
+            fd, snapshot_path = tempfile.mkstemp(dir=self.work_dir, suffix=".snapshot")
+            os.close(fd)
+            try:
+                self.snapshot(snapshot_path)
+                chunks, digest, size, stored, reused = [], hashlib.sha256(), 0, 0, 0
+                with open(snapshot_path, "rb") as f:
+                    while True:
+                        chunk = f.read(self.chunk_size)
+                        if not chunk:
+                            break
+                        size += len(chunk)
+                        digest.update(chunk)
+                        name = self.chunk_name(key, chunk)
+                        chunks.append(name)
+                        # القطع الموجودة في النسخة السابقة لا تحتاج حتى إلى استعلام الهدف
+                        if name in known or self.target.exists(name):
+                            reused += 1
+                        else:
+                            sealed = self.seal_chunk(key, name, chunk)
+                            self.target.put(name, sealed)
+                            stored += len(sealed)
+                        known.add(name)
+            finally:
+                os.unlink(snapshot_path)
+
+            created = datetime.now(timezone.utc)
+            manifest = {
+                "id": f"{created.strftime('%Y%m%dT%H%M%S%fZ')}-{uuid.uuid4().hex[:8]}",
+                "database": self.namespace,
+                "db_path": os.path.abspath(self.db_path),
+                "created_at": created.isoformat(),
+                "parent": parent["id"] if parent else None,
+                "db_size": size,
+                "sha256": digest.hexdigest(),
+                "chunk_size": self.chunk_size,
+                "chunks": chunks,
+                "stored_bytes": stored,
+                "reused_chunks": reused,
+                "duration": round(time.time() - started, 3),
+            }
+            self._save_manifest(manifest)
+            self.last_size.set(size)
+            self.last_stored.set(stored)
+            self.chunks_reused.inc(reused)
+            self.chunks_stored.inc(len(chunks) - reused)
+            return manifest
+
+    # ------ الاستعادة ------
+    def restore(self, backup_id, dest_path=None, workers=RESTORE_WORKERS):
+        """Rebuild ``dest_path`` (the engine's database by default) from backup ``backup_id``.
+
+        Chunks are fetched and verified on a thread pool, at most
+        ``2 * workers`` ahead of the writer, and written in order to a temp
+        file beside the destination. Only after the whole-file digest and
+        ``PRAGMA quick_check`` pass is the file swapped in with a rename.
+
+        Around the swap this process's pools wait for borrowed connections to
+        come back and then reopen on the new file; pools in other worker
+        processes see the new file on their next borrow. A connection another
+        process has borrowed at that moment gets "database is locked" if it
+        writes within ``RESTORE_FENCE_SECONDS`` instead of writing to the
+        replaced file; requests that hold a connection longer than that should
+        not overlap a restore.
+        """
+        if not backup_id:
+            raise BackupError("restore needs an explicit backup_id")
+        backups = self.list_backups()
+        if backup_id not in backups:
+            raise BackupError(f"unknown backup: {backup_id}")
+        manifest = self.load_manifest(backup_id)
+        dest_path = os.path.abspath(dest_path or self.db_path)
+
+        with self._lock, self.restore_duration.time():
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(dest_path), suffix=".restore")
+            try:
+                with os.fdopen(fd, "wb") as out:
+                    size, digest = self._write_chunks(manifest["chunks"], out, max(1, workers))
+                    out.flush()
+                    os.fsync(out.fileno())
+                if size != manifest["db_size"] or digest != manifest["sha256"]:
+                    raise BackupError(f"backup {backup_id} does not match its manifest digest")
+                check = sqlite3.connect(tmp_path)
+                try:
+                    result = check.execute("PRAGMA quick_check").fetchone()[0]
+                finally:
+                    check.close()
+                if result != "ok":
+                    raise BackupError(f"restored database failed quick_check: {result}")
+                self._swap(tmp_path, dest_path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.unlink(tmp_path)
+                raise
+        return manifest
+
+    def _write_chunks(self, names, out, workers):
+        digest = hashlib.sha256()
+        size = 0
+        names = iter(names)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="restore") as pool:
+            window = deque(pool.submit(self._fetch_chunk, name) for _, name in zip(range(2 * workers), names))
+            try:
+                while window:
+                    chunk = window.popleft().result()
+                    name = next(names, None)
+                    if name is not None:
+                        window.append(pool.submit(self._fetch_chunk, name))
+                    out.write(chunk)
+                    digest.update(chunk)
+                    size += len(chunk)
+            except BaseException:
+                for future in window:
+                    future.cancel()
+                raise
+        return size, digest.hexdigest()
+
+    def _swap(self, tmp_path, dest_path):
+        def swap():
+            # ملفات WAL القديمة تخص قاعدة البيانات المستبدلة ولا يجوز تطبيقها على الجديدة
+            for suffix in ("-wal", "-shm"):
+                if os.path.exists(dest_path + suffix):
+                    os.unlink(dest_path + suffix)
+            os.replace(tmp_path, dest_path)
+            dir_fd = os.open(os.path.dirname(dest_path), os.O_RDONLY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+
+        # اتصال الحاجز يُفتح قبل أن يغلق reopen اتصالات هذه العملية: لو أُغلق آخرها أولاً
+        # لحذف SQLite ملف -shm المشترك وأخذ الحاجز قفله على ملف لا تراه العمليات الأخرى
+        fence = None
+        if os.path.exists(dest_path):
+            fence = sqlite3.connect(dest_path, timeout=db_pool.RESET_TIMEOUT, isolation_level=None,
+                                    check_same_thread=False)
+            try:
+                fence.execute("SELECT 1 FROM sqlite_master").fetchall()
+            except sqlite3.Error:
+                fence.close()
+                raise
+
+        def replace():
+            if fence is not None:
+                # قفل الكتابة على الملف القديم ينتظر معاملات العمليات الأخرى، ثم يبقى عليه بعد الاستبدال
+                fence.execute("BEGIN IMMEDIATE")
+            swap()
+
+        # كل المجمعات المفتوحة على هذا الملف (لا المجمع المشترك وحده) تُصفّر حول الاستبدال
+        try:
+            db_pool.reopen(replace, path=dest_path)
+        except (TimeoutError, sqlite3.OperationalError) as e:
+            if fence is not None:
+                fence.close()
+            raise BackupError(f"database is busy, restore not applied: {e}")
+        except BaseException:
+            if fence is not None:
+                fence.close()
+            raise
+        if fence is not None:
+            # إغلاق اتصال على ملف منقول لا يلمس ملفات WAL الجديدة بنفس الاسم
+            timer = threading.Timer(RESTORE_FENCE_SECONDS, fence.close)
+            timer.daemon = True
+            timer.start()
+
+    def prune(self, keep):
+        """Keep the newest ``keep`` backups and delete chunks none of them reference."""
+        with self._lock:
+            backups = self.list_backups()
+            if len(backups) <= keep:
+                return 0
+            live = set()
+            for backup_id in backups[-keep:] if keep else []:
+                live.update(self.load_manifest(backup_id)["chunks"])
+            removed = set()
+            for backup_id in backups[:len(backups) - keep]:
+                removed.update(self.load_manifest(backup_id)["chunks"])
+                self.target.delete(self._manifest_name(backup_id))
+            for name in removed - live:
+                self.target.delete(name)
+            return len(removed - live)
+
+
+# ------ نسخة مشتركة على مستوى العملية ------
+_engine = None
+_init_lock = threading.Lock()
+
+
+def get_engine():
+    global _engine
+    if _engine is None:
+        with _init_lock:
+            if _engine is None:
+                _engine = BackupEngine()
+    return _engine
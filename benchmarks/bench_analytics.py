@@ -0,0 +1,90 @@
+# benchmarks/bench_analytics.py - لوحة التحليلات: مسح الجدول ورسم المخطط في كل طلب مقابل العدادات والمخطط المخزّن
+import collections
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import task_analytics
+
+try:
+    import pandas as pd
+except ImportError:
+    pd = None
+
+try:
+    import matplotlib  # noqa: F401
+    renderer = task_analytics.render_bar_chart
+except ImportError:
+    # بدون matplotlib تُقاس كلفة الاستعلام فقط في الحالتين
+    def renderer(pairs, title, xlabel):
+        return repr(pairs)
+
+
+def build_db(path, rows):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE tasks (id INTEGER PRIMARY KEY, title TEXT, description TEXT, approved INTEGER, grade TEXT)")
+    rng = random.Random(3)
+    conn.executemany("INSERT INTO tasks (title, description, approved, grade) VALUES (?, ?, ?, ?)",
+                     ((f"task {i}", "x" * 400, rng.random() < 0.7, rng.choice(("Pass", "Merit", "Distinction")))
+                      for i in range(rows)))
+    conn.commit()
+    conn.close()
+
+
+def full_scan(path):
+    """Old analyze_data: load every row, count in Python/pandas, render every time."""
+    conn = sqlite3.connect(path)
+    try:
+        if pd is not None:
+            df = pd.read_sql_query("SELECT * FROM tasks", conn)
+            pairs = list(df["approved"].value_counts().items())
+        else:
+            rows = conn.execute("SELECT * FROM tasks").fetchall()
+            pairs = collections.Counter(row[3] for row in rows).most_common()
+    finally:
+        conn.close()
+    return renderer(pairs, "Task Approvals", "Approval Status")
+
+
+def per_request_ms(fn, n):
+    start = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - start) / n * 1000
+
+
+def main(rows=200000):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "tasks.db")
+        build_db(path, rows)
+        analytics = task_analytics.TaskAnalytics(path, renderer=renderer)
+        writer = sqlite3.connect(path)
+
+        old = per_request_ms(lambda: full_scan(path), 5)
+        cached = per_request_ms(analytics.chart, 2000)
+
+        def after_write():
+            writer.execute("UPDATE tasks SET approved = NOT approved WHERE id = ?", (random.randint(1, rows),))
+            writer.commit()
+            analytics.chart()
+
+        changed = per_request_ms(after_write, 20)
+        insert = per_request_ms(lambda: (writer.execute("INSERT INTO tasks (title, approved, grade) VALUES ('t', 1, 'Pass')"),
+                                         writer.commit()), 200)
+        print(f"tasks={rows} renderer={'matplotlib' if renderer is task_analytics.render_bar_chart else 'none'}"
+              f" loader={'pandas' if pd is not None else 'sqlite rows'}")
+        print(f"scan + render per request : {old:10.3f} ms")
+        print(f"counters, chart cached    : {cached:10.3f} ms  ({old / cached:,.0f}x)")
+        print(f"counters, after a write   : {changed:10.3f} ms")
+        print(f"task insert with triggers : {insert:10.3f} ms")
+        writer.close()
+        analytics.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+# benchmarks/bench_anchoring.py - معاملة لكل درجة مقابل جذر Merkle لكل نافذة على سلسلة محلية
+import hashlib
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import anchoring
+
+TX_LATENCY = 0.02      # إرسال معاملة وانتظار قبولها
+NONCE_LATENCY = 0.005  # استدعاء get_transaction_count
+
+
+class PerGradeChain:
+    """Old record_grade pattern: nonce round-trip + one transaction per grade, serialised on the nonce."""
+
+    def __init__(self, ledger):
+        self.ledger = ledger
+        self._nonce_lock = threading.Lock()
+
+    def record_grade(self, digest):
+        with self._nonce_lock:
+            time.sleep(NONCE_LATENCY)
+            return self.ledger.record(digest)
+
+
+def drive(fn, n_threads, per_thread):
+    threads = [threading.Thread(target=lambda t=t: [fn(f"{t}-{i}") for i in range(per_thread)])
+               for t in range(n_threads)]
+    start = time.perf_counter()
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    return n_threads * per_thread / (time.perf_counter() - start)
+
+
+def main(n_threads=16, per_thread=20):
+    digest = lambda key: hashlib.sha256(key.encode()).hexdigest()
+    with tempfile.TemporaryDirectory() as tmp:
+        chain = PerGradeChain(anchoring.LocalLedger(os.path.join(tmp, "per_grade.db"), latency=TX_LATENCY))
+        per_grade = drive(lambda key: chain.record_grade(digest(key)), n_threads, per_thread)
+
+        ledger = anchoring.LocalLedger(os.path.join(tmp, "merkle.db"), latency=TX_LATENCY)
+        service = anchoring.GradeAnchorService(ledger, window=0.05, max_leaves=256, name="bench_anchor")
+        receipts = []
+        lock = threading.Lock()
+
+        def submit(key):
+            receipt = service.submit(digest(key)).result(10)
+            with lock:
+                receipts.append(receipt)
+
+        merkle = drive(submit, n_threads, per_thread)
+        service.close()
+
+        start = time.perf_counter()
+        assert all(anchoring.verify_inclusion(r["leaf"], r["proof"], r["root"]) for r in receipts)
+        verify_us = (time.perf_counter() - start) / len(receipts) * 1e6
+        roots = len({r["root"] for r in receipts})
+
+    print(f"grades={n_threads * per_thread} tx latency={TX_LATENCY * 1000:.0f}ms")
+    print(f"one tx per grade   : {per_grade:8.1f} grades/sec  ({n_threads * per_thread} ledger writes)")
+    print(f"merkle per window  : {merkle:8.1f} grades/sec  ({roots} ledger writes)")
+    print(f"offline proof check: {verify_us:8.1f} us/grade")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+# benchmarks/bench_asgi.py - التقييمات المتزامنة: 4 عمال متزامنين بنمط gunicorn مقابل عملية ASGI واحدة، مع الذاكرة
+import argparse
+import asyncio
+import os
+import signal
+import socket
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+# الإعدادات تُقرأ عند الاستيراد، فتُضبط قبل استيراد الوحدات
+_TMP = tempfile.mkdtemp(prefix="bench_asgi_")
+os.environ.setdefault("APP_SECRET_KEY", "bench-secret")
+os.environ["BTEC_DB_PATH"] = os.path.join(_TMP, "btec.db")
+os.environ["EVAL_CACHE_PATH"] = os.path.join(_TMP, "eval_cache.db")
+os.environ["RATE_LIMIT_PATH"] = os.path.join(_TMP, "rate_limit")
+for name in ("RATE_LIMIT", "USER_RATE_LIMIT", "ENDPOINT_RATE_LIMIT"):
+    os.environ[name] = "1000000/minute"
+
+import json
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer
+
+import asgi_app
+import audit_pipeline
+import audit_store
+import auth_cache
+import db_pool
+import eval_cache
+import evaluation_service
+import llm_backend
+import rate_limiter
+
+SYNC_WORKERS = 4  # production.workers في config.yaml
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else float("nan")
+
+
+def init_db():
+    with db_pool.get_pool().connection() as conn:
+        conn.execute('''CREATE TABLE IF NOT EXISTS audit_log
+                 (id INTEGER PRIMARY KEY, user_id INTEGER, action TEXT,
+                  timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+        audit_store.ensure_schema(conn)
+        conn.commit()
+    db_pool.shutdown()
+
+
+# ------ الخط الأساسي: نفس منطق ai_evaluation في عامل متزامن يخدم طلباً واحداً في كل مرة ------
+def sync_app():
+    verifier = auth_cache.TokenVerifier(os.environ["APP_SECRET_KEY"])
+    limiter = rate_limiter.get_limiter()
+
+    def app(environ, start_response):
+        def reply(status, payload):
+            body = json.dumps(payload).encode()
+            start_response(status, [("Content-Type", "application/json"), ("Content-Length", str(len(body)))])
+            return [body]
+
+        try:
+            user = verifier.verify(environ.get("HTTP_AUTHORIZATION", "")).user
+        except auth_cache.InvalidTokenError:
+            return reply("403 Forbidden", {"error": "Invalid token"})
+        if user is None:
+            return reply("403 Forbidden", {"error": "Invalid token"})
+        if limiter.check(ip=environ.get("REMOTE_ADDR"), user=user, endpoint="/api/v1/evaluate"):
+            return reply("429 Too Many Requests", {"error": "Too many requests"})
+        data = json.loads(environ["wsgi.input"].read(int(environ.get("CONTENT_LENGTH") or 0)))
+        key = evaluation_service.evaluation_key(data["task"])
+        cache = eval_cache.get_cache()
+        result = cache.get(key)
+        if result is None:
+            result = evaluation_service.run_evaluation(data["task"])
+            cache.set(key, result)
+        audit_pipeline.get_pipeline("sqlite").enqueue(user, "TASK_EVALUATION", data["task"])
+        return reply("200 OK", result)
+    return app
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def run_sync_worker(sock):
+    server = WSGIServer(sock.getsockname(), _QuietHandler, bind_and_activate=False)
+    server.socket.close()
+    server.socket = sock
+    server.server_name, server.server_port = sock.getsockname()[:2]
+    server.setup_environ()
+    server.set_app(sync_app())
+    server.serve_forever()
+
+
+def run_async_worker(sock):
+    import uvicorn
+
+    # uvicorn يخدم على المقبس الموروث ويتوقف بنظافة عند SIGTERM
+    config = uvicorn.Config(asgi_app.create_app(), fd=sock.fileno(), lifespan="on", log_level="warning",
+                            backlog=1024)
+    uvicorn.Server(config).run()
+
+
+def fork(target, *args):
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            target(*args)
+        except BaseException:
+            code = 1
+        finally:
+            os._exit(code)
+    return pid
+
+
+def peak_rss_mb(pid):
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+# ------ مولّد الحمل ------
+async def post(port, body, token):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    try:
+        writer.write(f"POST /api/v1/evaluate HTTP/1.1\r\nHost: bench\r\nAuthorization: {token}\r\n"
+                     f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+                     f"Connection: close\r\n\r\n".encode() + body)
+        response = await reader.read()
+        return response.startswith(b"HTTP/1.") and response.split(b" ", 2)[1] == b"200"
+    finally:
+        writer.close()
+
+
+async def load(port, token, label, concurrency, duration):
+    latencies, errors = [], 0
+    deadline = time.perf_counter() + duration
+    counter = iter(range(10 ** 9))
+
+    async def client():
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            # مهمة فريدة لكل طلب: لا يخدم التخزين أي طلب، كلها تنتظر النموذج
+            body = json.dumps({"task": f"{label} essay #{next(counter)}"}).encode()
+            start = time.perf_counter()
+            try:
+                ok = await post(port, body, token)
+            except OSError:
+                ok = False
+            if ok:
+                latencies.append(time.perf_counter() - start)
+            else:
+                errors += 1
+
+    tasks = [asyncio.ensure_future(client()) for _ in range(concurrency)]
+    # بعد انتهاء المدة تُحسب فقط الطلبات المكتملة؛ ما بقي في الطابور يُلغى
+    await asyncio.wait(tasks, timeout=duration + 5)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return latencies, errors
+
+
+def bench(label, workers, target, token, args):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(("127.0.0.1", 0))
+    sock.listen(1024)
+    port = sock.getsockname()[1]
+    pids = [fork(target, sock) for _ in range(workers)]
+    sock.close()
+    try:
+        time.sleep(0.5)
+        latencies, errors = asyncio.run(load(port, token, label, args.concurrency, args.duration))
+        rss = sum(peak_rss_mb(pid) for pid in pids)
+    finally:
+        for pid in pids:
+            os.kill(pid, signal.SIGTERM)
+        for pid in pids:
+            os.waitpid(pid, 0)
+    throughput = len(latencies) / args.duration
+    print(f"  {label:28s} {throughput:7.1f} req/s  p50 {percentile(latencies, 0.5) * 1000:8.0f}ms  "
+          f"p99 {percentile(latencies, 0.99) * 1000:8.0f}ms  errors {errors:4d}  "
+          f"RSS {rss:6.1f}MB  {throughput / rss * 100:6.1f} req/s per 100MB")
+    return throughput, rss
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--latency", type=float, default=1.0, help="model latency per evaluation (s)")
+    args = parser.parse_args()
+
+    init_db()
+    # النموذج الوهمي في عملية مستقلة حتى لا ينافس مولّد الحمل على GIL
+    mock = llm_backend.MockLLMServer(latency=args.latency, tokens_per_second=1e6, reply_tokens=200)
+    # العمال المتزامنون يُنهَون وطلباتهم معلقة؛ الأنبوب المكسور عندها متوقع
+    mock.server.handle_error = lambda request, client_address: None
+    mock_pid = fork(mock.server.serve_forever)
+    mock.server.server_close()
+    llm_backend.set_backend(llm_backend.HTTPBackend(base_url=mock.base_url, max_retries=0))
+    token = auth_cache.encode_hs512({"user": "bench@btec", "exp": int(time.time()) + 3600},
+                                    os.environ["APP_SECRET_KEY"])
+    print(f"{args.concurrency} concurrent clients, {args.duration:.0f}s, model latency {args.latency:.1f}s, "
+          f"unique tasks (no cache hits)")
+    try:
+        time.sleep(0.3)
+        sync_rps, sync_rss = bench(f"sync x{SYNC_WORKERS} (gunicorn sync)", SYNC_WORKERS, run_sync_worker, token, args)
+        async_rps, async_rss = bench("asgi x1", 1, run_async_worker, token, args)
+    finally:
+        os.kill(mock_pid, signal.SIGTERM)
+        os.waitpid(mock_pid, 0)
+    print(f"asgi vs sync: {async_rps / sync_rps:.1f}x throughput with {async_rss / sync_rss:.2f}x the memory")
+
+
+if __name__ == "__main__":
+    main()
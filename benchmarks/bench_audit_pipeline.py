@@ -0,0 +1,93 @@
+# benchmarks/bench_audit_pipeline.py - زمن log_audit في مسار الطلب: متزامن مقابل الطابور
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import audit_pipeline
+import audit_store
+import db_pool
+import monitoring
+
+SCHEMA = '''CREATE TABLE IF NOT EXISTS audit_log
+            (id INTEGER PRIMARY KEY,
+             user_id INTEGER,
+             action TEXT,
+             timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP)'''
+
+
+def sync_sqlite(path):
+    def log_audit(user, action, details):
+        conn = sqlite3.connect(path)
+        conn.execute("INSERT INTO audit_log (user_id, action) VALUES (?, ?)", (user, f"{action}: {details}"))
+        conn.commit()
+        conn.close()
+    return log_audit
+
+
+def sync_file(path):
+    def log_audit(user, action, details):
+        with open(path, "a") as f:
+            f.write(f"{time.time()} | {user} | {action}\n")
+    return log_audit
+
+
+def measure(label, log_audit, n_threads, per_thread):
+    recorder = monitoring.LatencyRecorder(label, window=n_threads * per_thread)
+
+    def worker(t):
+        for i in range(per_thread):
+            with recorder.time():
+                log_audit(t, "TASK_EVALUATION", f"task {i}")
+
+    threads = [threading.Thread(target=worker, args=(t,)) for t in range(n_threads)]
+    start = time.perf_counter()
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    elapsed = time.perf_counter() - start
+    s = recorder.summary()
+    print(f"{label:<22} p50={s['p50'] * 1e6:9.1f}us  p99={s['p99'] * 1e6:9.1f}us  "
+          f"{s['count'] / elapsed:9.0f} events/sec")
+
+
+def main(n_threads=8, per_thread=500):
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_db = os.path.join(tmp, "legacy.db")
+        conn = sqlite3.connect(legacy_db)
+        conn.execute(SCHEMA)
+        conn.close()
+        measure("sync sqlite", sync_sqlite(legacy_db), n_threads, per_thread)
+        measure("sync file", sync_file(os.path.join(tmp, "legacy.log")), n_threads, per_thread)
+
+        pooled_db = os.path.join(tmp, "pooled.db")
+        pool = db_pool.ConnectionPool(pooled_db, size=2)
+        with pool.connection() as conn:
+            conn.execute(SCHEMA)
+            # نفس مخطط التطبيق: init_secure_db يضيف عمود details والفهارس عبر audit_store
+            audit_store.ensure_schema(conn)
+            conn.commit()
+        sqlite_pipeline = audit_pipeline.AuditPipeline(
+            audit_pipeline.SQLiteAuditSink(pool), name="bench_sqlite")
+        measure("pipeline sqlite", sqlite_pipeline.enqueue, n_threads, per_thread)
+        sqlite_pipeline.close()
+        with pool.connection() as conn:
+            rows = conn.execute("SELECT COUNT(*) FROM audit_log").fetchone()[0]
+            page, _ = audit_store.fetch_page(conn, action="TASK_EVALUATION", limit=1)
+        pool.close()
+        assert rows == n_threads * per_thread, rows
+        assert page and page[0]["details"].startswith("task "), page
+
+        file_pipeline = audit_pipeline.AuditPipeline(
+            audit_pipeline.FileAuditSink(os.path.join(tmp, "pipeline.log")), name="bench_file")
+        measure("pipeline file", file_pipeline.enqueue, n_threads, per_thread)
+        file_pipeline.close()
+
+
+if __name__ == "__main__":
+    main()
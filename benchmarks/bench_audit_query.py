@@ -0,0 +1,73 @@
+# benchmarks/bench_audit_query.py - الذاكرة والزمن: SELECT * + fetchall مقابل الصفحات والبث
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import audit_store
+
+
+def populate(conn, n_rows):
+    conn.execute('''CREATE TABLE audit_log
+                    (id INTEGER PRIMARY KEY,
+                     user_id INTEGER,
+                     action TEXT,
+                     timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+    audit_store.ensure_schema(conn)
+    conn.executemany(
+        "INSERT INTO audit_log (user_id, action, details, timestamp) VALUES (?, ?, ?, ?)",
+        ((i % 500, "TASK_EVALUATION", "x" * 200,
+          f"2024-{1 + i % 12:02d}-{1 + i % 28:02d} {i % 24:02d}:{i % 60:02d}:00")
+         for i in range(n_rows)))
+    conn.commit()
+
+
+def measure(label, fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    count = fn()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<28} rows={count:<8} {elapsed * 1000:9.1f} ms  peak={peak / 1e6:8.2f} MB")
+
+
+def main(n_rows=200_000):
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = sqlite3.connect(os.path.join(tmp, "audit.db"))
+        populate(conn, n_rows)
+
+        def legacy():
+            logs = conn.execute("SELECT * FROM audit_log").fetchall()
+            json.dumps({"logs": logs})
+            return len(logs)
+
+        def first_page():
+            rows, _ = audit_store.fetch_page(conn, limit=100)
+            return len(rows)
+
+        def user_page():
+            rows, _ = audit_store.fetch_page(conn, user_id=42, limit=100)
+            return len(rows)
+
+        def stream():
+            count = 0
+            for row in audit_store.iter_rows(conn):
+                json.dumps(row)
+                count += 1
+            return count
+
+        measure("fetchall + jsonify", legacy)
+        measure("keyset first page", first_page)
+        measure("keyset page, user filter", user_page)
+        measure("ndjson stream, full table", stream)
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
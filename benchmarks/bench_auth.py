@@ -0,0 +1,70 @@
+# benchmarks/bench_auth.py - كلفة المصادقة لكل طلب: فك JWT كامل مقابل ذاكرة التحقق
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import auth_cache
+
+try:
+    import jwt
+except ImportError:
+    jwt = None
+
+SECRET = "bench-secret-" * 4
+
+
+def per_request_us(fn, tokens, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for token in tokens:
+            fn(token)
+    return (time.perf_counter() - start) / (rounds * len(tokens)) * 1e6
+
+
+def rotation_stampede(n_threads=32):
+    """After a rotation every thread presents the same token at once; count full verifications."""
+    verifier = auth_cache.TokenVerifier(SECRET)
+    token = auth_cache.encode_hs512({"user": "u", "exp": time.time() + 3600}, SECRET)
+    verifier.verify(token)
+    verifier.rotate(SECRET)
+    before = verifier.misses.get()
+    barrier = threading.Barrier(n_threads)
+
+    def hit():
+        barrier.wait()
+        verifier.verify(token)
+
+    threads = [threading.Thread(target=hit) for _ in range(n_threads)]
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    return int(verifier.misses.get() - before)
+
+
+def main(n_users=200, rounds=50):
+    exp = time.time() + 3600
+    tokens = [auth_cache.encode_hs512({"user": f"user{i}", "exp": exp}, SECRET) for i in range(n_users)]
+
+    rows = []
+    if jwt is not None:
+        rows.append(("jwt.decode", lambda t: jwt.decode(t, SECRET, algorithms=["HS512"])["user"]))
+    uncached = auth_cache.TokenVerifier(SECRET, max_entries=0)
+    cached = auth_cache.TokenVerifier(SECRET)
+    rows.append(("verifier, no cache", lambda t: uncached.verify(t).user))
+    rows.append(("verifier, cached", lambda t: cached.verify(t).user))
+
+    print(f"users={n_users} requests={n_users * rounds}")
+    baseline = None
+    for name, fn in rows:
+        us = per_request_us(fn, tokens, rounds)
+        baseline = baseline or us
+        print(f"{name:<20}: {us:8.2f} us/request  ({baseline / us:5.1f}x)")
+    print(f"full verifications after rotation with 32 concurrent requests: {rotation_stampede()}")
+
+
+if __name__ == "__main__":
+    main()
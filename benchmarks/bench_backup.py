@@ -0,0 +1,75 @@
+# benchmarks/bench_backup.py - النسخ الكامل بالذاكرة مقابل النسخ المتدفق التزايدي: الزمن والحجم المرفوع وذروة الذاكرة
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from cryptography.fernet import Fernet
+
+import backup_engine
+from quantum_vault import QuantumVault
+
+
+def build_db(path, rows):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE tasks (id INTEGER PRIMARY KEY, student TEXT, content TEXT, grade TEXT)")
+    rng = random.Random(7)
+    conn.executemany("INSERT INTO tasks (student, content, grade) VALUES (?, ?, ?)",
+                     ((f"student{i % 500}", " ".join(rng.choice(("network", "design", "evidence", "analysis"))
+                                                     for _ in range(60)), "Merit") for i in range(rows)))
+    conn.commit()
+    conn.close()
+
+
+def touch_rows(path, n):
+    conn = sqlite3.connect(path)
+    conn.execute("UPDATE tasks SET grade = 'Distinction' WHERE id IN (SELECT id FROM tasks ORDER BY random() LIMIT ?)",
+                 (n,))
+    conn.commit()
+    conn.close()
+
+
+def measure(fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak, result
+
+
+def whole_file_backup(db_path, out_path):
+    """Old encrypted_backup: read the whole database into memory and encrypt it in one piece."""
+    with open(db_path, "rb") as f:
+        sealed = Fernet(Fernet.generate_key()).encrypt(f.read())
+    with open(out_path, "wb") as f:
+        f.write(sealed)
+    return len(sealed)
+
+
+def main(rows=200000, touched=200):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        build_db(db_path, rows)
+        print(f"database: {os.path.getsize(db_path) / 2 ** 20:.1f}MB, {touched} rows updated between runs")
+
+        elapsed, peak, size = measure(lambda: whole_file_backup(db_path, os.path.join(tmp, "whole.enc")))
+        print(f"{'whole-file':<16}: {elapsed * 1000:8.1f}ms  uploaded {size / 2 ** 20:7.2f}MB  peak {peak / 2 ** 20:6.1f}MB")
+
+        engine = backup_engine.BackupEngine(QuantumVault(), backup_engine.LocalTarget(os.path.join(tmp, "store")),
+                                            db_path=db_path)
+        for label in ("first (full)", "incremental", "incremental"):
+            elapsed, peak, manifest = measure(engine.backup)
+            print(f"{label:<16}: {elapsed * 1000:8.1f}ms  uploaded {manifest['stored_bytes'] / 2 ** 20:7.2f}MB"
+                  f"  peak {peak / 2 ** 20:6.1f}MB  reused {manifest['reused_chunks']}/{len(manifest['chunks'])} chunks")
+            touch_rows(db_path, touched)
+
+
+if __name__ == "__main__":
+    main()
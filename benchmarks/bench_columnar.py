@@ -0,0 +1,99 @@
+# benchmarks/bench_columnar.py - استعلامات اللوحة: SQLite صفاً صفاً مقابل Parquet مقسّم حسب التاريخ
+import collections
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+
+import audit_store
+import columnar_export
+
+ACTIONS = ("LOGIN", "TASK_EVALUATION", "GRADE_MODIFY", "FEEDBACK_EDIT", "EXPORT")
+
+
+def build_db(path, tasks, audits, days=180):
+    conn = sqlite3.connect(path)
+    conn.execute("""CREATE TABLE tasks (id INTEGER PRIMARY KEY, title TEXT, description TEXT, approved INTEGER,
+                    grade TEXT, user_id INTEGER, created_at TIMESTAMP)""")
+    conn.execute("CREATE TABLE audit_log (id INTEGER PRIMARY KEY, user_id INTEGER, action TEXT, timestamp TIMESTAMP)")
+    audit_store.ensure_schema(conn)
+    rng = random.Random(11)
+    start = datetime(2024, 1, 1)
+    stamp = lambda: (start + timedelta(seconds=rng.randrange(days * 86400))).strftime(columnar_export.TIMESTAMP_FORMAT)
+    conn.executemany("INSERT INTO tasks (title, description, approved, grade, user_id, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                     ((f"task {i}", "d" * 300, rng.random() < 0.7, rng.choice(("Pass", "Merit", "Distinction")),
+                       rng.randrange(2000), stamp()) for i in range(tasks)))
+    conn.executemany("INSERT INTO audit_log (user_id, action, details, timestamp) VALUES (?, ?, ?, ?)",
+                     ((rng.randrange(2000), rng.choice(ACTIONS), "x" * 80, stamp()) for _ in range(audits)))
+    conn.commit()
+    conn.close()
+
+
+def sqlite_queries(path):
+    """How the app reads today: pull rows, aggregate in Python."""
+    conn = sqlite3.connect(path)
+    try:
+        week = collections.Counter(
+            row[3][:10] for row in conn.execute("SELECT * FROM audit_log")
+            if "2024-03-01" <= row[3][:10] < "2024-03-08" and row[2] == "GRADE_MODIFY")
+        grades = collections.Counter(row[4] for row in conn.execute("SELECT * FROM tasks") if row[3])
+        top_users = collections.Counter(row[1] for row in conn.execute("SELECT * FROM audit_log")).most_common(10)
+    finally:
+        conn.close()
+    return dict(week), dict(grades), top_users
+
+
+def parquet_queries(root):
+    """Same reports on the export: only the needed columns and date partitions are read."""
+    audit = ds.dataset(os.path.join(root, "audit_log"), format="parquet", partitioning="hive")
+    tasks = ds.dataset(os.path.join(root, "tasks"), format="parquet", partitioning="hive")
+    in_week = (ds.field("date") >= "2024-03-01") & (ds.field("date") < "2024-03-08")
+    week_table = audit.to_table(columns=["date"], filter=in_week & (ds.field("action") == "GRADE_MODIFY"))
+    week = {row["values"]: row["counts"] for row in pc.value_counts(week_table["date"]).to_pylist()}
+    grade_table = tasks.to_table(columns=["grade"], filter=ds.field("approved") == "1")
+    grades = {row["values"]: row["counts"]
+              for row in pc.value_counts(grade_table["grade"].combine_chunks().dictionary_decode()).to_pylist()}
+    counts = pc.value_counts(audit.to_table(columns=["user_id"])["user_id"]).to_pylist()
+    top_users = sorted(((row["values"], row["counts"]) for row in counts), key=lambda r: (-r[1], r[0]))[:10]
+    return week, grades, top_users
+
+
+def timed(fn, repeats=3):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        result = fn()
+    return (time.perf_counter() - start) / repeats, result
+
+
+def main(tasks=200000, audits=1000000):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "btec.db")
+        build_db(db_path, tasks, audits)
+        # المهام وسجل التدقيق في قاعدة واحدة هنا، بدلاً من evaluation.db وbtec_rebel.db
+        specs = [columnar_export.ExportSpec("tasks", "tasks", "created_at", ("approved", "grade")),
+                 columnar_export.ExportSpec("audit_log", "audit_log", "timestamp", ("action",), mode="append")]
+        exporter = columnar_export.ColumnarExporter(db_path, root=os.path.join(tmp, "export"), specs=specs)
+        export_time, exported = timed(exporter.run, repeats=1)
+
+        sqlite_time, expected = timed(lambda: sqlite_queries(db_path))
+        parquet_time, actual = timed(lambda: parquet_queries(exporter.root))
+        assert actual[0] == expected[0] and actual[1] == expected[1]
+        assert sorted(c for _, c in actual[2]) == sorted(c for _, c in expected[2])
+
+        size = lambda p: sum(os.path.getsize(os.path.join(d, f)) for d, _, fs in os.walk(p) for f in fs)
+        print(f"rows: {exported}  export took {export_time:.1f}s")
+        print(f"storage: sqlite {os.path.getsize(db_path) / 2 ** 20:.1f}MB, parquet {size(exporter.root) / 2 ** 20:.1f}MB")
+        print(f"dashboard queries (3 reports): sqlite rows {sqlite_time * 1000:8.1f}ms, "
+              f"parquet {parquet_time * 1000:8.1f}ms ({sqlite_time / parquet_time:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
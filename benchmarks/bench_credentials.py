@@ -0,0 +1,101 @@
+# benchmarks/bench_credentials.py - تسجيلات الدخول في الثانية عند p99 ثابت: التجزئة في خيط الطلب مقابل مجمع العمليات المحدود
+import argparse
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import credential_service
+
+REQUEST_THREADS = 64  # خيوط الخادم (gunicorn --threads) التي تتلقى الطلبات
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else float("inf")
+
+
+def offered_load(login, rate, duration):
+    """Open-loop arrivals at ``rate``/s; returns (completed/s, p99 of completed, rejected)."""
+    latencies = []
+    rejected = [0]
+    lock = threading.Lock()
+
+    def handle(arrived):
+        try:
+            login()
+        except credential_service.CredentialServiceBusy:
+            with lock:
+                rejected[0] += 1
+            return
+        with lock:
+            latencies.append(time.perf_counter() - arrived)
+
+    with ThreadPoolExecutor(REQUEST_THREADS) as server:
+        start = time.perf_counter()
+        n = int(rate * duration)
+        for i in range(n):
+            due = start + i / rate
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            server.submit(handle, due)
+    elapsed = time.perf_counter() - start
+    return len(latencies) / elapsed, percentile(latencies, 0.99), rejected[0]
+
+
+def capacity(name, login, target_p99, duration, rates):
+    best = 0.0
+    for rate in rates:
+        throughput, p99, rejected = offered_load(login, rate, duration)
+        ok = p99 <= target_p99
+        print(f"  {name:8s} offered {rate:6.1f}/s  served {throughput:6.1f}/s  p99 {p99 * 1000:8.1f}ms  "
+              f"rejected {rejected:4d}  {'ok' if ok else 'over target'}")
+        if ok:
+            best = max(best, throughput)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scrypt-n", type=int, default=2 ** 14)
+    parser.add_argument("--p99-ms", type=float, default=250.0)
+    parser.add_argument("--duration", type=float, default=4.0)
+    args = parser.parse_args()
+
+    params = ("scrypt", args.scrypt_n, 8, 1)
+    stored = credential_service._hash("correct horse", params)
+    start = time.perf_counter()
+    credential_service._verify("correct horse", stored, params)
+    cost = time.perf_counter() - start
+    cores = os.cpu_count() or 1
+    ceiling = cores / cost
+    print(f"one scrypt verify: {cost * 1000:.1f}ms, {cores} core(s), ceiling ~{ceiling:.0f} logins/s, "
+          f"target p99 {args.p99_ms:.0f}ms")
+    rates = [ceiling * f for f in (0.5, 0.8, 0.95, 1.2, 2.0)]
+
+    def inline():
+        ok, _ = credential_service._verify("correct horse", stored, params)
+        assert ok
+
+    service = credential_service.CredentialService(workers=cores, max_pending=2 * cores, queue_timeout=0.05)
+    service.params = params
+
+    def pooled():
+        ok, _ = service.verify("correct horse", stored)
+        assert ok
+
+    try:
+        pooled()  # تشغيل العمليات قبل القياس
+        best_inline = capacity("inline", inline, args.p99_ms / 1000, args.duration, rates)
+        best_pool = capacity("pool", pooled, args.p99_ms / 1000, args.duration, rates)
+    finally:
+        service.close()
+    print(f"logins/s at p99 <= {args.p99_ms:.0f}ms: inline {best_inline:.1f}, bounded pool {best_pool:.1f}")
+
+
+if __name__ == "__main__":
+    main()
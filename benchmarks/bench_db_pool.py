@@ -0,0 +1,64 @@
+# benchmarks/bench_db_pool.py - مقارنة معدل الإدراج: اتصال لكل استدعاء مقابل المجمع والالتزام الجماعي
+import os
+import sys
+import sqlite3
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import db_pool
+
+SCHEMA = '''CREATE TABLE IF NOT EXISTS audit_log
+            (id INTEGER PRIMARY KEY,
+             user_id INTEGER,
+             action TEXT,
+             timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP)'''
+INSERT = "INSERT INTO audit_log (user_id, action) VALUES (?, ?)"
+
+
+def per_call_insert(path, i):
+    # النمط القديم في log_audit: فتح، إدراج، التزام، إغلاق
+    conn = sqlite3.connect(path)
+    c = conn.cursor()
+    c.execute(INSERT, (i, f"TASK_EVALUATION: {i}"))
+    conn.commit()
+    conn.close()
+
+
+def run_threads(n_threads, per_thread, fn):
+    threads = [threading.Thread(target=lambda t=t: [fn(t * per_thread + i) for i in range(per_thread)])
+               for t in range(n_threads)]
+    start = time.perf_counter()
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    return n_threads * per_thread / (time.perf_counter() - start)
+
+
+def main(n_threads=8, per_thread=250):
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy = os.path.join(tmp, "legacy.db")
+        conn = sqlite3.connect(legacy)
+        conn.execute(SCHEMA)
+        conn.close()
+        legacy_rate = run_threads(n_threads, per_thread, lambda i: per_call_insert(legacy, i))
+
+        pooled = os.path.join(tmp, "pooled.db")
+        with db_pool.ConnectionPool(pooled, size=1).connection() as conn:
+            conn.execute(SCHEMA)
+        writer = db_pool.GroupCommitWriter(pooled)
+        pooled_rate = run_threads(n_threads, per_thread,
+                                  lambda i: writer.execute(INSERT, (i, f"TASK_EVALUATION: {i}")))
+        writer.close()
+
+    print(f"threads={n_threads} inserts={n_threads * per_thread}")
+    print(f"per-call connection : {legacy_rate:10.0f} inserts/sec")
+    print(f"pool + group commit : {pooled_rate:10.0f} inserts/sec")
+    print(f"speedup             : {pooled_rate / legacy_rate:10.1f}x")
+
+
+if __name__ == "__main__":
+    main()
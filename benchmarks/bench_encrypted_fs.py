@@ -0,0 +1,86 @@
+# benchmarks/bench_encrypted_fs.py - حاوية القطع المشفرة مقابل تشفير الملف كاملاً: الزمن وذروة الذاكرة وقراءة المدى
+import io
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from cryptography.fernet import Fernet
+
+from encrypted_storage import EncryptedFileSystem
+from quantum_vault import QuantumVault
+
+
+class WholeFileSystem:
+    """Old EncryptedFileSystem: the full content is encrypted and decrypted in one piece."""
+
+    def __init__(self):
+        self.cipher = Fernet(Fernet.generate_key())
+
+    def write_file(self, path, content):
+        with open(path, "wb") as f:
+            f.write(self.cipher.encrypt(content))
+
+    def read_file(self, path):
+        with open(path, "rb") as f:
+            return self.cipher.decrypt(f.read())
+
+    def read_range(self, path, start, end):
+        return self.read_file(path)[start:end]
+
+
+def measure(fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak, result
+
+
+def main(size_mb=128, range_size=64 * 1024):
+    size = size_mb * 2 ** 20
+    chunked = EncryptedFileSystem(QuantumVault())
+    whole = WholeFileSystem()
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, "upload.bin")
+        with open(source, "wb") as f:
+            for _ in range(size_mb):
+                f.write(os.urandom(2 ** 20))
+        middle = size // 2
+
+        def whole_write():
+            with open(source, "rb") as f:
+                whole.write_file(os.path.join(tmp, "whole.enc"), f.read())
+
+        def chunked_write():
+            with open(source, "rb") as f:
+                chunked.write_stream(os.path.join(tmp, "chunked.enc"), f)
+
+        def chunked_read():
+            with chunked.open_reader(os.path.join(tmp, "chunked.enc")) as reader:
+                for _ in reader.iter_range():
+                    pass
+
+        cases = [
+            ("write", whole_write, chunked_write),
+            ("full read", lambda: whole.read_file(os.path.join(tmp, "whole.enc")), chunked_read),
+            (f"{range_size // 1024}KB range",
+             lambda: whole.read_range(os.path.join(tmp, "whole.enc"), middle, middle + range_size),
+             lambda: chunked.read_range(os.path.join(tmp, "chunked.enc"), middle, middle + range_size)),
+        ]
+        print(f"payload={size_mb}MB chunk={chunked.chunk_size // 1024}KB")
+        print(f"{'operation':<12} {'whole-file':>22} {'chunked':>22}")
+        for name, old, new in cases:
+            old_time, old_peak, _ = measure(old)
+            new_time, new_peak, _ = measure(new)
+            print(f"{name:<12} {old_time * 1000:>9.1f}ms {old_peak / 2 ** 20:>7.1f}MB peak"
+                  f" {new_time * 1000:>9.1f}ms {new_peak / 2 ** 20:>7.1f}MB peak")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+# benchmarks/bench_inference_batcher.py - الاستدلال نصاً بنص (حشو 512) مقابل الدفعات بحشو ديناميكي على المعالج
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import monitoring
+from inference_batcher import BatchingWorker
+
+MAX_LENGTH = 512
+
+
+class SyntheticModel:
+    """CPU cost model used when torch/transformers are not installed.
+
+    A forward pass costs a fixed overhead plus a cost per padded token, and
+    sleeps (releasing the GIL like a real torch kernel would).
+    """
+
+    def __init__(self, overhead=0.004, per_token=0.000004):
+        self.overhead = overhead
+        self.per_token = per_token
+        self._lock = threading.Lock()  # نموذج واحد على المعالج: تمريرة واحدة في كل مرة
+
+    def forward(self, batch_size, padded_length):
+        with self._lock:
+            time.sleep(self.overhead + self.per_token * batch_size * padded_length)
+
+
+def load_torch_model(name):
+    import torch
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(name)
+    model = AutoModelForSequenceClassification.from_pretrained(name).eval()
+    lock = threading.Lock()
+
+    def single(text):
+        inputs = tokenizer(text, padding="max_length", truncation=True, max_length=MAX_LENGTH,
+                           return_tensors="pt")
+        with lock, torch.inference_mode():
+            return model(**inputs).logits
+
+    def batched(encodings):
+        inputs = tokenizer.pad(encodings, padding="longest", return_tensors="pt")
+        with lock, torch.inference_mode():
+            logits = model(**inputs).logits
+        return [logits[i:i + 1] for i in range(len(encodings))]
+
+    def encode(text):
+        encoding = tokenizer(text, truncation=True, max_length=MAX_LENGTH)
+        return encoding, len(encoding["input_ids"])
+
+    return single, batched, encode
+
+
+def synthetic_functions():
+    model = SyntheticModel()
+
+    def single(text):
+        model.forward(1, MAX_LENGTH)
+
+    def batched(items):
+        model.forward(len(items), max(length for length in items))
+        return [None] * len(items)
+
+    def encode(text):
+        length = min(MAX_LENGTH, len(text.split()) + 2)
+        return length, length
+
+    return single, batched, encode
+
+
+def make_texts(n, seed=7):
+    rng = random.Random(seed)
+    # معظم التسليمات قصيرة، وقليل منها يقترب من الحد الأقصى
+    return [" ".join("word" for _ in range(int(min(MAX_LENGTH, rng.expovariate(1 / 90)) + 5)))
+            for _ in range(n)]
+
+
+def drive(label, call, texts, n_threads):
+    recorder = monitoring.LatencyRecorder(label, window=len(texts))
+    chunks = [texts[i::n_threads] for i in range(n_threads)]
+
+    def worker(chunk):
+        for text in chunk:
+            with recorder.time():
+                call(text)
+
+    threads = [threading.Thread(target=worker, args=(chunk,)) for chunk in chunks]
+    start = time.perf_counter()
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    elapsed = time.perf_counter() - start
+    s = recorder.summary()
+    print(f"{label:<34} {len(texts) / elapsed:8.1f} texts/sec  p50={s['p50'] * 1000:7.1f}ms  "
+          f"p99={s['p99'] * 1000:7.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", help="HF model name; synthetic cost model if omitted")
+    parser.add_argument("--texts", type=int, default=512)
+    parser.add_argument("--threads", type=int, default=32)
+    args = parser.parse_args()
+
+    if args.model:
+        single, batched, encode = load_torch_model(args.model)
+    else:
+        single, batched, encode = synthetic_functions()
+    texts = make_texts(args.texts)
+
+    drive("one text, padding=max_length", single, texts, args.threads)
+    for max_batch in (8, 32):
+        worker = BatchingWorker(batched, max_batch_size=max_batch, name=f"bench_batch_{max_batch}")
+
+        def call(text, worker=worker):
+            item, length = encode(text)
+            return worker.submit(item, length).result()
+
+        drive(f"batched (max {max_batch}), dynamic pad", call, texts, args.threads)
+        worker.close()
+
+
+if __name__ == "__main__":
+    main()
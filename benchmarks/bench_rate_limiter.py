@@ -0,0 +1,61 @@
+# benchmarks/bench_rate_limiter.py - كلفة فحص المعدل لكل طلب ودقة العدّ المشترك بين عدة عمليات
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import rate_limiter
+
+REQUESTS = 200000
+WORKERS = 4
+SHARED_LIMIT = 1000
+
+
+def per_request_cost(limiter):
+    ips = [f"10.0.{i // 256}.{i % 256}" for i in range(5000)]
+    users = [f"user{i}" for i in range(1000)]
+    for label, fn in (
+        ("limit_exceeded(ip)", lambda i: limiter.limit_exceeded(ips[i % len(ips)])),
+        ("check(ip, user, endpoint)", lambda i: limiter.check(ips[i % len(ips)], users[i % len(users)],
+                                                             "/api/v1/evaluate")),
+    ):
+        start = time.perf_counter()
+        for i in range(REQUESTS):
+            fn(i)
+        elapsed = time.perf_counter() - start
+        print(f"{label:28s} {elapsed / REQUESTS * 1e6:6.2f} µs/request")
+
+
+def hammer(path, n, results):
+    # كل عملية تفتح الجدول بنفسها كما يفعل عامل gunicorn
+    limiter = rate_limiter.RateLimiter(rate_limiter.SharedTable(path), ip_rate=f"{SHARED_LIMIT}/hour")
+    results.put(sum(limiter.check(ip="203.0.113.7") is None for _ in range(n)))
+
+
+def shared_accuracy(path):
+    results = multiprocessing.Queue()
+    procs = [multiprocessing.Process(target=hammer, args=(path, 1000, results)) for _ in range(WORKERS)]
+    for p in procs:
+        p.start()
+    allowed = sum(results.get() for _ in procs)
+    for p in procs:
+        p.join()
+    print(f"{WORKERS} processes x 1000 requests against {SHARED_LIMIT}/hour: {allowed} allowed "
+          f"({'exact' if allowed == SHARED_LIMIT else 'MISCOUNTED'})")
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "rate_limit")
+        limiter = rate_limiter.RateLimiter(rate_limiter.SharedTable(path),
+                                           lockout_table=rate_limiter.SharedTable(path + "_login", 1024))
+        per_request_cost(limiter)
+        limiter.table.clear()
+        shared_accuracy(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+# benchmarks/bench_restore.py - زمن الاستعادة المتحقق منها حسب عدد العمال
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import backup_engine
+from quantum_vault import QuantumVault
+
+
+class SlowTarget(backup_engine.LocalTarget):
+    """LocalTarget with a fixed per-object fetch latency, standing in for an object store."""
+
+    def __init__(self, root, latency):
+        super().__init__(root)
+        self.latency = latency
+
+    def get(self, name):
+        time.sleep(self.latency)
+        return super().get(name)
+
+
+def build_db(path, rows):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE evaluations (id INTEGER PRIMARY KEY, payload BLOB)")
+    conn.executemany("INSERT INTO evaluations (payload) VALUES (?)", ((os.urandom(512),) for _ in range(rows)))
+    conn.commit()
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="simulated per-chunk fetch latency")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "source.db")
+        build_db(db_path, args.rows)
+        vault = QuantumVault()
+        target = SlowTarget(os.path.join(tmp, "store"), args.latency_ms / 1000)
+        engine = backup_engine.BackupEngine(vault, target, db_path=db_path)
+        manifest = engine.backup()
+        size_mb = manifest["db_size"] / 2 ** 20
+        print(f"database {size_mb:.1f}MB in {len(manifest['chunks'])} chunks, cores={os.cpu_count()}, "
+              f"fetch latency={args.latency_ms}ms")
+
+        baseline = None
+        for workers in args.workers:
+            dest = os.path.join(tmp, f"restored-{workers}.db")
+            start = time.perf_counter()
+            engine.restore(manifest["id"], dest_path=dest, workers=workers)
+            elapsed = time.perf_counter() - start
+            baseline = baseline or elapsed
+            print(f"workers={workers:>3}: {elapsed * 1000:8.1f}ms  {size_mb / elapsed:7.1f} MB/s  "
+                  f"({baseline / elapsed:4.1f}x)")
+            os.unlink(dest)
+
+
+if __name__ == "__main__":
+    main()
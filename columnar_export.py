@@ -0,0 +1,322 @@
+# columnar_export.py - تصدير دوري إلى Parquet مقسّم حسب التاريخ مع ترميز قاموسي للأعمدة الفئوية
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+import db_pool
+import monitoring
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:  # التصدير اختياري؛ بقية التطبيق يعمل بدون pyarrow
+    pa = pc = ds = pq = None
+
+EXPORT_DIR = os.getenv("COLUMNAR_EXPORT_DIR", "analytics_export")
+EXPORT_BATCH_ROWS = 50000
+EXPORT_INTERVAL_SECONDS = int(os.getenv("COLUMNAR_EXPORT_INTERVAL", "900"))
+EVALUATION_DB_PATH = os.getenv("EVALUATION_DB_PATH", "evaluation.db")
+# مهلة قبل تصدير صف يتقدم مؤشره بوقت التحديث، حتى تلتزم الكتابات الجارية بأوقات أقدم
+EXPORT_SETTLE_SECONDS = 60
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+class ExportError(Exception):
+    pass
+
+
+class ExportSpec:
+    """How one SQLite table maps to a partitioned dataset.
+
+    ``append`` datasets export rows whose ``cursor`` column (``rowid`` for
+    insert-only tables) is past the last value seen; with a time-valued
+    cursor, rows newer than ``settle`` seconds wait for the next run.
+    ``snapshot`` datasets are rewritten in full each run and swapped in with
+    a rename so readers never see a partial export. ``db_path`` defaults to
+    the exporter's database; ``where`` and ``columns`` narrow what is read.
+    """
+
+    def __init__(self, name, table, time_column, categoricals=(), mode="snapshot", db_path=None,
+                 where=None, columns=None, cursor="rowid", settle=0):
+        self.name = name
+        self.table = table
+        self.time_column = time_column
+        self.categoricals = tuple(categoricals)
+        self.mode = mode
+        self.db_path = db_path
+        self.where = where
+        self.columns = tuple(columns) if columns else None
+        self.cursor = cursor
+        self.settle = settle
+
+
+EXPORT_SPECS = (
+    ExportSpec("tasks", "tasks", "created_at", ("approved", "grade"), db_path=EVALUATION_DB_PATH),
+    ExportSpec("students", "students", "created_at", ("grade",)),
+    ExportSpec("audit_log", "audit_log", "timestamp", ("action",), mode="append"),
+    # نتائج التقييم نفسها: مهام job_store المنتهية، بلا payload (نص الطالب)
+    ExportSpec("evaluations", "jobs", "created_at", ("status",), mode="append",
+               where="kind = 'evaluation' AND status IN ('succeeded', 'failed')",
+               columns=("id", "user_id", "status", "result", "error", "created_at", "updated_at"),
+               cursor="updated_at", settle=EXPORT_SETTLE_SECONDS),
+)
+
+
+def _arrow_type(declared):
+    declared = (declared or "").upper()
+    if "INT" in declared:
+        return pa.int64()
+    if any(t in declared for t in ("REAL", "FLOA", "DOUB", "NUMERIC")):
+        return pa.float64()
+    if "BLOB" in declared:
+        return pa.binary()
+    return pa.string()
+
+
+def _normalise(values, arrow_type):
+    # SQLite لا يفرض الأنواع؛ القيم التي لا تطابق نوع العمود تُحوَّل أو تصبح نصاً
+    if arrow_type == pa.string():
+        return [None if v is None else v if isinstance(v, str) else str(v) for v in values]
+    if arrow_type == pa.int64():
+        return [v if v is None or isinstance(v, int) else int(v) if str(v).lstrip("-").isdigit() else None
+                for v in values]
+    return values
+
+
+class ColumnarExporter:
+    """Export SQLite tables to ``<root>/<dataset>/date=YYYY-MM-DD/*.parquet``.
+
+    Rows are read in ``EXPORT_BATCH_ROWS`` batches and appended to one
+    Parquet writer per date partition, so memory is bounded by the batch.
+    Categorical columns are dictionary encoded both in Arrow and on disk;
+    ``time_column`` is parsed into a timestamp column.
+    """
+
+    def __init__(self, db_path=db_pool.DB_PATH, root=EXPORT_DIR, specs=EXPORT_SPECS, batch_rows=EXPORT_BATCH_ROWS):
+        if pa is None:
+            raise RuntimeError("pyarrow is required for the columnar export")
+        self.db_path = db_path
+        self.root = os.path.abspath(root)
+        self.specs = specs
+        self.batch_rows = batch_rows
+        self._lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+        self.rows_exported = monitoring.counter("columnar_export_rows_total", "Rows written to Parquet exports")
+        self.duration = monitoring.latency("columnar_export_duration_seconds", "Wall time of a columnar export run")
+
+    # ------ الحالة ------
+    def _state_path(self):
+        return os.path.join(self.root, "_state.json")
+
+    def _load_state(self):
+        try:
+            with open(self._state_path()) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _save_state(self, state):
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".part")
+        with os.fdopen(fd, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self._state_path())
+
+    # ------ التصدير ------
+    def _columns(self, conn, spec):
+        columns = [(row[1], row[2]) for row in conn.execute(f"PRAGMA table_info({spec.table})")]
+        if not columns:
+            raise ExportError(f"dataset {spec.name}: table {spec.table} does not exist in "
+                              f"{spec.db_path or self.db_path}")
+        if spec.columns:
+            declared = dict(columns)
+            missing = [name for name in spec.columns if name not in declared]
+            if missing:
+                raise ExportError(f"dataset {spec.name}: {spec.table} has no column(s) {', '.join(missing)}")
+            columns = [(name, declared[name]) for name in spec.columns]
+        if spec.time_column not in dict(columns):
+            raise ExportError(f"dataset {spec.name}: {spec.table} has no time column {spec.time_column}")
+        return columns
+
+    def run(self):
+        """Export every configured table; returns ``{dataset: rows}``.
+
+        Raises ``ExportError`` before writing anything when a configured table
+        or column is missing, so a wrong database path fails loudly.
+        """
+        with self._lock, self.duration.time():
+            state = self._load_state()
+            exported = {}
+            conns = {}
+            try:
+                plan = []
+                for spec in self.specs:
+                    path = spec.db_path or self.db_path
+                    if path not in conns:
+                        conns[path] = db_pool.open_connection(path)
+                    plan.append((spec, conns[path], self._columns(conns[path], spec)))
+                for spec, conn, columns in plan:
+                    exported[spec.name] = self._export(conn, spec, columns, state)
+            finally:
+                for conn in conns.values():
+                    conn.close()
+            return exported
+
+    def _schema(self, spec, columns):
+        fields = []
+        for name, declared in columns:
+            if name == spec.time_column:
+                fields.append(pa.field(name, pa.timestamp("s")))
+            elif name in spec.categoricals:
+                fields.append(pa.field(name, pa.dictionary(pa.int32(), pa.string())))
+            else:
+                fields.append(pa.field(name, _arrow_type(declared)))
+        return pa.schema(fields)
+
+    def _batch(self, spec, columns, schema, rows):
+        arrays = []
+        for i, (name, declared) in enumerate(columns):
+            values = [row[i] for row in rows]
+            field = schema.field(name)
+            if name == spec.time_column and _arrow_type(declared) != pa.string():
+                # ثوانٍ منذ epoch كما يكتبها job_store
+                arrays.append(pa.array([None if v is None else int(v) for v in values], pa.int64())
+                              .cast(pa.timestamp("s")))
+            elif name == spec.time_column:
+                raw = pa.array(_normalise(values, pa.string()), pa.string())
+                arrays.append(pc.strptime(pc.utf8_slice_codeunits(raw, 0, 19), format=TIMESTAMP_FORMAT,
+                                          unit="s", error_is_null=True))
+            elif name in spec.categoricals:
+                arrays.append(pa.array(_normalise(values, pa.string()), pa.string()).dictionary_encode())
+            else:
+                arrays.append(pa.array(_normalise(values, field.type), field.type))
+        return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+    def _export(self, conn, spec, columns, state):
+        names = [name for name, _ in columns]
+        schema = self._schema(spec, columns)
+        table_state = state.setdefault(spec.name, {})
+        previous_state = dict(table_state)
+        last_cursor = table_state.get("last_cursor", table_state.get("last_rowid", 0)) if spec.mode == "append" else 0
+        run_id = f"{int(time.time() * 1000)}"
+        where = f"{spec.cursor} > ?"
+        params = [last_cursor]
+        if spec.mode == "append" and spec.settle:
+            where += f" AND {spec.cursor} <= ?"
+            params.append(time.time() - spec.settle)
+        if spec.where:
+            where += f" AND ({spec.where})"
+
+        if spec.mode == "append":
+            target = os.path.join(self.root, spec.name)
+        else:
+            target = os.path.join(self.root, f".{spec.name}-{run_id}")
+            os.makedirs(target)
+        writers = {}
+        paths = []
+        written = 0
+        published = False
+        try:
+            # الترتيب حسب الوقت يجعل كل دفعة تقع في تاريخ أو اثنين، فتبقى مجموعات الصفوف في Parquet كبيرة
+            cursor = conn.execute(f"SELECT {spec.cursor}, {', '.join(names)} FROM {spec.table} "
+                                  f"WHERE {where} ORDER BY {spec.time_column}, rowid", params)
+            while True:
+                rows = cursor.fetchmany(self.batch_rows)
+                if not rows:
+                    break
+                last_cursor = max(last_cursor, max(row[0] for row in rows))
+                batch = self._batch(spec, columns, schema, [row[1:] for row in rows])
+                dates = pc.strftime(batch.column(names.index(spec.time_column)), format="%Y-%m-%d")
+                dates = pc.fill_null(dates, "unknown")
+                for date in pc.unique(dates).to_pylist():
+                    part = batch.filter(pc.equal(dates, date))
+                    writer = writers.get(date)
+                    if writer is None:
+                        directory = os.path.join(target, f"date={date}")
+                        os.makedirs(directory, exist_ok=True)
+                        path = os.path.join(directory, f"part-{run_id}.parquet")
+                        paths.append(path)
+                        writer = pq.ParquetWriter(path, schema, use_dictionary=list(spec.categoricals),
+                                                  compression="zstd")
+                        writers[date] = writer
+                    writer.write_batch(part)
+                written += len(rows)
+            for writer in writers.values():
+                writer.close()
+            writers.clear()
+            if spec.mode != "append":
+                self._publish(spec.name, target)
+                published = True
+            table_state.pop("last_rowid", None)
+            table_state["last_cursor"] = last_cursor
+            table_state["rows"] = written if spec.mode != "append" else table_state.get("rows", 0) + written
+            # حفظ العلامة بعد كل جدول حتى لا يُعاد تصدير ما كُتب إذا فشل جدول لاحق
+            state["exported_at"] = datetime.now(timezone.utc).isoformat()
+            self._save_state(state)
+        except BaseException:
+            for writer in writers.values():
+                writer.close()
+            table_state.clear()
+            table_state.update(previous_state)
+            if spec.mode != "append":
+                if not published:
+                    shutil.rmtree(target, ignore_errors=True)
+            else:
+                # ملفات هذا التشغيل بلا علامة متقدمة تعني صفوفاً مكررة في التشغيل التالي
+                for path in paths:
+                    try:
+                        os.unlink(path)
+                    except FileNotFoundError:
+                        pass
+            raise
+        self.rows_exported.inc(written)
+        return written
+
+    def _publish(self, name, target):
+        # <root>/<name> رابط رمزي يُستبدل ذرياً، فالقارئ يرى النسخة السابقة أو الجديدة كاملة
+        final = os.path.join(self.root, name)
+        previous = os.path.join(self.root, os.readlink(final)) if os.path.islink(final) else None
+        if os.path.isdir(final) and not os.path.islink(final):
+            shutil.rmtree(final)
+        link = f"{target}.link"
+        os.symlink(os.path.basename(target), link)
+        os.replace(link, final)
+        if previous is not None and previous != target:
+            shutil.rmtree(previous, ignore_errors=True)
+
+    # ------ القراءة ------
+    def dataset(self, name):
+        """``pyarrow.dataset`` over one export with the ``date`` partition key exposed as a column."""
+        return ds.dataset(os.path.join(self.root, name), format="parquet", partitioning="hive")
+
+    def start(self, interval=EXPORT_INTERVAL_SECONDS):
+        """Run the export every ``interval`` seconds on a daemon thread (for deployments without Celery beat)."""
+        stop = threading.Event()
+
+        def loop():
+            while not stop.wait(interval):
+                try:
+                    self.run()
+                except Exception:
+                    monitoring.counter("columnar_export_failures_total", "Columnar export runs that failed").inc()
+
+        threading.Thread(target=loop, name="columnar-export", daemon=True).start()
+        return stop
+
+
+_exporter = None
+_init_lock = threading.Lock()
+
+
+def get_exporter():
+    global _exporter
+    if _exporter is None:
+        with _init_lock:
+            if _exporter is None:
+                _exporter = ColumnarExporter()
+    return _exporter
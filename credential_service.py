@@ -0,0 +1,207 @@
+# credential_service.py - تجزئة كلمات المرور واشتقاق المفاتيح في مجمع عمليات محدود خارج خيوط الطلبات
+import base64
+import hashlib
+import hmac
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+
+import monitoring
+
+CREDENTIAL_WORKERS = int(os.getenv("CREDENTIAL_WORKERS", str(os.cpu_count() or 2)))
+# أقصى عدد من عمليات التجزئة قيد التنفيذ أو الانتظار؛ ما زاد يُرفض بعد CREDENTIAL_QUEUE_TIMEOUT
+CREDENTIAL_MAX_PENDING = int(os.getenv("CREDENTIAL_MAX_PENDING", str(4 * CREDENTIAL_WORKERS)))
+CREDENTIAL_QUEUE_TIMEOUT = float(os.getenv("CREDENTIAL_QUEUE_TIMEOUT", "2"))
+CREDENTIAL_HASH_TIMEOUT = float(os.getenv("CREDENTIAL_HASH_TIMEOUT", "5"))
+PASSWORD_SCHEME = os.getenv("PASSWORD_SCHEME", "scrypt")
+SCRYPT_N = int(os.getenv("SCRYPT_N", str(2 ** 15)))
+SCRYPT_R = int(os.getenv("SCRYPT_R", "8"))
+SCRYPT_P = int(os.getenv("SCRYPT_P", "1"))
+PBKDF2_ITERATIONS = int(os.getenv("PBKDF2_ITERATIONS", "600000"))
+SALT_SIZE = 16
+HASH_SIZE = 32
+# بادئات صيغ hash معروفة (bcrypt وargon2 وصيغ هذه الوحدة وwerkzeug method:...$salt$hash)
+HASH_PREFIXES = ("$2a$", "$2b$", "$2y$", "$argon2", "$scrypt$", "$pbkdf2-sha256$", "scrypt:", "pbkdf2:")
+
+
+class CredentialServiceBusy(TimeoutError):
+    """No hashing slot became free within the queue timeout; the caller should answer 503."""
+
+
+def _b64(raw):
+    return base64.b64encode(raw).decode().rstrip("=")
+
+
+def _unb64(text):
+    return base64.b64decode(text + "=" * (-len(text) % 4))
+
+
+def current_params(scheme=PASSWORD_SCHEME):
+    if scheme == "scrypt":
+        return ("scrypt", SCRYPT_N, SCRYPT_R, SCRYPT_P)
+    if scheme == "pbkdf2_sha256":
+        return ("pbkdf2_sha256", PBKDF2_ITERATIONS)
+    raise ValueError(f"unknown password scheme: {scheme}")
+
+
+# ------ يُنفَّذ داخل عمليات المجمع ------
+def _scrypt(password, salt, n, r, p, length=HASH_SIZE):
+    return hashlib.scrypt(password, salt=salt, n=n, r=r, p=p, maxmem=132 * n * r * p, dklen=length)
+
+
+def _hash(password, params):
+    salt = os.urandom(SALT_SIZE)
+    if params[0] == "scrypt":
+        _, n, r, p = params
+        return f"$scrypt$n={n},r={r},p={p}${_b64(salt)}${_b64(_scrypt(password.encode(), salt, n, r, p))}"
+    _, iterations = params
+    digest = hashlib.pbkdf2_hmac("sha256", password.encode(), salt, iterations, HASH_SIZE)
+    return f"$pbkdf2-sha256$i={iterations}${_b64(salt)}${_b64(digest)}"
+
+
+def _parse(stored):
+    """``(params, salt, digest)`` for hashes written by this module or by werkzeug, else ``None``."""
+    if stored.startswith("$scrypt$") or stored.startswith("$pbkdf2-sha256$"):
+        _, scheme, settings, salt, digest = stored.split("$")
+        values = dict(item.split("=") for item in settings.split(","))
+        if scheme == "scrypt":
+            params = ("scrypt", int(values["n"]), int(values["r"]), int(values["p"]))
+        else:
+            params = ("pbkdf2_sha256", int(values["i"]))
+        return params, _unb64(salt), _unb64(digest)
+    # صيغة werkzeug.generate_password_hash: method$salt$hexdigest
+    method, sep, rest = stored.partition("$")
+    salt, sep2, digest = rest.partition("$")
+    if not (sep and sep2):
+        return None
+    parts = method.split(":")
+    if parts[0] == "scrypt" and len(parts) == 4:
+        return ("werkzeug-scrypt", int(parts[1]), int(parts[2]), int(parts[3])), salt.encode(), bytes.fromhex(digest)
+    if parts[0] == "pbkdf2" and len(parts) == 3:
+        return ("werkzeug-pbkdf2", parts[1], int(parts[2])), salt.encode(), bytes.fromhex(digest)
+    return None
+
+
+def _verify(password, stored, params):
+    """Return ``(ok, new_hash)``; ``new_hash`` is set when ``stored`` should be replaced."""
+    if stored is None:
+        # مستخدم غير موجود: نفس كلفة التحقق حتى لا يكشف الزمن وجود الحساب
+        _hash(password, params)
+        return False, None
+    try:
+        parsed = _parse(stored)
+    except (ValueError, KeyError):
+        parsed = None
+    secret = password.encode()
+    if parsed is None:
+        if "$" in stored and stored.startswith(HASH_PREFIXES):
+            # hash بصيغة معروفة غير مدعومة أو تالف (bcrypt مثلاً): لا يُقارن أبداً كنص صريح
+            return False, None
+        # كلمة مرور قديمة مخزنة كنص صريح، وقد تحتوي $ مثل Pa$$word
+        ok = hmac.compare_digest(secret, stored.encode())
+        return ok, _hash(password, params) if ok else None
+    stored_params, salt, digest = parsed
+    kind = stored_params[0]
+    if kind in ("scrypt", "werkzeug-scrypt"):
+        _, n, r, p = stored_params
+        computed = _scrypt(secret, salt, n, r, p, len(digest))
+    elif kind == "pbkdf2_sha256":
+        computed = hashlib.pbkdf2_hmac("sha256", secret, salt, stored_params[1], len(digest))
+    else:
+        _, algorithm, iterations = stored_params
+        computed = hashlib.pbkdf2_hmac(algorithm, secret, salt, iterations, len(digest))
+    ok = hmac.compare_digest(computed, digest)
+    return ok, _hash(password, params) if ok and stored_params != params else None
+
+
+def _derive(secret, salt, length, iterations):
+    return hashlib.pbkdf2_hmac("sha256", secret, salt, iterations, length)
+
+
+class CredentialService:
+    """Password hashing and key derivation on a bounded process pool.
+
+    At most ``max_pending`` operations are admitted at once; a caller that
+    cannot get a slot within ``queue_timeout`` gets ``CredentialServiceBusy``
+    instead of queueing without bound behind a login burst. ``verify`` also
+    returns a fresh hash when the stored one uses older parameters (or is a
+    legacy plaintext/werkzeug value), so hashes upgrade on the next login.
+    """
+
+    def __init__(self, workers=CREDENTIAL_WORKERS, max_pending=CREDENTIAL_MAX_PENDING,
+                 queue_timeout=CREDENTIAL_QUEUE_TIMEOUT, hash_timeout=CREDENTIAL_HASH_TIMEOUT,
+                 scheme=PASSWORD_SCHEME):
+        self.params = current_params(scheme)
+        self.queue_timeout = queue_timeout
+        self.hash_timeout = hash_timeout
+        self._pool = ProcessPoolExecutor(max_workers=workers)
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self.rejected = monitoring.counter("credential_rejected_total", "Hashing requests refused because the pool was full")
+        self.upgrades = monitoring.counter("credential_hash_upgrades_total", "Stored password hashes upgraded on login")
+        self.queue_wait = monitoring.latency("credential_queue_wait_seconds", "Time waiting for a hashing slot")
+        self.hash_latency = monitoring.latency("credential_hash_seconds", "Time to run one hashing operation")
+
+    def _run(self, fn, *args):
+        with self.queue_wait.time():
+            acquired = self._slots.acquire(timeout=self.queue_timeout)
+        if not acquired:
+            self.rejected.inc()
+            raise CredentialServiceBusy("credential hashing pool is saturated")
+        try:
+            future = self._pool.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        # الخانة تُحرر عند انتهاء العمل فعلاً، لا عند انتهاء مهلة المستدعي
+        future.add_done_callback(self._release)
+        try:
+            with self.hash_latency.time():
+                return future.result(timeout=self.hash_timeout)
+        except FutureTimeout:
+            raise CredentialServiceBusy("credential hashing timed out")
+
+    def _release(self, future):
+        self._slots.release()
+
+    def hash_password(self, password):
+        return self._run(_hash, password, self.params)
+
+    def verify(self, password, stored):
+        """Check ``password`` against ``stored`` (``None`` for an unknown user).
+
+        Returns ``(ok, new_hash)``; persist ``new_hash`` when it is not ``None``.
+        """
+        ok, new_hash = self._run(_verify, password, stored, self.params)
+        if new_hash is not None:
+            self.upgrades.inc()
+        return ok, new_hash
+
+    def derive_key(self, secret, salt, length=32, iterations=100000):
+        """PBKDF2-SHA256 key derivation (e.g. TOTP seeds) off the request thread."""
+        secret = secret.encode() if isinstance(secret, str) else secret
+        return self._run(_derive, secret, salt, length, iterations)
+
+    def close(self):
+        self._pool.shutdown(wait=True)
+
+
+_service = None
+_init_lock = threading.Lock()
+
+
+def get_credential_service():
+    global _service
+    if _service is None:
+        with _init_lock:
+            if _service is None:
+                _service = CredentialService()
+    return _service
+
+
+def shutdown():
+    global _service
+    with _init_lock:
+        if _service is not None:
+            _service.close()
+            _service = None
@@ -0,0 +1,405 @@
+# db_pool.py - طبقة الوصول المشتركة إلى قاعدة البيانات
+import asyncio
+import os
+import queue
+import sqlite3
+import threading
+import time
+import logging
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = os.getenv("BTEC_DB_PATH", "btec_rebel.db")
+POOL_SIZE = int(os.getenv("BTEC_DB_POOL_SIZE", "8"))
+STATEMENT_CACHE_SIZE = 256
+GROUP_COMMIT_MAX_BATCH = 512
+# أقصى انتظار لإعادة الاتصالات المعارة قبل استبدال ملف قاعدة البيانات
+RESET_TIMEOUT = float(os.getenv("BTEC_DB_RESET_TIMEOUT", "30"))
+
+
+def open_connection(path=DB_PATH):
+    """Open a SQLite connection tuned for concurrent readers and one writer."""
+    conn = sqlite3.connect(
+        path,
+        timeout=30,
+        check_same_thread=False,
+        cached_statements=STATEMENT_CACHE_SIZE,
+    )
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=30000")
+    conn.execute("PRAGMA foreign_keys=ON")
+    return conn
+
+
+# ------ مجمع الاتصالات ------
+# كل مجمع في العملية، حتى يصل reopen إلى كل اتصال مفتوح على الملف المستبدل
+_pools = weakref.WeakSet()
+_pools_lock = threading.Lock()
+
+
+def file_identity(path):
+    """``(st_dev, st_ino)`` of ``path``, or None if it does not exist (or is ``:memory:``)."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_dev, st.st_ino
+
+
+class ConnectionPool:
+    """Bounded pool of connections to one SQLite file.
+
+    Each connection remembers which file it was opened on. A connection is
+    dropped instead of reused once ``path`` names a different file, so a
+    restore that renames a new database into place (in this process or any
+    other) is picked up on the next borrow without coordination.
+    """
+
+    def __init__(self, path=DB_PATH, size=POOL_SIZE):
+        self.path = path
+        self.size = size
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._created = 0
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._closed = False
+        self._paused = False
+        self._generation = 0
+        self._born = {}
+        with _pools_lock:
+            _pools.add(self)
+
+    def _current(self, conn):
+        generation, identity = self._born.get(id(conn), (None, None))
+        return generation == self._generation and (identity is None or identity == file_identity(self.path))
+
+    def _open(self):
+        # يُستدعى مع الإمساك بـ _lock؛ الهوية تُقرأ قبل الفتح فأي استبدال بينهما يُكتشف عند الاستعارة التالية
+        identity = file_identity(self.path)
+        self._created += 1
+        try:
+            conn = open_connection(self.path)
+        except Exception:
+            self._created -= 1
+            raise
+        self._born[id(conn)] = (self._generation, identity or file_identity(self.path))
+        return conn
+
+    def _acquire(self, timeout):
+        if not self._paused:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = None
+            if conn is not None:
+                if self._current(conn):
+                    return conn
+                with self._lock:
+                    self._discard(conn)
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                if not self._paused:
+                    try:
+                        conn = self._idle.get_nowait()
+                    except queue.Empty:
+                        conn = None
+                    if conn is not None:
+                        if self._current(conn):
+                            return conn
+                        self._discard(conn)
+                        continue
+                    if self._created < self.size:
+                        return self._open()
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise queue.Empty
+                self._cond.wait(remaining)
+
+    def _discard(self, conn):
+        # يُستدعى مع الإمساك بـ _lock
+        self._born.pop(id(conn), None)
+        self._created -= 1
+        conn.close()
+        self._cond.notify_all()
+
+    def _release(self, conn):
+        if self._closed:
+            conn.close()
+            return
+        if not self._current(conn):
+            with self._lock:
+                self._discard(conn)
+            return
+        if conn.in_transaction:
+            conn.rollback()
+        with self._cond:
+            self._idle.put_nowait(conn)
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, timeout=30):
+        """Borrow a connection for the duration of a ``with`` block."""
+        if self._closed:
+            raise RuntimeError("connection pool is closed")
+        conn = self._acquire(timeout)
+        try:
+            yield conn
+        except Exception:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        finally:
+            self._release(conn)
+
+    def _pause(self):
+        # لا اتصالات جديدة بعد الآن، والمعارة تُغلق عند إعادتها بدل أن تعود للمجمع
+        with self._lock:
+            self._paused = True
+            self._generation += 1
+            while True:
+                try:
+                    self._discard(self._idle.get_nowait())
+                except queue.Empty:
+                    break
+
+    def _drained(self, deadline):
+        with self._cond:
+            while self._created:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return True
+
+    def _resume(self):
+        with self._cond:
+            self._paused = False
+            self._cond.notify_all()
+
+    def reset(self, during=None, timeout=RESET_TIMEOUT):
+        """Close every connection and let the pool reopen them lazily.
+
+        New borrows wait while borrowed connections are returned and closed;
+        then ``during`` runs with no connection open, e.g. to swap the
+        database file underneath the pool. Raises ``TimeoutError`` without
+        running ``during`` if connections are still borrowed after ``timeout``.
+        """
+        _reset_all([self], during, timeout)
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._cond:
+            self._created = 0
+            self._born.clear()
+            self._cond.notify_all()
+
+
+def _reset_all(pools, during, timeout):
+    # الإيقاف أولاً في كل المجمعات ثم الانتظار، فلا يفتح أي مجمع اتصالاً جديداً بينما ينتظر غيره
+    for pool in pools:
+        pool._pause()
+    try:
+        deadline = time.monotonic() + timeout
+        busy = [pool.path for pool in pools if not pool._drained(deadline)]
+        if busy:
+            raise TimeoutError(f"connections to {busy[0]} are still borrowed after {timeout}s")
+        if during is not None:
+            during()
+    finally:
+        for pool in pools:
+            pool._resume()
+
+
+# ------ الكاتب ذو الالتزام الجماعي ------
+class _PendingWrite:
+    __slots__ = ("sql", "params", "done", "error", "lastrowid")
+
+    def __init__(self, sql, params):
+        self.sql = sql
+        self.params = params
+        self.done = threading.Event()
+        self.error = None
+        self.lastrowid = None
+
+    def wait(self, timeout=None):
+        if not self.done.wait(timeout):
+            raise TimeoutError("write was not committed in time")
+        if self.error is not None:
+            raise self.error
+        return self.lastrowid
+
+
+class GroupCommitWriter:
+    """Single writer thread that commits queued statements in shared transactions.
+
+    SQLite allows only one writer at a time, so funnelling every INSERT/UPDATE
+    through one connection and committing whatever has queued up since the last
+    commit turns N fsyncs into one.
+    """
+
+    def __init__(self, path=DB_PATH, max_batch=GROUP_COMMIT_MAX_BATCH):
+        self.path = path
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._stop = threading.Event()
+        self._conn = open_connection(path)
+        self._thread = threading.Thread(target=self._run, name="db-group-commit", daemon=True)
+        self._thread.start()
+
+    def submit(self, sql, params=()):
+        if self._stop.is_set():
+            raise RuntimeError("writer is stopped")
+        pending = _PendingWrite(sql, params)
+        self._queue.put(pending)
+        return pending
+
+    def execute(self, sql, params=(), timeout=30):
+        """Queue a write and block until the transaction holding it commits."""
+        return self.submit(sql, params).wait(timeout)
+
+    def _collect(self, first):
+        # كل ما تراكم أثناء الالتزام السابق يدخل في المعاملة التالية
+        batch = [first]
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        conn = self._conn
+        try:
+            while not (self._stop.is_set() and self._queue.empty()):
+                try:
+                    first = self._queue.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                if first is None:
+                    continue
+                batch = [p for p in self._collect(first) if p is not None]
+                self._commit(conn, batch)
+        finally:
+            conn.close()
+
+    def _commit(self, conn, batch):
+        try:
+            conn.execute("BEGIN")
+            for pending in batch:
+                try:
+                    conn.execute("SAVEPOINT w")
+                    pending.lastrowid = conn.execute(pending.sql, pending.params).lastrowid
+                    conn.execute("RELEASE w")
+                except sqlite3.Error as e:
+                    conn.execute("ROLLBACK TO w")
+                    conn.execute("RELEASE w")
+                    pending.error = e
+            conn.commit()
+        except sqlite3.Error as e:
+            logger.error("Group commit failed: %s", e)
+            if conn.in_transaction:
+                conn.rollback()
+            for pending in batch:
+                if pending.error is None:
+                    pending.error = e
+        for pending in batch:
+            pending.done.set()
+
+    def close(self, timeout=30):
+        self._stop.set()
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+
+# ------ الوصول من حلقة asyncio ------
+class AsyncDB:
+    """Run pool-bound database work from coroutines without blocking the event loop.
+
+    sqlite3 has no async driver, so each call borrows a pooled connection on a
+    small thread executor; the pool size still bounds concurrent statements.
+    """
+
+    def __init__(self, pool=None, max_workers=POOL_SIZE):
+        self.pool = pool if pool is not None else get_pool()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="async-db")
+
+    def _with_connection(self, fn, args):
+        with self.pool.connection() as conn:
+            return fn(conn, *args)
+
+    async def run(self, fn, *args):
+        """``await db.run(fn, *args)`` -> ``fn(conn, *args)`` on a pooled connection."""
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self._with_connection, fn, args)
+
+    async def call(self, fn, *args):
+        """Run any other blocking callable (cache lookups, queue puts) on the same executor."""
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+
+# ------ نسخ مشتركة على مستوى العملية ------
+_pool = None
+_writer = None
+_init_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _init_lock:
+            if _pool is None:
+                _pool = ConnectionPool()
+    return _pool
+
+
+def get_writer():
+    global _writer
+    if _writer is None:
+        with _init_lock:
+            if _writer is None:
+                _writer = GroupCommitWriter()
+    return _writer
+
+
+def shutdown():
+    global _pool, _writer
+    with _init_lock:
+        if _writer is not None:
+            _writer.close()
+            _writer = None
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+
+def reopen(during=None, path=DB_PATH, timeout=RESET_TIMEOUT):
+    """Drop the writer and every pooled connection to ``path``; the next use opens fresh ones.
+
+    Every ``ConnectionPool`` on that file in this process is reset, not just
+    the shared one, so code holding long-lived connections should borrow them
+    from a pool. ``during`` runs after the writer has drained and every
+    borrowed connection has been returned, while none of those pools can open
+    connections, so the database file can be replaced safely. Pools in other
+    processes notice the replaced file on their next borrow.
+    """
+    global _writer
+    target = os.path.abspath(path)
+    with _init_lock:
+        if _writer is not None and os.path.abspath(_writer.path) == target:
+            _writer.close()
+            _writer = None
+        with _pools_lock:
+            pools = [pool for pool in _pools if not pool._closed and os.path.abspath(pool.path) == target]
+        _reset_all(pools, during, timeout)
@@ -0,0 +1,267 @@
+# encrypted_storage.py - حاوية ملفات مشفرة من قطع ثابتة الحجم مصادَق عليها كلٌّ على حدة مع قراءة عشوائية
+import mmap
+import os
+import struct
+import tempfile
+import threading
+
+from cryptography.exceptions import InvalidTag
+from cryptography.fernet import InvalidToken
+
+import monitoring
+from quantum_vault import TAG_SIZE, QuantumVault, chunk_nonce
+
+CONTAINER_CHUNK_SIZE = int(os.getenv("ENCRYPTED_FS_CHUNK_SIZE", str(256 * 1024)))
+CONTAINER_MAGIC = b"QVC1"
+# MAGIC | key id (8) | chunk size (4) | nonce prefix (7)
+CONTAINER_HEADER = struct.Struct(">4s8sI7s")
+# فهرس القطع في نهاية الملف: حجم النص الأصلي وعدد القطع، مشفّر ومصادَق عليه
+CHUNK_INDEX = struct.Struct(">QI")
+INDEX_SIZE = CHUNK_INDEX.size + TAG_SIZE
+INDEX_SLOT = 0xFFFFFFFF
+
+
+class ChunkWriter:
+    """Streaming writer: holds at most two chunks of plaintext at a time.
+
+    Output goes to a temp file next to ``path`` and is renamed into place on
+    ``close``, so readers never see a half-written container.
+    """
+
+    def __init__(self, key, path, chunk_size):
+        self.key = key
+        self.path = path
+        self.chunk_size = chunk_size
+        self.prefix = os.urandom(7)
+        self.header = CONTAINER_HEADER.pack(CONTAINER_MAGIC, key.key_id, chunk_size, self.prefix)
+        fd, self._tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".part")
+        self._file = os.fdopen(fd, "wb")
+        self._file.write(self.header)
+        self._buffer = bytearray()
+        self._pending = None
+        self._count = 0
+        self.size = 0
+
+    def write(self, data):
+        view = memoryview(data).cast("B")
+        self.size += len(view)
+        while view:
+            take = self.chunk_size - len(self._buffer)
+            self._buffer += view[:take]
+            view = view[take:]
+            if len(self._buffer) == self.chunk_size:
+                # القطعة السابقة ليست الأخيرة لأن بيانات جديدة وصلت بعدها
+                if self._pending is not None:
+                    self._seal(self._pending, final=False)
+                self._pending = bytes(self._buffer)
+                self._buffer.clear()
+        return self.size
+
+    def _seal(self, chunk, final):
+        self._file.write(self.key.aead.encrypt(chunk_nonce(self.prefix, self._count, final), chunk, self.header))
+        self._count += 1
+
+    def close(self):
+        if self._file is None:
+            return
+        try:
+            if self._buffer:
+                if self._pending is not None:
+                    self._seal(self._pending, final=False)
+                self._seal(bytes(self._buffer), final=True)
+            else:
+                self._seal(self._pending if self._pending is not None else b"", final=True)
+            index = CHUNK_INDEX.pack(self.size, self._count)
+            self._file.write(self.key.aead.encrypt(chunk_nonce(self.prefix, INDEX_SLOT, True), index, self.header))
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            os.replace(self._tmp_path, self.path)
+        except BaseException:
+            self.abort()
+            raise
+        finally:
+            self._file = None
+
+    def abort(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if os.path.exists(self._tmp_path):
+            os.unlink(self._tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class ChunkReader:
+    """Random-access reader; each chunk is authenticated on its own when touched.
+
+    With ``use_mmap`` the container is mapped and chunks are decrypted straight
+    from the mapping, so only the requested chunks are paged in. The last
+    decrypted chunk is kept for sequential ``read`` calls.
+    """
+
+    def __init__(self, vault, path, use_mmap=True):
+        self._file = open(path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if use_mmap else None
+            self._open(vault)
+        except BaseException:
+            self.close()
+            raise
+        self._position = 0
+        self._cached = (None, b"")
+        self._lock = threading.Lock()
+
+    def _raw(self, offset, length):
+        if self._map is not None:
+            return memoryview(self._map)[offset:offset + length]
+        return os.pread(self._file.fileno(), length, offset)
+
+    def _open(self, vault):
+        file_size = os.fstat(self._file.fileno()).st_size
+        if file_size < CONTAINER_HEADER.size + INDEX_SIZE:
+            raise InvalidToken
+        self.header = bytes(self._raw(0, CONTAINER_HEADER.size))
+        magic, key_id, self.chunk_size, self.prefix = CONTAINER_HEADER.unpack(self.header)
+        self.key = vault.key_for_id(key_id)
+        if magic != CONTAINER_MAGIC or self.key is None:
+            raise InvalidToken
+        try:
+            index = self.key.aead.decrypt(chunk_nonce(self.prefix, INDEX_SLOT, True),
+                                          self._raw(file_size - INDEX_SIZE, INDEX_SIZE), self.header)
+        except InvalidTag:
+            raise InvalidToken
+        self.size, self.chunk_count = CHUNK_INDEX.unpack(index)
+        expected = (CONTAINER_HEADER.size + INDEX_SIZE + self.size + self.chunk_count * TAG_SIZE)
+        if self.chunk_count != max(1, -(-self.size // self.chunk_size)) or file_size != expected:
+            raise InvalidToken
+
+    def read_chunk(self, index):
+        """Plaintext of chunk ``index``, verified against its tag."""
+        cached_index, cached = self._cached
+        if cached_index == index:
+            return cached
+        if not 0 <= index < self.chunk_count:
+            raise IndexError(index)
+        start = index * self.chunk_size
+        length = min(self.chunk_size, self.size - start) + TAG_SIZE
+        offset = CONTAINER_HEADER.size + index * (self.chunk_size + TAG_SIZE)
+        final = index == self.chunk_count - 1
+        try:
+            chunk = self.key.aead.decrypt(chunk_nonce(self.prefix, index, final),
+                                          self._raw(offset, length), self.header)
+        except InvalidTag:
+            raise InvalidToken
+        self._cached = (index, chunk)
+        return chunk
+
+    def read_range(self, start, end=None):
+        """Bytes ``[start, end)`` of the plaintext, decrypting only the chunks that overlap it."""
+        end = self.size if end is None else min(end, self.size)
+        if start >= end:
+            return b""
+        first, last = start // self.chunk_size, (end - 1) // self.chunk_size
+        parts = []
+        for index in range(first, last + 1):
+            chunk = self.read_chunk(index)
+            base = index * self.chunk_size
+            parts.append(chunk[max(start - base, 0):end - base])
+        return b"".join(parts)
+
+    def iter_range(self, start=0, end=None):
+        """Yield the plaintext of ``[start, end)`` one chunk at a time (for streaming responses)."""
+        end = self.size if end is None else min(end, self.size)
+        position = start
+        while position < end:
+            boundary = min((position // self.chunk_size + 1) * self.chunk_size, end)
+            yield self.read_range(position, boundary)
+            position = boundary
+
+    # واجهة شبيهة بالملف لمكتبات تتوقع read/seek/tell
+    def read(self, n=-1):
+        with self._lock:
+            end = self.size if n is None or n < 0 else self._position + n
+            data = self.read_range(self._position, end)
+            self._position += len(data)
+            return data
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        with self._lock:
+            base = {os.SEEK_SET: 0, os.SEEK_CUR: self._position, os.SEEK_END: self.size}[whence]
+            self._position = max(0, base + offset)
+            return self._position
+
+    def tell(self):
+        return self._position
+
+    def close(self):
+        if getattr(self, "_map", None) is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class EncryptedFileSystem:
+    """Encrypted containers made of fixed-size, independently authenticated chunks.
+
+    Chunk ``i`` lives at a fixed offset, so a byte range maps straight to the
+    chunks that hold it and nothing else is read or decrypted. A tag-protected
+    index at the end records the plaintext size and chunk count, which catches
+    truncation and chunk removal.
+    """
+
+    def __init__(self, vault=None, chunk_size=CONTAINER_CHUNK_SIZE):
+        self.vault = vault or QuantumVault.from_env()
+        self.chunk_size = chunk_size
+        self.bytes_written = monitoring.counter("encrypted_fs_bytes_written_total",
+                                                "Plaintext bytes written to encrypted containers")
+        self.bytes_read = monitoring.counter("encrypted_fs_bytes_read_total",
+                                             "Plaintext bytes returned from encrypted containers")
+
+    def open_writer(self, path):
+        return ChunkWriter(self.vault.current, path, self.chunk_size)
+
+    def open_reader(self, path, use_mmap=True):
+        return ChunkReader(self.vault, path, use_mmap)
+
+    def write_stream(self, path, src, read_size=None):
+        read_size = read_size or self.chunk_size
+        with self.open_writer(path) as writer:
+            while True:
+                data = src.read(read_size)
+                if not data:
+                    break
+                writer.write(data)
+        self.bytes_written.inc(writer.size)
+        return writer.size
+
+    def read_range(self, path, start, end=None):
+        with self.open_reader(path) as reader:
+            data = reader.read_range(start, end)
+        self.bytes_read.inc(len(data))
+        return data
+
+    def write_file(self, path, content):
+        with self.open_writer(path) as writer:
+            writer.write(content.encode() if isinstance(content, str) else content)
+        self.bytes_written.inc(writer.size)
+
+    def read_file(self, path):
+        with self.open_reader(path) as reader:
+            data = reader.read_range(0)
+        self.bytes_read.inc(len(data))
+        return data.decode()
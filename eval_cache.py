@@ -0,0 +1,188 @@
+# eval_cache.py - تخزين نتائج التقييم حسب محتوى المهمة (LRU في الذاكرة + SQLite على القرص)
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+import db_pool
+import monitoring
+
+EVAL_CACHE_PATH = os.getenv("EVAL_CACHE_PATH", "eval_cache.db")
+EVAL_CACHE_TTL = float(os.getenv("EVAL_CACHE_TTL", str(7 * 24 * 3600)))
+EVAL_CACHE_MEMORY_ENTRIES = int(os.getenv("EVAL_CACHE_MEMORY_ENTRIES", "2048"))
+EVAL_CACHE_DISK_ENTRIES = int(os.getenv("EVAL_CACHE_DISK_ENTRIES", "200000"))
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_task(text):
+    # نفس النص بعد إعادة الرفع قد يختلف في المسافات أو ترميز الحروف فقط
+    text = unicodedata.normalize("NFC", text)
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def cache_key(task, prompt_template, model_params):
+    """Content address of one evaluation: task text, prompt template and model params."""
+    material = json.dumps(
+        {"task": normalize_task(task), "prompt": prompt_template, "params": model_params},
+        sort_keys=True, ensure_ascii=False, separators=(",", ":"),
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+# ------ الطبقة الأولى: LRU في الذاكرة ------
+class MemoryTier:
+    def __init__(self, max_entries=EVAL_CACHE_MEMORY_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= now:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, expires_at):
+        evicted = 0
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                evicted += 1
+        return evicted
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# ------ الطبقة الثانية: SQLite ------
+class DiskTier:
+    def __init__(self, path=EVAL_CACHE_PATH, max_entries=EVAL_CACHE_DISK_ENTRIES):
+        self.max_entries = max_entries
+        self.pool = db_pool.ConnectionPool(path, size=4)
+        self._writes = 0
+        with self.pool.connection() as conn:
+            conn.execute('''CREATE TABLE IF NOT EXISTS eval_cache
+                            (key TEXT PRIMARY KEY,
+                             value TEXT NOT NULL,
+                             expires_at REAL NOT NULL,
+                             last_access REAL NOT NULL)''')
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_eval_cache_access ON eval_cache (last_access)")
+            conn.commit()
+
+    def get(self, key, now=None):
+        now = time.time() if now is None else now
+        with self.pool.connection() as conn:
+            row = conn.execute("SELECT value, expires_at FROM eval_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None, None
+            if row[1] <= now:
+                conn.execute("DELETE FROM eval_cache WHERE key = ?", (key,))
+                conn.commit()
+                return None, None
+            conn.execute("UPDATE eval_cache SET last_access = ? WHERE key = ?", (now, key))
+            conn.commit()
+        return json.loads(row[0]), row[1]
+
+    def set(self, key, value, expires_at, now=None):
+        now = time.time() if now is None else now
+        with self.pool.connection() as conn:
+            conn.execute("INSERT OR REPLACE INTO eval_cache (key, value, expires_at, last_access) "
+                         "VALUES (?, ?, ?, ?)", (key, json.dumps(value), expires_at, now))
+            conn.commit()
+        self._writes += 1
+        # التنظيف كل 256 كتابة بدلاً من كل كتابة
+        if self._writes % 256 == 0:
+            return self.evict(now)
+        return 0
+
+    def evict(self, now=None):
+        now = time.time() if now is None else now
+        with self.pool.connection() as conn:
+            removed = conn.execute("DELETE FROM eval_cache WHERE expires_at <= ?", (now,)).rowcount
+            count = conn.execute("SELECT COUNT(*) FROM eval_cache").fetchone()[0]
+            if count > self.max_entries:
+                removed += conn.execute(
+                    "DELETE FROM eval_cache WHERE key IN "
+                    "(SELECT key FROM eval_cache ORDER BY last_access LIMIT ?)",
+                    (count - self.max_entries,)).rowcount
+            conn.commit()
+        return removed
+
+    def close(self):
+        self.pool.close()
+
+
+# ------ التخزين ذو الطبقتين ------
+class EvaluationCache:
+    def __init__(self, memory=None, disk=None, ttl=EVAL_CACHE_TTL):
+        self.ttl = ttl
+        self.memory = memory if memory is not None else MemoryTier()
+        self.disk = disk
+        self.memory_hits = monitoring.counter("eval_cache_memory_hits_total", "Evaluation cache hits served from memory")
+        self.disk_hits = monitoring.counter("eval_cache_disk_hits_total", "Evaluation cache hits served from SQLite")
+        self.misses = monitoring.counter("eval_cache_misses_total", "Evaluation cache misses")
+        self.evictions = monitoring.counter("eval_cache_evictions_total", "Evaluation cache entries evicted")
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is not None:
+            self.memory_hits.inc()
+            return value
+        if self.disk is not None:
+            value, expires_at = self.disk.get(key)
+            if value is not None:
+                self.disk_hits.inc()
+                self.evictions.inc(self.memory.set(key, value, expires_at))
+                return value
+        self.misses.inc()
+        return None
+
+    def set(self, key, value):
+        expires_at = time.time() + self.ttl
+        evicted = self.memory.set(key, value, expires_at)
+        if self.disk is not None:
+            evicted += self.disk.set(key, value, expires_at)
+        self.evictions.inc(evicted)
+
+    def close(self):
+        if self.disk is not None:
+            self.disk.close()
+
+
+_cache = None
+_lock = threading.Lock()
+
+
+def get_cache():
+    global _cache
+    if _cache is None:
+        with _lock:
+            if _cache is None:
+                _cache = EvaluationCache(disk=DiskTier())
+    return _cache
+
+
+def shutdown():
+    global _cache
+    with _lock:
+        if _cache is not None:
+            _cache.close()
+            _cache = None
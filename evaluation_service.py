@@ -0,0 +1,102 @@
+# evaluation_service.py - تعليمات التقييم ومعاملاته المشتركة بين خادم Flask ووضع ASGI
+import asyncio
+import hashlib
+import json
+import os
+
+import eval_cache
+import llm_backend
+import monitoring
+
+EVALUATION_PROMPT = """
+    [SYSTEM PROMPT]
+    Analyze BTEC task with anti-bias protocols:
+    {task}
+    - Check technical accuracy
+    - Assess creativity
+    - Identify potential biases
+    """
+EVALUATION_PARAMS = {"model": "gpt-4-turbo", "temperature": 0.7, "max_tokens": 1000}
+EVALUATION_TIMEOUT = float(os.getenv("EVALUATION_TIMEOUT", "60"))
+
+streams_abandoned = monitoring.counter("evaluation_streams_abandoned_total",
+                                       "Streamed evaluations closed by the client before the model finished")
+
+
+def evaluation_messages(task):
+    return [{"role": "system", "content": EVALUATION_PROMPT.format(task=task)}]
+
+
+def evaluation_key(task):
+    # نفس المفتاح في الوضعين، فالتخزين المشترك يخدم الخادمين
+    return eval_cache.cache_key(task, EVALUATION_PROMPT, EVALUATION_PARAMS)
+
+
+def build_result(feedback):
+    return {
+        'feedback': feedback,
+        'integrity_hash': hashlib.sha3_256(feedback.encode()).hexdigest()
+    }
+
+
+def run_evaluation(task):
+    feedback = llm_backend.get_backend().complete(evaluation_messages(task), **EVALUATION_PARAMS)
+    return build_result(feedback)
+
+
+async def arun_evaluation(task):
+    feedback = await llm_backend.get_backend().acomplete(evaluation_messages(task), **EVALUATION_PARAMS)
+    return build_result(feedback)
+
+
+# ------ البث: ("token", نص) لكل قطعة ثم ("done", النتيجة) ------
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def stream_evaluation(task, cached=None):
+    """Yield ``("token", text)`` as the model generates, then ``("done", result)``.
+
+    The integrity hash is updated piece by piece, so it equals the one
+    ``run_evaluation`` gives for the same text. A cached result is replayed as
+    one piece. Closing the generator early closes the upstream request.
+    """
+    if cached is not None:
+        yield "token", cached['feedback']
+        yield "done", cached
+        return
+    digest = hashlib.sha3_256()
+    pieces = []
+    stream = llm_backend.get_backend().stream(evaluation_messages(task), **EVALUATION_PARAMS)
+    try:
+        for piece in stream:
+            digest.update(piece.encode())
+            pieces.append(piece)
+            yield "token", piece
+    except GeneratorExit:
+        streams_abandoned.inc()
+        raise
+    finally:
+        stream.close()
+    yield "done", {'feedback': "".join(pieces), 'integrity_hash': digest.hexdigest()}
+
+
+async def astream_evaluation(task, cached=None):
+    if cached is not None:
+        yield "token", cached['feedback']
+        yield "done", cached
+        return
+    digest = hashlib.sha3_256()
+    pieces = []
+    stream = llm_backend.get_backend().astream(evaluation_messages(task), **EVALUATION_PARAMS)
+    try:
+        async for piece in stream:
+            digest.update(piece.encode())
+            pieces.append(piece)
+            yield "token", piece
+    except (GeneratorExit, asyncio.CancelledError):
+        streams_abandoned.inc()
+        raise
+    finally:
+        await stream.aclose()
+    yield "done", {'feedback': "".join(pieces), 'integrity_hash': digest.hexdigest()}
@@ -0,0 +1,111 @@
+# inference_batcher.py - تجميع طلبات الاستدلال المتزامنة في دفعات حسب الطول
+import bisect
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import monitoring
+
+AI_MAX_BATCH_SIZE = int(os.getenv("AI_MAX_BATCH_SIZE", "32"))  # ai.max_batch_size في config.yaml
+AI_MAX_BATCH_WAIT = float(os.getenv("AI_MAX_BATCH_WAIT_MS", "10")) / 1000.0
+LENGTH_BUCKETS = (32, 64, 128, 256, 512)
+
+
+class _Request:
+    __slots__ = ("item", "future", "enqueued_at")
+
+    def __init__(self, item):
+        self.item = item
+        self.future = Future()
+        self.enqueued_at = time.monotonic()
+
+
+class BatchingWorker:
+    """Collects concurrent requests and runs them through ``run_batch`` together.
+
+    Requests are grouped into length buckets so a batch is padded only to the
+    longest sequence of similar-length inputs. A bucket is dispatched when it
+    holds ``max_batch_size`` requests or its oldest request has waited
+    ``max_wait`` seconds. ``run_batch(items)`` must return one result per item.
+    """
+
+    def __init__(self, run_batch, max_batch_size=AI_MAX_BATCH_SIZE, max_wait=AI_MAX_BATCH_WAIT,
+                 buckets=LENGTH_BUCKETS, name="inference"):
+        self.run_batch = run_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.buckets = tuple(buckets)
+        self._pending = [deque() for _ in range(len(self.buckets) + 1)]
+        self._cond = threading.Condition()
+        self._closed = False
+        self.batches = monitoring.counter(f"{name}_batches_total", "Inference batches executed")
+        self.batched_requests = monitoring.counter(f"{name}_batched_requests_total", "Requests served by batches")
+        self.queue_wait = monitoring.latency(f"{name}_queue_wait_seconds", "Time a request waited for its batch")
+        self.batch_latency = monitoring.latency(f"{name}_batch_seconds", "Time to run one inference batch")
+        self._thread = threading.Thread(target=self._run, name=f"{name}-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, item, length):
+        """Queue one input of ``length`` tokens; returns a Future with its result."""
+        request = _Request(item)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("batching worker is closed")
+            self._pending[bisect.bisect_left(self.buckets, length)].append(request)
+            self._cond.notify()
+        return request.future
+
+    def _next_batch(self):
+        # يعيد دفعة جاهزة أو الزمن المتبقي حتى تصبح أقدم دفعة مستحقة
+        now = time.monotonic()
+        wait = None
+        for pending in self._pending:
+            if not pending:
+                continue
+            due = pending[0].enqueued_at + self.max_wait
+            if len(pending) >= self.max_batch_size or due <= now or self._closed:
+                n = min(len(pending), self.max_batch_size)
+                return [pending.popleft() for _ in range(n)], None
+            wait = due - now if wait is None else min(wait, due - now)
+        return None, wait
+
+    def _run(self):
+        while True:
+            with self._cond:
+                batch, wait = self._next_batch()
+                while batch is None:
+                    if self._closed:
+                        return
+                    self._cond.wait(wait)
+                    batch, wait = self._next_batch()
+            self._execute(batch)
+
+    def _execute(self, batch):
+        # الطلبات التي ألغاها أصحابها لا تدخل الدفعة
+        batch = [request for request in batch if request.future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        start = time.monotonic()
+        for request in batch:
+            self.queue_wait.observe(start - request.enqueued_at)
+        self.batches.inc()
+        self.batched_requests.inc(len(batch))
+        try:
+            results = self.run_batch([request.item for request in batch])
+        except Exception as e:
+            for request in batch:
+                request.future.set_exception(e)
+            return
+        finally:
+            self.batch_latency.observe(time.monotonic() - start)
+        for request, result in zip(batch, results):
+            request.future.set_result(result)
+
+    def close(self, timeout=30):
+        """Run everything already queued, then stop the worker thread."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join(timeout)
@@ -0,0 +1,394 @@
+# job_store.py - جدول مهام دائم للتقييمات غير المتزامنة مع منفّذ داخل العملية بديلاً محلياً عن Celery
+import base64
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import db_pool
+import monitoring
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_MAX_QUEUED = int(os.getenv("JOB_MAX_QUEUED", "1000"))
+JOB_TTL = float(os.getenv("JOB_TTL", str(24 * 3600)))  # عمر المهمة ونتيجتها بعد آخر تغيير
+JOB_MAX_WAIT = float(os.getenv("JOB_MAX_WAIT", "30"))  # أقصى انتظار لطلب long-poll واحد
+# عامل WSGI المتزامن محجوز طوال الانتظار، فالحد هناك أقصر بكثير؛ العميل يعيد الطلب بعد Retry-After
+JOB_MAX_WAIT_SYNC = float(os.getenv("JOB_MAX_WAIT_SYNC", "2"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "0.5"))
+JOB_SWEEP_INTERVAL = float(os.getenv("JOB_SWEEP_INTERVAL", "60"))
+JOB_STALE_AFTER = float(os.getenv("JOB_STALE_AFTER", "600"))
+# المهمة الجارية تُلمس بهذا الفاصل، فلا يراها المنظف متروكة مهما طال تنفيذها
+JOB_HEARTBEAT_INTERVAL = float(os.getenv("JOB_HEARTBEAT_INTERVAL", "30"))
+JOB_PAGE_SIZE = 50
+JOB_MAX_PAGE_SIZE = 200
+
+QUEUED, RUNNING, SUCCEEDED, FAILED = "queued", "running", "succeeded", "failed"
+TERMINAL = (SUCCEEDED, FAILED)
+
+SCHEMA = (
+    '''CREATE TABLE IF NOT EXISTS jobs
+       (id TEXT PRIMARY KEY,
+        user_id TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        status TEXT NOT NULL,
+        payload TEXT,
+        result TEXT,
+        error TEXT,
+        claimed_by TEXT,
+        version INTEGER NOT NULL DEFAULT 1,
+        created_at REAL NOT NULL,
+        updated_at REAL NOT NULL,
+        expires_at REAL NOT NULL)''',
+    "CREATE INDEX IF NOT EXISTS idx_jobs_user_created ON jobs (user_id, created_at, id)",
+    "CREATE INDEX IF NOT EXISTS idx_jobs_expires ON jobs (expires_at)",
+    "CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, updated_at)",
+)
+
+_COLUMNS = ("id", "user_id", "kind", "status", "result", "error", "version",
+            "created_at", "updated_at", "expires_at")
+
+
+class JobQueueFull(RuntimeError):
+    """Too many jobs are waiting in this process; the caller should answer 503."""
+
+
+def ensure_schema(conn):
+    for statement in SCHEMA:
+        conn.execute(statement)
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+    if "claimed_by" not in columns:
+        conn.execute("ALTER TABLE jobs ADD COLUMN claimed_by TEXT")
+
+
+def etag(job):
+    # يتغير الإصدار مع كل انتقال في الحالة، فهو يكفي لـ If-None-Match
+    return f'"{job["id"]}.{job["version"]}"'
+
+
+# ------ مؤشر الصفحة ------
+def encode_cursor(created_at, job_id):
+    raw = json.dumps([created_at, job_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, job_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return float(created_at), str(job_id)
+    except (ValueError, TypeError):
+        raise ValueError("invalid cursor")
+
+
+def _as_dict(row):
+    job = dict(zip(_COLUMNS, row))
+    job["result"] = json.loads(job["result"]) if job["result"] is not None else None
+    return job
+
+
+class JobStore:
+    """Jobs persisted in the shared SQLite database.
+
+    Every state change bumps ``version``, which doubles as the ETag for
+    conditional GETs. Expired jobs read as missing and are deleted by
+    ``purge_expired``. ``wait`` is woken at once by changes made in this
+    process and polls the table for changes made by other workers.
+    """
+
+    def __init__(self, pool=None, ttl=JOB_TTL, poll_interval=JOB_POLL_INTERVAL):
+        self.pool = pool if pool is not None else db_pool.get_pool()
+        self.ttl = ttl
+        self.poll_interval = poll_interval
+        self._changed = threading.Condition()
+        self._changes = 0
+        self.expired = monitoring.counter("jobs_expired_total", "Jobs deleted after their TTL")
+        with self.pool.connection() as conn:
+            ensure_schema(conn)
+            conn.commit()
+
+    def _notify(self):
+        with self._changed:
+            self._changes += 1
+            self._changed.notify_all()
+
+    def create(self, user_id, kind, payload, now=None):
+        now = time.time() if now is None else now
+        job_id = uuid.uuid4().hex
+        with self.pool.connection() as conn:
+            conn.execute("INSERT INTO jobs (id, user_id, kind, status, payload, created_at, updated_at, expires_at) "
+                         "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                         (job_id, str(user_id), kind, QUEUED, json.dumps(payload), now, now, now + self.ttl))
+            conn.commit()
+        return self.get(job_id, now)
+
+    def get(self, job_id, now=None):
+        now = time.time() if now is None else now
+        with self.pool.connection() as conn:
+            row = conn.execute(f"SELECT {', '.join(_COLUMNS)} FROM jobs WHERE id = ? AND expires_at > ?",
+                               (job_id, now)).fetchone()
+        return _as_dict(row) if row else None
+
+    def claim(self, job_id, token=None, now=None):
+        """Move a queued job to running; returns ``(kind, payload)`` or ``None`` if another worker has it.
+
+        ``token`` identifies this run: ``heartbeat`` and ``finish`` only touch
+        the job while it is still claimed with the same token.
+        """
+        now = time.time() if now is None else now
+        with self.pool.connection() as conn:
+            claimed = conn.execute("UPDATE jobs SET status = ?, claimed_by = ?, version = version + 1, updated_at = ? "
+                                   "WHERE id = ? AND status = ? AND expires_at > ?",
+                                   (RUNNING, token, now, job_id, QUEUED, now)).rowcount
+            row = conn.execute("SELECT kind, payload FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            conn.commit()
+        self._notify()
+        return (row[0], json.loads(row[1])) if claimed and row else None
+
+    def finish(self, job_id, result=None, error=None, token=None, now=None):
+        """Store the outcome; with ``token``, only if this run still holds the job. Returns whether it was stored."""
+        now = time.time() if now is None else now
+        sql = ("UPDATE jobs SET status = ?, result = ?, error = ?, payload = NULL, claimed_by = NULL, "
+               "version = version + 1, updated_at = ?, expires_at = ? WHERE id = ?")
+        # النتيجة تبقى JOB_TTL بعد الانتهاء، لا بعد الإنشاء
+        params = [FAILED if error is not None else SUCCEEDED,
+                  json.dumps(result) if error is None else None, error, now, now + self.ttl, job_id]
+        if token is not None:
+            # تشغيل أُعيدت مهمته إلى الطابور لا يكتب فوق نتيجة التشغيل الذي أخذها بعده
+            sql += " AND status = ? AND claimed_by = ?"
+            params.extend([RUNNING, token])
+        with self.pool.connection() as conn:
+            stored = conn.execute(sql, params).rowcount
+            conn.commit()
+        self._notify()
+        return bool(stored)
+
+    def heartbeat(self, tokens, now=None):
+        """Touch ``updated_at`` of the running jobs claimed with ``tokens`` so the sweeper leaves them alone."""
+        if not tokens:
+            return 0
+        now = time.time() if now is None else now
+        with self.pool.connection() as conn:
+            touched = conn.execute(f"UPDATE jobs SET updated_at = ? WHERE status = ? "
+                                   f"AND claimed_by IN ({', '.join('?' * len(tokens))})",
+                                   [now, RUNNING, *tokens]).rowcount
+            conn.commit()
+        return touched
+
+    def wait(self, job_id, known_version=None, timeout=JOB_MAX_WAIT):
+        """Long-poll: return the job once it finishes or its version differs from ``known_version``.
+
+        Returns the unchanged job when ``timeout`` passes first, or ``None`` if
+        the job does not exist (or expired).
+        """
+        deadline = time.monotonic() + max(0.0, min(timeout, JOB_MAX_WAIT))
+        while True:
+            # رقم التغيير قبل القراءة: تغيير يقع بين القراءة والانتظار لا يضيع
+            seen = self._changes
+            job = self.get(job_id)
+            remaining = deadline - time.monotonic()
+            if (job is None or job["status"] in TERMINAL or remaining <= 0
+                    or (known_version is not None and job["version"] != known_version)):
+                return job
+            with self._changed:
+                if self._changes == seen:
+                    self._changed.wait(min(remaining, self.poll_interval))
+
+    def list_for_user(self, user_id, cursor=None, limit=JOB_PAGE_SIZE, now=None):
+        """Newest first; returns ``(jobs, next_cursor)``."""
+        now = time.time() if now is None else now
+        limit = max(1, min(int(limit), JOB_MAX_PAGE_SIZE))
+        sql = f"SELECT {', '.join(_COLUMNS)} FROM jobs WHERE user_id = ? AND expires_at > ?"
+        params = [str(user_id), now]
+        if cursor:
+            sql += " AND (created_at, id) < (?, ?)"
+            params.extend(decode_cursor(cursor))
+        sql += " ORDER BY created_at DESC, id DESC LIMIT ?"
+        params.append(limit + 1)
+        with self.pool.connection() as conn:
+            rows = conn.execute(sql, params).fetchall()
+        next_cursor = encode_cursor(rows[limit - 1][7], rows[limit - 1][0]) if len(rows) > limit else None
+        return [_as_dict(row) for row in rows[:limit]], next_cursor
+
+    def pending(self, stale_after=JOB_STALE_AFTER, now=None):
+        """Queued jobs, plus running ones not touched for ``stale_after`` (their worker died) put back in the queue."""
+        now = time.time() if now is None else now
+        with self.pool.connection() as conn:
+            conn.execute("UPDATE jobs SET status = ?, claimed_by = NULL, version = version + 1, updated_at = ? "
+                         "WHERE status = ? AND updated_at < ? AND expires_at > ?",
+                         (QUEUED, now, RUNNING, now - stale_after, now))
+            rows = conn.execute("SELECT id FROM jobs WHERE status = ? AND expires_at > ? ORDER BY created_at",
+                                (QUEUED, now)).fetchall()
+            conn.commit()
+        return [row[0] for row in rows]
+
+    def requeue_stale(self, stale_after=JOB_STALE_AFTER, now=None):
+        """Put back running or queued jobs untouched for ``stale_after`` (their worker died); returns their ids.
+
+        A live run keeps its job fresh through ``heartbeat``, so only jobs
+        whose worker stopped beating are requeued.
+        """
+        now = time.time() if now is None else now
+        with self.pool.connection() as conn:
+            rows = conn.execute("UPDATE jobs SET status = ?, claimed_by = NULL, version = version + 1, updated_at = ? "
+                                "WHERE status IN (?, ?) AND updated_at < ? AND expires_at > ? RETURNING id",
+                                (QUEUED, now, QUEUED, RUNNING, now - stale_after, now)).fetchall()
+            conn.commit()
+        if rows:
+            self._notify()
+        return [row[0] for row in rows]
+
+    def purge_expired(self, now=None):
+        now = time.time() if now is None else now
+        with self.pool.connection() as conn:
+            deleted = conn.execute("DELETE FROM jobs WHERE expires_at <= ?", (now,)).rowcount
+            conn.commit()
+        self.expired.inc(deleted)
+        return deleted
+
+
+class JobRunner:
+    """In-process stand-in for Celery: runs jobs from a ``JobStore`` on a thread pool.
+
+    Handlers are registered per job kind and receive the JSON payload; their
+    return value is stored as the result. A Celery worker can reuse the same
+    handlers by calling ``run(job_id)`` from its task. Jobs left queued (or
+    stuck running) by a previous process are picked up on ``start``, and the
+    sweeper keeps recovering jobs whose worker died while this one runs.
+    Running jobs get a heartbeat every ``heartbeat_interval`` (at most a
+    third of ``stale_after``), so long evaluations are not run twice.
+    """
+
+    def __init__(self, store, workers=JOB_WORKERS, max_queued=JOB_MAX_QUEUED, sweep_interval=JOB_SWEEP_INTERVAL,
+                 stale_after=JOB_STALE_AFTER, heartbeat_interval=JOB_HEARTBEAT_INTERVAL):
+        self.store = store
+        self.stale_after = stale_after
+        self.heartbeat_interval = min(heartbeat_interval, stale_after / 3)
+        self._running = {}
+        self.max_queued = max_queued
+        self.sweep_interval = sweep_interval
+        self._handlers = {}
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        self._queued = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sweeper = None
+        self._heartbeat = threading.Thread(target=self._beat, name="job-heartbeat", daemon=True)
+        self._heartbeat.start()
+        self.submitted = monitoring.counter("jobs_submitted_total", "Jobs accepted for background execution")
+        self.succeeded = monitoring.counter("jobs_succeeded_total", "Jobs that finished with a result")
+        self.failed = monitoring.counter("jobs_failed_total", "Jobs that finished with an error")
+        self.rejected = monitoring.counter("jobs_rejected_total", "Jobs refused because the local queue was full")
+        self.run_latency = monitoring.latency("job_run_seconds", "Time to run one job")
+
+    def register(self, kind, handler):
+        self._handlers[kind] = handler
+
+    def start(self):
+        """Pick up leftover jobs and start the expiry sweeper; call after registering handlers."""
+        if self._sweeper is not None:
+            return self
+        for job_id in self.store.pending(self.stale_after):
+            self._enqueue(job_id)
+        self._sweeper = threading.Thread(target=self._sweep, name="job-sweeper", daemon=True)
+        self._sweeper.start()
+        return self
+
+    def submit(self, user_id, kind, payload):
+        """Persist a job and queue it here; returns the job record."""
+        if kind not in self._handlers:
+            raise ValueError(f"no handler registered for job kind {kind!r}")
+        with self._lock:
+            if self._queued >= self.max_queued:
+                self.rejected.inc()
+                raise JobQueueFull("job queue is full")
+        job = self.store.create(user_id, kind, payload)
+        self._enqueue(job["id"])
+        self.submitted.inc()
+        return job
+
+    def _enqueue(self, job_id):
+        with self._lock:
+            self._queued += 1
+        self._executor.submit(self._run_queued, job_id)
+
+    def _run_queued(self, job_id):
+        with self._lock:
+            self._queued -= 1
+        self.run(job_id)
+
+    def run(self, job_id):
+        token = uuid.uuid4().hex
+        claimed = self.store.claim(job_id, token)
+        if claimed is None:
+            return
+        kind, payload = claimed
+        if kind not in self._handlers:
+            self.store.finish(job_id, error=f"no handler for job kind {kind!r}", token=token)
+            self.failed.inc()
+            return
+        with self._lock:
+            self._running[job_id] = token
+        try:
+            with self.run_latency.time():
+                result = self._handlers[kind](payload)
+        except Exception as e:
+            logger.error("Job %s (%s) failed: %s", job_id, kind, e)
+            if self.store.finish(job_id, error=str(e) or type(e).__name__, token=token):
+                self.failed.inc()
+            return
+        finally:
+            with self._lock:
+                self._running.pop(job_id, None)
+        if self.store.finish(job_id, result=result, token=token):
+            self.succeeded.inc()
+        else:
+            logger.warning("Job %s was requeued while running; its result was discarded", job_id)
+
+    def _beat(self):
+        while not self._stop.wait(self.heartbeat_interval):
+            with self._lock:
+                tokens = list(self._running.values())
+            try:
+                self.store.heartbeat(tokens)
+            except Exception as e:
+                logger.error("Job heartbeat failed: %s", e)
+
+    def _sweep(self):
+        while not self._stop.wait(self.sweep_interval):
+            try:
+                self.store.purge_expired()
+                # مهام عامل توقف أثناء عمل هذه العملية، لا عند إقلاعها فقط
+                for job_id in self.store.requeue_stale(self.stale_after):
+                    self._enqueue(job_id)
+            except Exception as e:
+                logger.error("Job sweep failed: %s", e)
+
+    def close(self, wait=True):
+        self._stop.set()
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+
+_runner = None
+_init_lock = threading.Lock()
+
+
+def get_runner():
+    global _runner
+    if _runner is None:
+        with _init_lock:
+            if _runner is None:
+                _runner = JobRunner(JobStore())
+    return _runner
+
+
+def shutdown():
+    global _runner
+    with _init_lock:
+        if _runner is not None:
+            _runner.close()
+            _runner = None
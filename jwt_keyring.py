@@ -0,0 +1,239 @@
+# jwt_keyring.py - حلقة مفاتيح JWT متعددة مع kid ونوافذ صلاحية متداخلة ومخزن مشترك بين العمال
+import os
+import secrets
+import threading
+import time
+import uuid
+
+import auth_cache
+import db_pool
+import monitoring
+
+KEY_ROTATION_SECONDS = int(os.getenv("JWT_KEY_ROTATION_SECONDS", str(24 * 3600)))
+TOKEN_LIFETIME_SECONDS = int(os.getenv("JWT_TOKEN_LIFETIME_SECONDS", str(2 * 3600)))
+KEYRING_REFRESH_SECONDS = float(os.getenv("JWT_KEYRING_REFRESH_SECONDS", "5"))
+KEYRING_LEEWAY_SECONDS = 60
+
+_SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS jwt_keys (
+        kid TEXT PRIMARY KEY,
+        secret BLOB NOT NULL,
+        created_at REAL NOT NULL,
+        retired_at REAL,
+        verify_until REAL)""",
+    """CREATE TABLE IF NOT EXISTS jwt_keyring_meta (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER NOT NULL)""",
+    "INSERT OR IGNORE INTO jwt_keyring_meta (id, version) VALUES (1, 0)",
+)
+
+
+class SigningKey:
+    __slots__ = ("kid", "secret", "created_at", "retired_at", "verify_until", "hs512")
+
+    def __init__(self, kid, secret, created_at, retired_at=None, verify_until=None):
+        self.kid = kid
+        self.secret = bytes(secret)
+        self.created_at = created_at
+        self.retired_at = retired_at
+        self.verify_until = verify_until
+        self.hs512 = auth_cache.HS512Key(self.secret)
+
+    @property
+    def active(self):
+        return self.retired_at is None
+
+
+# ------ المخزن المشترك ------
+class KeyStore:
+    """Keys shared by every gunicorn worker through one SQLite table.
+
+    Rotation runs inside ``BEGIN IMMEDIATE`` and re-checks that the active key
+    is actually due, so when several workers hit the rotation timer together
+    exactly one of them creates the next key. A version counter lets workers
+    notice a rotation with a single-row read.
+    """
+
+    def __init__(self, path=db_pool.DB_PATH):
+        self.path = path
+        # مجمع باتصال واحد بدلاً من اتصال خاص: استعادة نسخة احتياطية تعيد فتحه مع بقية المجمعات
+        self._pool = db_pool.ConnectionPool(path, size=1)
+        with self._pool.connection() as conn:
+            for statement in _SCHEMA:
+                conn.execute(statement)
+            conn.commit()
+
+    def version(self):
+        with self._pool.connection() as conn:
+            return conn.execute("SELECT version FROM jwt_keyring_meta WHERE id = 1").fetchone()[0]
+
+    def load(self, now=None):
+        now = time.time() if now is None else now
+        with self._pool.connection() as conn:
+            version = conn.execute("SELECT version FROM jwt_keyring_meta WHERE id = 1").fetchone()[0]
+            rows = conn.execute(
+                "SELECT kid, secret, created_at, retired_at, verify_until FROM jwt_keys "
+                "WHERE verify_until IS NULL OR verify_until > ?", (now,)).fetchall()
+        return version, [SigningKey(*row) for row in rows]
+
+    def rotate(self, interval, token_lifetime, now=None, force=False):
+        """Create a new active key if the current one is older than ``interval``.
+
+        The previous key stops signing but stays verifiable for
+        ``token_lifetime`` (plus leeway), i.e. until every token it signed has
+        expired. Returns the new ``kid``, or None if another worker already
+        rotated.
+        """
+        now = time.time() if now is None else now
+        with self._pool.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT created_at FROM jwt_keys WHERE retired_at IS NULL "
+                                   "ORDER BY created_at DESC LIMIT 1").fetchone()
+                if row is not None and not force and now - row[0] < interval:
+                    conn.rollback()
+                    return None
+                kid = uuid.uuid4().hex[:16]
+                conn.execute("UPDATE jwt_keys SET retired_at = ?, verify_until = ? WHERE retired_at IS NULL",
+                             (now, now + token_lifetime + KEYRING_LEEWAY_SECONDS))
+                conn.execute("INSERT INTO jwt_keys (kid, secret, created_at) VALUES (?, ?, ?)",
+                             (kid, secrets.token_bytes(64), now))
+                conn.execute("DELETE FROM jwt_keys WHERE verify_until IS NOT NULL AND verify_until <= ?", (now,))
+                conn.execute("UPDATE jwt_keyring_meta SET version = version + 1 WHERE id = 1")
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        return kid
+
+    def close(self):
+        self._pool.close()
+
+
+# ------ حلقة المفاتيح لكل عامل ------
+class Keyring:
+    """Per-process view of the shared keys: O(1) lookup by ``kid``.
+
+    The in-memory dict is rebuilt and swapped in as a whole when the store's
+    version changes, so readers never lock. An unknown ``kid`` forces a
+    refresh, which covers tokens signed by a worker that rotated a moment ago;
+    those forced refreshes run at most once per ``refresh_interval / 10`` so a
+    flood of made-up kids cannot turn every request into a store read.
+    """
+
+    def __init__(self, store, rotation_interval=KEY_ROTATION_SECONDS, token_lifetime=TOKEN_LIFETIME_SECONDS,
+                 refresh_interval=KEYRING_REFRESH_SECONDS):
+        self.store = store
+        self.rotation_interval = rotation_interval
+        self.token_lifetime = token_lifetime
+        self.refresh_interval = refresh_interval
+        self._keys = {}
+        self._active = None
+        self._version = None
+        self._checked_at = 0.0
+        self._missed_at = 0.0
+        self._lock = threading.Lock()
+        self.rotations = monitoring.counter("jwt_key_rotations_total", "JWT signing keys created by this worker")
+        self.unknown_kids = monitoring.counter("jwt_unknown_kid_total", "Tokens presented with an unknown kid")
+        self.refresh(force=True)
+        if self._active is None:
+            self.store.rotate(self.rotation_interval, self.token_lifetime)
+            self.refresh(force=True)
+
+    def refresh(self, force=False):
+        now = time.time()
+        if not force and now - self._checked_at < self.refresh_interval:
+            return
+        with self._lock:
+            if not force and now - self._checked_at < self.refresh_interval:
+                return
+            self._checked_at = now
+            if self.store.version() == self._version:
+                return
+            version, keys = self.store.load(now)
+            active = [key for key in keys if key.active]
+            self._keys = {key.kid: key for key in keys}
+            self._active = max(active, key=lambda key: key.created_at) if active else None
+            self._version = version
+
+    def active(self):
+        self.refresh()
+        return self._active
+
+    def get(self, kid):
+        self.refresh()
+        key = self._keys.get(kid)
+        if key is None:
+            if self._may_force():
+                self.refresh(force=True)
+                key = self._keys.get(kid)
+            if key is None:
+                self.unknown_kids.inc()
+        return key
+
+    def _may_force(self):
+        # تحديث قسري واحد لكل نافذة مهما كثرت المعرّفات المجهولة
+        now = time.time()
+        with self._lock:
+            if now - self._missed_at < self.refresh_interval / 10:
+                return False
+            self._missed_at = now
+            return True
+
+    def rotate_if_due(self, force=False):
+        active = self.active()
+        if not force and active is not None and time.time() - active.created_at < self.rotation_interval:
+            return None
+        kid = self.store.rotate(self.rotation_interval, self.token_lifetime, force=force)
+        if kid is not None:
+            self.rotations.inc()
+        self.refresh(force=True)
+        return kid
+
+    def sign(self, claims):
+        key = self.active()
+        return auth_cache.encode_hs512(claims, key.secret, headers={"kid": key.kid})
+
+
+class KeyringVerifier(auth_cache.TokenVerifier):
+    """``TokenVerifier`` that picks the key from the token's ``kid`` header.
+
+    Rotation does not invalidate cached tokens: the retired key keeps
+    verifying until ``verify_until``, and each cached context expires at the
+    earlier of its own ``exp`` and its key's window.
+    """
+
+    def __init__(self, keyring, **kwargs):
+        super().__init__(None, **kwargs)
+        self.keyring = keyring
+
+    def _verify(self, token, now, key):
+        header, signing_input, payload_b64, signature = auth_cache.parse_token(token)
+        kid = header.get("kid")
+        signing_key = self.keyring.get(kid) if isinstance(kid, str) else None
+        if signing_key is None:
+            raise auth_cache.InvalidTokenError("Unknown signing key")
+        if signing_key.verify_until is not None and signing_key.verify_until <= now:
+            raise auth_cache.InvalidTokenError("Signing key has been retired")
+        if not signing_key.hs512.verify(signing_input, signature):
+            raise auth_cache.InvalidTokenError("Signature verification failed")
+        claims = auth_cache.check_claims(payload_b64, now, self.audience, self.require_exp, self.leeway)
+        context = auth_cache.UserContext(claims, kid)
+        if signing_key.verify_until is not None and (
+                context.expires_at is None or context.expires_at > signing_key.verify_until):
+            context.expires_at = signing_key.verify_until
+        return context
+
+
+# ------ نسخة مشتركة على مستوى العملية ------
+_keyring = None
+_init_lock = threading.Lock()
+
+
+def get_keyring():
+    global _keyring
+    if _keyring is None:
+        with _init_lock:
+            if _keyring is None:
+                _keyring = Keyring(KeyStore())
+    return _keyring
@@ -0,0 +1,603 @@
+# llm_backend.py - واجهة موحدة لنماذج اللغة مع بديل محلي للقياس دون شبكة
+import asyncio
+import hashlib
+import itertools
+import http.client
+import json
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+import monitoring
+
+logger = logging.getLogger(__name__)
+
+LLM_BACKEND = os.getenv("LLM_BACKEND", "openai")
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4-turbo")
+LLM_BASE_URL = os.getenv("LLM_BASE_URL", "http://127.0.0.1:8089/v1")
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_RETRY_BACKOFF = float(os.getenv("LLM_RETRY_BACKOFF", "0.5"))
+
+
+class LLMError(Exception):
+    pass
+
+
+class TransientLLMError(LLMError):
+    """Timeouts, connection resets, 429 and 5xx: safe to retry."""
+
+
+# ------ الواجهة الأساسية ------
+class LLMBackend:
+    def __init__(self, model=LLM_MODEL, timeout=LLM_TIMEOUT, max_retries=LLM_MAX_RETRIES,
+                 retry_backoff=LLM_RETRY_BACKOFF):
+        self.model = model
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.latency = monitoring.latency("llm_request_seconds", "Latency of one LLM completion")
+        self.retries = monitoring.counter("llm_retries_total", "LLM requests retried after a transient error")
+        self.failures = monitoring.counter("llm_failures_total", "LLM requests that failed after all retries")
+        self.first_token = monitoring.latency("llm_first_token_seconds", "Time to the first streamed piece")
+
+    def _params(self, model, temperature, max_tokens):
+        return {
+            "model": model or self.model,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+        }
+
+    def _retry_delay(self, attempt, error):
+        if attempt > self.max_retries:
+            self.failures.inc()
+            raise error
+        self.retries.inc()
+        # تأخير أسي مع عشوائية لتجنب موجات إعادة المحاولة المتزامنة
+        delay = self.retry_backoff * (2 ** (attempt - 1)) * (0.5 + random.random())
+        logger.warning("LLM request failed (%s), retry %d in %.2fs", error, attempt, delay)
+        return delay
+
+    def complete(self, messages, model=None, temperature=0.7, max_tokens=1000, timeout=None):
+        """Return the assistant text for ``messages``, retrying transient failures."""
+        params = self._params(model, temperature, max_tokens)
+        timeout = timeout or self.timeout
+        attempt = 0
+        while True:
+            try:
+                with self.latency.time():
+                    return self._complete(messages, params, timeout)
+            except TransientLLMError as e:
+                attempt += 1
+                time.sleep(self._retry_delay(attempt, e))
+
+    async def acomplete(self, messages, model=None, temperature=0.7, max_tokens=1000, timeout=None):
+        """``complete`` for the event loop: same retries, awaiting instead of holding a thread."""
+        params = self._params(model, temperature, max_tokens)
+        timeout = timeout or self.timeout
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            try:
+                result = await self._acomplete(messages, params, timeout)
+                self.latency.observe(time.perf_counter() - start)
+                return result
+            except TransientLLMError as e:
+                attempt += 1
+                await asyncio.sleep(self._retry_delay(attempt, e))
+
+    def stream(self, messages, model=None, temperature=0.7, max_tokens=1000, timeout=None):
+        """Yield the assistant text in pieces as the model generates it.
+
+        Transient failures are retried only before the first piece. Closing the
+        generator early closes the upstream request, so generation stops.
+        """
+        params = self._params(model, temperature, max_tokens)
+        timeout = timeout or self.timeout
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            pieces = self._stream(messages, params, timeout)
+            started = False
+            try:
+                for piece in pieces:
+                    if not started:
+                        started = True
+                        self.first_token.observe(time.perf_counter() - start)
+                    yield piece
+                self.latency.observe(time.perf_counter() - start)
+                return
+            except TransientLLMError as e:
+                if started:
+                    # جزء من النص وصل للعميل بالفعل؛ الإعادة ستكرره
+                    self.failures.inc()
+                    raise
+                attempt += 1
+                delay = self._retry_delay(attempt, e)
+            finally:
+                pieces.close()
+            time.sleep(delay)
+
+    async def astream(self, messages, model=None, temperature=0.7, max_tokens=1000, timeout=None):
+        """``stream`` for the event loop; cancelling the consumer closes the upstream request."""
+        params = self._params(model, temperature, max_tokens)
+        timeout = timeout or self.timeout
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            pieces = self._astream(messages, params, timeout)
+            started = False
+            try:
+                async for piece in pieces:
+                    if not started:
+                        started = True
+                        self.first_token.observe(time.perf_counter() - start)
+                    yield piece
+                self.latency.observe(time.perf_counter() - start)
+                return
+            except TransientLLMError as e:
+                if started:
+                    self.failures.inc()
+                    raise
+                attempt += 1
+                delay = self._retry_delay(attempt, e)
+            finally:
+                await pieces.aclose()
+            await asyncio.sleep(delay)
+
+    async def _acomplete(self, messages, params, timeout):
+        # الخلفيات التي ليس لها عميل غير متزامن تعمل في خيط حتى لا تحجز حلقة الأحداث
+        return await asyncio.to_thread(self._complete, messages, params, timeout)
+
+    def _stream(self, messages, params, timeout):
+        # الخلفيات التي لا تدعم البث تُرسل النص كاملاً كقطعة واحدة
+        yield self._complete(messages, params, timeout)
+
+    async def _astream(self, messages, params, timeout):
+        yield await self._acomplete(messages, params, timeout)
+
+    def _complete(self, messages, params, timeout):
+        raise NotImplementedError
+
+
+# ------ OpenAI ------
+class OpenAIBackend(LLMBackend):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        import openai
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.openai = openai
+        openai.api_key = os.getenv("OPENAI_API_KEY")
+        # جلسة واحدة مشتركة: إعادة استخدام اتصالات TLS بدلاً من مصافحة لكل طلب
+        session = requests.Session()
+        session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=64))
+        openai.requestssession = session
+
+    @contextmanager
+    def _errors(self):
+        errors = self.openai.error
+        try:
+            yield
+        except (errors.Timeout, errors.APIConnectionError, errors.RateLimitError,
+                errors.ServiceUnavailableError, errors.TryAgain) as e:
+            raise TransientLLMError(str(e)) from e
+        except errors.APIError as e:
+            if getattr(e, "http_status", None) and e.http_status >= 500:
+                raise TransientLLMError(str(e)) from e
+            raise LLMError(str(e)) from e
+
+    def _complete(self, messages, params, timeout):
+        with self._errors():
+            response = self.openai.ChatCompletion.create(
+                messages=messages, request_timeout=timeout, **params)
+        return response.choices[0].message.content
+
+    def _stream(self, messages, params, timeout):
+        with self._errors():
+            chunks = self.openai.ChatCompletion.create(
+                messages=messages, request_timeout=timeout, stream=True, **params)
+            try:
+                for chunk in chunks:
+                    piece = chunk.choices[0].delta.get("content")
+                    if piece:
+                        yield piece
+            finally:
+                # إغلاق المولّد يغلق استجابة requests، فيتوقف التوليد لدى OpenAI
+                close = getattr(chunks, "close", None)
+                if close is not None:
+                    close()
+
+
+# ------ خادم متوافق مع OpenAI عبر HTTP (مثل الخادم المحلي الوهمي) ------
+class HTTPBackend(LLMBackend):
+    """OpenAI-compatible ``/chat/completions`` client.
+
+    ``complete`` keeps one keep-alive connection per thread; ``acomplete``
+    draws from a pool of asyncio stream connections, so thousands of pending
+    completions cost sockets rather than threads.
+    """
+
+    def __init__(self, base_url=LLM_BASE_URL, api_key=None, **kwargs):
+        super().__init__(**kwargs)
+        url = urlparse(base_url)
+        self.scheme = url.scheme
+        self.host = url.hostname
+        self.port = url.port
+        self.path = url.path.rstrip("/") + "/chat/completions"
+        self.api_key = api_key or os.getenv("OPENAI_API_KEY", "")
+        self._local = threading.local()
+        # اتصالات keep-alive غير متزامنة؛ مرتبطة بحلقة الأحداث التي أنشأتها
+        self._async_idle = []
+        self._async_loop = None
+
+    def _connection(self, timeout):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            cls = http.client.HTTPSConnection if self.scheme == "https" else http.client.HTTPConnection
+            conn = cls(self.host, self.port, timeout=timeout)
+            self._local.conn = conn
+        conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+        return conn
+
+    def _drop_connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def _complete(self, messages, params, timeout):
+        body = json.dumps({"messages": messages, **params})
+        headers = {"Content-Type": "application/json", "Authorization": f"Bearer {self.api_key}"}
+        try:
+            conn = self._connection(timeout)
+            conn.request("POST", self.path, body=body, headers=headers)
+            response = conn.getresponse()
+            payload = response.read()
+        except (OSError, http.client.HTTPException) as e:
+            self._drop_connection()
+            raise TransientLLMError(str(e)) from e
+        if response.status == 429 or response.status >= 500:
+            raise TransientLLMError(f"HTTP {response.status}")
+        if response.status != 200:
+            raise LLMError(f"HTTP {response.status}: {payload[:200]!r}")
+        return json.loads(payload)["choices"][0]["message"]["content"]
+
+    @staticmethod
+    def _delta(line):
+        """Text carried by one SSE line of a streamed completion; ``None`` at ``[DONE]``."""
+        if not line.startswith(b"data:"):
+            return ""
+        data = line[5:].strip()
+        if data == b"[DONE]":
+            return None
+        return json.loads(data)["choices"][0]["delta"].get("content") or ""
+
+    def _stream(self, messages, params, timeout):
+        body = json.dumps({"messages": messages, **params, "stream": True})
+        headers = {"Content-Type": "application/json", "Authorization": f"Bearer {self.api_key}",
+                   "Accept": "text/event-stream"}
+        finished = False
+        try:
+            try:
+                conn = self._connection(timeout)
+                conn.request("POST", self.path, body=body, headers=headers)
+                response = conn.getresponse()
+                if response.status != 200:
+                    payload = response.read()
+                    finished = True
+            except (OSError, http.client.HTTPException) as e:
+                raise TransientLLMError(str(e)) from e
+            if response.status == 429 or response.status >= 500:
+                raise TransientLLMError(f"HTTP {response.status}")
+            if response.status != 200:
+                raise LLMError(f"HTTP {response.status}: {payload[:200]!r}")
+            while True:
+                try:
+                    line = response.readline()
+                except (OSError, http.client.HTTPException) as e:
+                    raise TransientLLMError(str(e)) from e
+                if not line:
+                    raise TransientLLMError("stream ended before [DONE]")
+                piece = self._delta(line)
+                if piece is None:
+                    response.read()
+                    finished = True
+                    return
+                if piece:
+                    yield piece
+        finally:
+            # بث لم يكتمل (انقطاع العميل أو خطأ): إغلاق الاتصال يوقف التوليد في الخادم
+            if not finished:
+                self._drop_connection()
+
+    # ------ العميل غير المتزامن ------
+    async def _aconnection(self):
+        loop = asyncio.get_running_loop()
+        if self._async_loop is not loop:
+            self._async_idle = []
+            self._async_loop = loop
+        if self._async_idle:
+            return self._async_idle.pop()
+        port = self.port or (443 if self.scheme == "https" else 80)
+        return await asyncio.open_connection(self.host, port, ssl=self.scheme == "https" or None)
+
+    def _arequest(self, body, extra_headers=()):
+        head = [f"POST {self.path} HTTP/1.1", f"Host: {self.host}", "Content-Type: application/json",
+                f"Authorization: Bearer {self.api_key}", f"Content-Length: {len(body)}", *extra_headers]
+        return ("\r\n".join(head) + "\r\n\r\n").encode() + body
+
+    @staticmethod
+    async def _aread_head(reader):
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionError("connection closed by LLM server")
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        return status, headers
+
+    @staticmethod
+    async def _aiter_body(reader, headers):
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            while True:
+                size = int((await reader.readline()).split(b";")[0], 16)
+                if size == 0:
+                    await reader.readline()
+                    return
+                yield await reader.readexactly(size)
+                await reader.readexactly(2)
+        elif "content-length" in headers:
+            yield await reader.readexactly(int(headers["content-length"]))
+        else:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    return
+                yield data
+
+    async def _acomplete(self, messages, params, timeout):
+        body = json.dumps({"messages": messages, **params}).encode()
+        conn = []
+
+        async def exchange():
+            conn.append(await self._aconnection())
+            reader, writer = conn[0]
+            writer.write(self._arequest(body))
+            await writer.drain()
+            status, headers = await self._aread_head(reader)
+            payload = b"".join([chunk async for chunk in self._aiter_body(reader, headers)])
+            return status, headers, payload
+
+        reusable = False
+        try:
+            status, headers, payload = await asyncio.wait_for(exchange(), timeout)
+            reusable = headers.get("connection", "").lower() != "close" and (
+                "content-length" in headers or "transfer-encoding" in headers)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError, IndexError) as e:
+            raise TransientLLMError(str(e) or type(e).__name__) from e
+        finally:
+            # اتصال قُطع في منتصف الاستجابة (خطأ أو إلغاء) لا يعود إلى المجمع
+            if conn:
+                if reusable:
+                    self._async_idle.append(conn[0])
+                else:
+                    conn[0][1].close()
+        if status == 429 or status >= 500:
+            raise TransientLLMError(f"HTTP {status}")
+        if status != 200:
+            raise LLMError(f"HTTP {status}: {payload[:200]!r}")
+        return json.loads(payload)["choices"][0]["message"]["content"]
+
+    async def _astream(self, messages, params, timeout):
+        body = json.dumps({"messages": messages, **params, "stream": True}).encode()
+        conn = None
+        reusable = False
+        try:
+            try:
+                conn = await asyncio.wait_for(self._aconnection(), timeout)
+                reader, writer = conn
+                writer.write(self._arequest(body, ["Accept: text/event-stream"]))
+                await writer.drain()
+                status, headers = await asyncio.wait_for(self._aread_head(reader), timeout)
+                chunks = self._aiter_body(reader, headers)
+                if status != 200:
+                    payload = b"".join([chunk async for chunk in chunks])
+                    if status == 429 or status >= 500:
+                        raise TransientLLMError(f"HTTP {status}")
+                    raise LLMError(f"HTTP {status}: {payload[:200]!r}")
+                buffer = b""
+                while True:
+                    # المهلة لكل قطعة لا للبث كله: التوليد الطويل مسموح ما دام النص يتدفق
+                    chunk = await asyncio.wait_for(chunks.__anext__(), timeout)
+                    buffer += chunk
+                    *lines, buffer = buffer.split(b"\n")
+                    for line in lines:
+                        piece = self._delta(line)
+                        if piece is None:
+                            async for _ in chunks:
+                                pass
+                            reusable = headers.get("connection", "").lower() != "close"
+                            return
+                        if piece:
+                            yield piece
+            except StopAsyncIteration:
+                raise TransientLLMError("stream ended before [DONE]")
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError, IndexError) as e:
+                raise TransientLLMError(str(e) or type(e).__name__) from e
+        finally:
+            if conn is not None:
+                if reusable:
+                    self._async_idle.append(conn)
+                else:
+                    conn[1].close()
+
+
+# ------ بديل محلي حتمي ------
+def deterministic_reply(messages, max_tokens):
+    """Same prompt -> same text, roughly ``max_tokens`` words long."""
+    digest = hashlib.sha256(json.dumps(messages, sort_keys=True).encode()).hexdigest()
+    words = [digest[i:i + 6] for i in range(0, len(digest), 6)]
+    return " ".join(words[i % len(words)] for i in range(max_tokens))
+
+
+class StubBackend(LLMBackend):
+    """In-process stand-in: fixed first-token latency plus a tokens/sec generation rate."""
+
+    def __init__(self, latency=0.2, tokens_per_second=200.0, reply_tokens=None, **kwargs):
+        super().__init__(**kwargs)
+        self.first_token_latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.reply_tokens = reply_tokens
+
+    def _plan(self, params):
+        tokens = min(self.reply_tokens or params["max_tokens"], params["max_tokens"])
+        return tokens, self.first_token_latency + tokens / self.tokens_per_second
+
+    def _complete(self, messages, params, timeout):
+        tokens, delay = self._plan(params)
+        if delay > timeout:
+            time.sleep(timeout)
+            raise TransientLLMError("stub backend timed out")
+        time.sleep(delay)
+        return deterministic_reply(messages, tokens)
+
+    async def _acomplete(self, messages, params, timeout):
+        tokens, delay = self._plan(params)
+        if delay > timeout:
+            await asyncio.sleep(timeout)
+            raise TransientLLMError("stub backend timed out")
+        await asyncio.sleep(delay)
+        return deterministic_reply(messages, tokens)
+
+    def _pieces(self, messages, params):
+        tokens, _ = self._plan(params)
+        words = deterministic_reply(messages, tokens).split(" ")
+        # القطع مجتمعة تساوي نص _complete حرفياً
+        return [words[0]] + [" " + word for word in words[1:]]
+
+    def _stream(self, messages, params, timeout):
+        time.sleep(self.first_token_latency)
+        for piece in self._pieces(messages, params):
+            yield piece
+            time.sleep(1 / self.tokens_per_second)
+
+    async def _astream(self, messages, params, timeout):
+        await asyncio.sleep(self.first_token_latency)
+        for piece in self._pieces(messages, params):
+            yield piece
+            await asyncio.sleep(1 / self.tokens_per_second)
+
+
+class MockLLMServer:
+    """Local OpenAI-compatible HTTP server backed by the same timing model as StubBackend."""
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.2, tokens_per_second=200.0,
+                 reply_tokens=None):
+        stub = StubBackend(latency=latency, tokens_per_second=tokens_per_second,
+                           reply_tokens=reply_tokens, max_retries=0)
+        mock = self
+        # عدد البثوث التي أغلقها العميل قبل [DONE]، للتحقق من إلغاء التوليد
+        self.streams_abandoned = 0
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                params = {"max_tokens": request.get("max_tokens", 1000)}
+                if request.get("stream"):
+                    self.stream(stub._stream(request["messages"], params, float("inf")))
+                    return
+                content = stub._complete(request["messages"], params, float("inf"))
+                body = json.dumps({
+                    "object": "chat.completion",
+                    "model": request.get("model"),
+                    "choices": [{"index": 0, "finish_reason": "stop",
+                                 "message": {"role": "assistant", "content": content}}],
+                }).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def stream(self, pieces):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                events = (json.dumps({"choices": [{"index": 0, "delta": {"content": piece}}]}) for piece in pieces)
+                try:
+                    for data in itertools.chain(events, ["[DONE]"]):
+                        event = f"data: {data}\n\n".encode()
+                        self.wfile.write(b"%x\r\n" % len(event) + event + b"\r\n")
+                        self.wfile.flush()
+                    self.wfile.write(b"0\r\n\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    mock.streams_abandoned += 1
+                    self.close_connection = True
+
+            def log_message(self, *args):
+                pass
+
+        class Server(ThreadingHTTPServer):
+            # الافتراضي 5 يُسقط الاتصالات عند مئات الطلبات المتزامنة في القياسات
+            request_queue_size = 1024
+
+        self.server = Server((host, port), Handler)
+        self.server.daemon_threads = True
+        self.base_url = f"http://{host}:{self.server.server_address[1]}/v1"
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name="mock-llm", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+# ------ الاختيار حسب الإعدادات ------
+_backend = None
+_lock = threading.Lock()
+
+
+def create_backend(kind=LLM_BACKEND, **kwargs):
+    if kind == "openai":
+        return OpenAIBackend(**kwargs)
+    if kind == "http":
+        return HTTPBackend(**kwargs)
+    if kind == "stub":
+        return StubBackend(**kwargs)
+    raise ValueError(f"unknown LLM backend: {kind}")
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _lock:
+            if _backend is None:
+                _backend = create_backend()
+    return _backend
+
+
+def set_backend(backend):
+    global _backend
+    with _lock:
+        _backend = backend
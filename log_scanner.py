@@ -0,0 +1,258 @@
+# log_scanner.py - مسح السجلات بأنماط متعددة مجمّعة، تدفق بكتل كبيرة، ومتابعة tail -f مع تدوير الملفات
+import collections
+import logging
+import os
+import re
+import threading
+import time
+from datetime import datetime
+
+import monitoring
+
+logger = logging.getLogger(__name__)
+
+SCAN_BLOCK_SIZE = 4 * 1024 * 1024
+SCAN_MAX_LINE = 1024 * 1024
+ALERT_WINDOW_SECONDS = 60
+# بداية السطر كما يكتبها setup_logger: '%(asctime)s | %(levelname)s | %(message)s'
+TIMESTAMP_PREFIX = 19
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+_REGEX_META = set(".^$*+?{}[]\\|()")
+
+
+class Alert:
+    __slots__ = ("pattern", "count", "window", "threshold", "at", "line")
+
+    def __init__(self, pattern, count, window, threshold, at, line):
+        self.pattern = pattern
+        self.count = count
+        self.window = window
+        self.threshold = threshold
+        self.at = at
+        self.line = line
+
+    def __repr__(self):
+        return f"Alert({self.pattern!r}, {self.count} in {self.window}s >= {self.threshold})"
+
+
+class PatternSet:
+    """All patterns combined into one regex, so a block is walked once.
+
+    The alternation only locates lines holding at least one match; each such
+    line is then tested against every pattern (``in`` for plain literals,
+    ``search`` otherwise), so patterns overlapping on one line are all
+    counted. Matching lines are rare in logs, so the cost stays one pass
+    over the block however many patterns there are.
+    """
+
+    def __init__(self, patterns):
+        self.names = list(patterns)
+        self.tests = []
+        for name, pattern in patterns.items():
+            if _REGEX_META.isdisjoint(pattern):
+                self.tests.append((name, pattern.encode(), None))
+            else:
+                self.tests.append((name, None, re.compile(pattern.encode(), re.MULTILINE)))
+        # MULTILINE: ^ و$ تعنيان بداية ونهاية السطر في الكتلة كما في اختبار السطر منفرداً
+        self.combined = re.compile(b"|".join(b"(?:%s)" % (re.escape(literal) if literal is not None else regex.pattern)
+                                             for _, literal, regex in self.tests), re.MULTILINE)
+
+    def lines(self, block):
+        """Yield ``(start, end, names)`` for every line of ``block`` matching at least one pattern."""
+        search = self.combined.search
+        pos = 0
+        while True:
+            match = search(block, pos)
+            if match is None:
+                return
+            start = block.rfind(b"\n", 0, match.start()) + 1
+            end = block.find(b"\n", match.start())
+            if end == -1:
+                end = len(block)
+            line = block[start:end]
+            names = [name for name, literal, regex in self.tests
+                     if (literal in line if literal is not None else regex.search(line))]
+            if names:
+                yield start, end, names
+            pos = end + 1
+
+
+class WindowCounter:
+    """Per-second buckets over a sliding window of ``window`` seconds."""
+
+    def __init__(self, window):
+        self.window = window
+        self._buckets = collections.deque()
+        self.total = 0
+
+    def add(self, second, count=1):
+        if self._buckets and self._buckets[-1][0] == second:
+            self._buckets[-1][1] += count
+        else:
+            self._buckets.append([second, count])
+        self.total += count
+        self.expire(second)
+
+    def expire(self, now):
+        horizon = now - self.window
+        while self._buckets and self._buckets[0][0] <= horizon:
+            self.total -= self._buckets.popleft()[1]
+        return self.total
+
+
+class LogAnalyzer:
+    """Count pattern hits per line in sliding windows and raise alerts past thresholds.
+
+    Blocks are scanned as bytes; only matching lines are decoded and have
+    their timestamp parsed. An incomplete trailing line is carried into the
+    next block, so a match is never split; a line still unterminated past
+    ``max_line`` bytes is scanned as it is, keeping the carry bounded. An alert fires once when a
+    pattern's window count reaches its threshold and re-arms when it drops
+    back below.
+    """
+
+    def __init__(self, patterns, window=ALERT_WINDOW_SECONDS, thresholds=None, on_alert=None,
+                 block_size=SCAN_BLOCK_SIZE, max_line=SCAN_MAX_LINE):
+        self.patterns = PatternSet(patterns)
+        self.max_line = max_line
+        self.window = window
+        self.thresholds = dict(thresholds or {})
+        self.on_alert = on_alert or self._log_alert
+        self.block_size = block_size
+        self.totals = collections.Counter()
+        self._windows = {name: WindowCounter(window) for name in self.patterns.names}
+        self._armed = {name: True for name in self.patterns.names}
+        self._carry = b""
+        self._seconds = {}
+        self._lock = threading.Lock()
+        self.bytes_scanned = monitoring.counter("log_scanner_bytes_total", "Log bytes scanned")
+        self.matches = monitoring.counter("log_scanner_matches_total", "Log lines matching an alert pattern")
+        self.alerts = monitoring.counter("log_scanner_alerts_total", "Log pattern alerts raised")
+
+    @staticmethod
+    def _log_alert(alert):
+        logger.warning("Log alert %s: %d matches in %ds (threshold %d)",
+                       alert.pattern, alert.count, alert.window, alert.threshold)
+
+    def _second(self, line):
+        prefix = line[:TIMESTAMP_PREFIX]
+        second = self._seconds.get(prefix)
+        if second is None:
+            try:
+                second = int(datetime.strptime(prefix.decode("ascii"), TIMESTAMP_FORMAT).timestamp())
+            except (UnicodeDecodeError, ValueError):
+                return int(time.time())
+            if len(self._seconds) > 4096:
+                self._seconds.clear()
+            self._seconds[prefix] = second
+        return second
+
+    def feed(self, data, final=False):
+        """Scan the next piece of the stream; returns the number of matching (pattern, line) pairs."""
+        with self._lock:
+            block = self._carry + data if self._carry else data
+            cut = len(block) if final else block.rfind(b"\n") + 1
+            if cut == 0 and len(block) > self.max_line:
+                # سطر بلا نهاية أطول من max_line يُمسح كما هو بدل أن يكبر الباقي بلا حد
+                cut = len(block)
+            self._carry = block[cut:]
+            if cut == 0:
+                return 0
+            if cut != len(block):
+                block = block[:cut]
+            self.bytes_scanned.inc(len(block))
+            hits = 0
+            # كل سطر يُحسب مرة واحدة لكل نمط يطابقه
+            for start, end, names in self.patterns.lines(block):
+                line = block[start:end]
+                for name in names:
+                    self._record(name, line)
+                hits += len(names)
+            self.matches.inc(hits)
+            return hits
+
+    def _record(self, name, line):
+        self.totals[name] += 1
+        second = self._second(line)
+        counter = self._windows[name]
+        counter.add(second)
+        threshold = self.thresholds.get(name)
+        if threshold is None:
+            return
+        if counter.total >= threshold and self._armed[name]:
+            self._armed[name] = False
+            self.alerts.inc()
+            self.on_alert(Alert(name, counter.total, self.window, threshold, second,
+                                line.decode("utf-8", "replace")))
+        elif counter.total < threshold:
+            self._armed[name] = True
+
+    def window_counts(self, now=None):
+        now = int(time.time()) if now is None else now
+        with self._lock:
+            return {name: counter.expire(now) for name, counter in self._windows.items()}
+
+    # ------ المصادر ------
+    def scan_file(self, path):
+        """Scan a whole file in ``block_size`` reads; returns the running totals."""
+        with open(path, "rb", buffering=0) as f:
+            while True:
+                block = f.read(self.block_size)
+                if not block:
+                    break
+                self.feed(block)
+        self.feed(b"", final=True)
+        return dict(self.totals)
+
+    def follow(self, path, stop=None, poll_interval=0.5, from_start=False):
+        """Follow ``path`` like ``tail -F`` until ``stop`` is set.
+
+        Rotation by ``RotatingFileHandler`` (rename to ``.1`` and create a new
+        file) is detected by inode change: the old handle is drained to EOF
+        before the new file is opened from the start. Truncation in place
+        rewinds to the beginning.
+        """
+        stop = stop or threading.Event()
+        f = None
+        inode = None
+        try:
+            while not stop.is_set():
+                if f is None:
+                    try:
+                        f = open(path, "rb", buffering=0)
+                    except FileNotFoundError:
+                        stop.wait(poll_interval)
+                        continue
+                    inode = os.fstat(f.fileno()).st_ino
+                    if not from_start:
+                        f.seek(0, os.SEEK_END)
+                    from_start = True  # كل ملف جديد بعد التدوير يُقرأ من بدايته
+                block = f.read(self.block_size)
+                if block:
+                    self.feed(block)
+                    continue
+                try:
+                    current = os.stat(path)
+                except FileNotFoundError:
+                    current = None
+                if current is None or current.st_ino != inode:
+                    # تم التدوير: ما بقي في الملف القديم قُرئ أعلاه، السطر الأخير غير المكتمل يُغلق هنا
+                    self.feed(b"", final=True)
+                    f.close()
+                    f = None
+                    continue
+                if current.st_size < f.tell():
+                    f.seek(0)
+                    self._carry = b""
+                    continue
+                stop.wait(poll_interval)
+        finally:
+            if f is not None:
+                f.close()
+
+    def start_follow(self, path, poll_interval=0.5):
+        """Run ``follow`` on a daemon thread; returns the event that stops it."""
+        stop = threading.Event()
+        threading.Thread(target=self.follow, args=(path, stop, poll_interval), name="log-follow",
+                         daemon=True).start()
+        return stop
@@ -0,0 +1,200 @@
+# model_registry.py - تحميل النماذج مرة واحدة لكل عملية ومشاركتها بين الخيوط
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import monitoring
+
+logger = logging.getLogger(__name__)
+
+MODEL_MEMORY_BUDGET = int(os.getenv("MODEL_MEMORY_BUDGET_MB", "16384")) * 1024 * 1024
+PRELOAD_MODELS = [name for name in os.getenv("PRELOAD_MODELS", "").split(",") if name]
+
+
+def estimate_size(obj):
+    """Bytes held by torch parameters/buffers reachable from ``obj`` (0 if unknown)."""
+    if isinstance(obj, (tuple, list)):
+        return sum(estimate_size(item) for item in obj)
+    model = getattr(obj, "model", obj)  # transformers.pipeline يحمل النموذج في .model
+    total = 0
+    for attr in ("parameters", "buffers"):
+        tensors = getattr(model, attr, None)
+        if callable(tensors):
+            try:
+                total += sum(t.numel() * t.element_size() for t in tensors())
+            except TypeError:
+                return 0
+    return total
+
+
+class _Entry:
+    __slots__ = ("loader", "size_hint", "value", "size", "last_used", "in_use", "lock")
+
+    def __init__(self, loader, size_hint):
+        self.loader = loader
+        self.size_hint = size_hint
+        self.value = None
+        self.size = 0
+        self.last_used = 0.0
+        self.in_use = 0
+        self.lock = threading.Lock()
+
+
+class ModelRegistry:
+    """Lazily loads each registered model once and hands the same instance to every thread.
+
+    When a load would exceed ``memory_budget`` bytes, the least recently used
+    models that no caller currently holds through ``lease()`` are dropped.
+    """
+
+    def __init__(self, memory_budget=MODEL_MEMORY_BUDGET):
+        self.memory_budget = memory_budget
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.loads = monitoring.counter("model_registry_loads_total", "Models loaded into memory")
+        self.evictions = monitoring.counter("model_registry_evictions_total", "Models evicted from memory")
+        self.resident = monitoring.gauge("model_registry_resident_bytes", "Estimated bytes held by loaded models")
+        self.load_latency = monitoring.latency("model_registry_load_seconds", "Time to load one model")
+
+    def register(self, name, loader, size_hint=0):
+        with self._lock:
+            if name in self._entries:
+                raise ValueError(f"model already registered: {name}")
+            self._entries[name] = _Entry(loader, size_hint)
+
+    def _entry(self, name):
+        try:
+            return self._entries[name]
+        except KeyError:
+            raise KeyError(f"unknown model: {name}") from None
+
+    def get(self, name):
+        """The loaded model; callers should fetch it per use rather than keep it.
+
+        The value is read under the registry lock, the same lock eviction
+        holds, so a concurrent eviction can never hand back ``None``.
+        """
+        entry = self._entry(name)
+        with self._lock:
+            entry.last_used = time.monotonic()
+            value = entry.value
+        if value is not None:
+            return value
+        # قفل لكل نموذج: تحميل نموذج كبير لا يوقف الوصول إلى النماذج الأخرى
+        with entry.lock:
+            with self._lock:
+                value = entry.value
+            if value is None:
+                self._make_room(entry.size_hint, exclude=name)
+                logger.info("Loading model %s", name)
+                with self.load_latency.time():
+                    value = entry.loader()
+                size = estimate_size(value) or entry.size_hint
+                with self._lock:
+                    entry.size = size
+                    entry.value = value
+                    entry.last_used = time.monotonic()
+                self.loads.inc()
+                self._update_resident()
+        return value
+
+    @contextmanager
+    def lease(self, name):
+        """Use a model while guaranteeing it is not evicted in the meantime."""
+        entry = self._entry(name)
+        with self._lock:
+            entry.in_use += 1
+        try:
+            yield self.get(name)
+        finally:
+            with self._lock:
+                entry.in_use -= 1
+
+    def _resident_bytes(self):
+        return sum(e.size for e in self._entries.values() if e.value is not None)
+
+    def _update_resident(self):
+        with self._lock:
+            self.resident.set(self._resident_bytes())
+
+    def _make_room(self, needed, exclude=None):
+        with self._lock:
+            if not self.memory_budget:
+                return
+            candidates = sorted(
+                (e for n, e in self._entries.items()
+                 if n != exclude and e.value is not None and e.in_use == 0),
+                key=lambda e: e.last_used)
+            for entry in candidates:
+                if self._resident_bytes() + needed <= self.memory_budget:
+                    break
+                self._drop(entry)
+
+    def _drop(self, entry):
+        entry.value = None
+        entry.size = 0
+        self.evictions.inc()
+
+    def evict_idle(self, max_idle):
+        """Drop models nobody has used for ``max_idle`` seconds."""
+        cutoff = time.monotonic() - max_idle
+        with self._lock:
+            for name, entry in self._entries.items():
+                if entry.value is not None and entry.in_use == 0 and entry.last_used < cutoff:
+                    logger.info("Evicting idle model %s", name)
+                    self._drop(entry)
+        self._update_resident()
+
+    def preload(self, names=None):
+        """Load models at worker boot so the first request does not pay for it."""
+        for name in (PRELOAD_MODELS if names is None else names):
+            self.get(name)
+
+    def loaded(self):
+        with self._lock:
+            return [name for name, entry in self._entries.items() if entry.value is not None]
+
+
+# ------ النماذج المستخدمة في التطبيق ------
+def _pipeline(task, model):
+    def load():
+        from transformers import pipeline
+        return pipeline(task, model=model)
+    return load
+
+
+def _seq2seq_t5():
+    from transformers import T5ForConditionalGeneration, T5Tokenizer
+    return (T5ForConditionalGeneration.from_pretrained("t5-large"),
+            T5Tokenizer.from_pretrained("t5-large"))
+
+
+def _spacy_lg():
+    import spacy
+    return spacy.load("en_core_web_lg")
+
+
+def _deberta_classifier():
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer
+    model = AutoModelForSequenceClassification.from_pretrained(
+        "microsoft/deberta-v3-large",
+        num_labels=5,
+        problem_type="multi_label_classification"
+    )
+    return model.eval(), AutoTokenizer.from_pretrained("microsoft/deberta-v3-large")
+
+
+# size_hint: أوزان fp32 (عدد المعاملات × 4 بايت)، فيُفسح المكان قبل التحميل لا بعده
+_MB = 1024 * 1024
+registry = ModelRegistry()
+registry.register("t5-large", _seq2seq_t5, size_hint=2950 * _MB)
+registry.register("en_core_web_lg", _spacy_lg, size_hint=800 * _MB)
+registry.register("sentiment", _pipeline("sentiment-analysis", "distilbert-base-uncased-finetuned-sst-2-english"),
+                  size_hint=270 * _MB)
+registry.register("gpt-neo-1.3B", _pipeline("text-generation", "gpt-neo-1.3B"), size_hint=5300 * _MB)
+registry.register("deberta-v3-large", _deberta_classifier, size_hint=1750 * _MB)
+registry.register("zero-shot", _pipeline("zero-shot-classification", "facebook/bart-large-mnli"),
+                  size_hint=1630 * _MB)
+registry.register("flan-t5-xxl", _pipeline("text2text-generation", "google/flan-t5-xxl"), size_hint=45000 * _MB)
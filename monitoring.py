@@ -0,0 +1,139 @@
+# monitoring.py - عدادات ومقاييس زمن الاستجابة المشتركة
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+try:
+    from prometheus_client import Counter, Gauge, Histogram
+except ImportError:  # يعمل بدون prometheus_client في الاختبارات والقياسات المحلية
+    Counter = Gauge = Histogram = None
+
+
+class _LocalValue:
+    def __init__(self):
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount=1):
+        with self._lock:
+            self._value -= amount
+
+    def set(self, value):
+        with self._lock:
+            self._value = value
+
+    def get(self):
+        return self._value
+
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+def _metric(kind, factory, name, documentation):
+    with _registry_lock:
+        if name not in _registry:
+            prom = factory(name, documentation) if factory is not None else None
+            _registry[name] = (kind, _LocalValue(), prom)
+        return _registry[name]
+
+
+class _Metric:
+    def __init__(self, entry):
+        _, self._local, self._prom = entry
+
+    def inc(self, amount=1):
+        self._local.inc(amount)
+        if self._prom is not None:
+            self._prom.inc(amount)
+
+    def dec(self, amount=1):
+        self._local.dec(amount)
+        if self._prom is not None:
+            self._prom.dec(amount)
+
+    def set(self, value):
+        self._local.set(value)
+        if self._prom is not None:
+            self._prom.set(value)
+
+    def get(self):
+        return self._local.get()
+
+
+def counter(name, documentation):
+    """Process-wide counter, mirrored to prometheus when it is installed."""
+    return _Metric(_metric("counter", Counter, name, documentation))
+
+
+def gauge(name, documentation):
+    return _Metric(_metric("gauge", Gauge, name, documentation))
+
+
+def snapshot():
+    with _registry_lock:
+        values = {name: entry[1].get() for name, entry in _registry.items()}
+        recorders = list(_recorders.values())
+    for recorder in recorders:
+        values[recorder.name] = recorder.summary()
+    return values
+
+
+# ------ قياس زمن الاستجابة (p50/p99) ------
+class LatencyRecorder:
+    """Keeps the last ``window`` samples so percentiles reflect recent traffic."""
+
+    def __init__(self, name, window=10000, histogram=None):
+        self.name = name
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._count = 0
+        self._histogram = histogram
+
+    def observe(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+            self._count += 1
+        if self._histogram is not None:
+            self._histogram.observe(seconds)
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def percentile(self, q):
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return 0.0
+        index = min(len(samples) - 1, int(round(q / 100.0 * (len(samples) - 1))))
+        return samples[index]
+
+    def summary(self):
+        return {
+            "count": self._count,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+        }
+
+
+_recorders = {}
+
+
+def latency(name, documentation):
+    """Process-wide latency recorder, also exported as a prometheus histogram."""
+    with _registry_lock:
+        if name not in _recorders:
+            histogram = Histogram(name, documentation) if Histogram is not None else None
+            _recorders[name] = LatencyRecorder(name, histogram=histogram)
+        return _recorders[name]
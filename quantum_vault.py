@@ -0,0 +1,221 @@
+# quantum_vault.py - تشفير بمفاتيح ذات إصدارات: مشفّر واحد طويل العمر لكل إصدار وتشفير متدفق للملفات الكبيرة
+import hashlib
+import logging
+import os
+import struct
+
+from cryptography.exceptions import InvalidTag
+from cryptography.fernet import Fernet, InvalidToken, MultiFernet
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+import monitoring
+
+logger = logging.getLogger(__name__)
+
+STREAM_CHUNK_SIZE = int(os.getenv("QUANTUM_VAULT_CHUNK_SIZE", str(1024 * 1024)))
+STREAM_MAGIC = b"QVS1"
+# MAGIC | key id (8) | chunk size (4) | nonce prefix (7)
+STREAM_HEADER = struct.Struct(">4s8sI7s")
+CHUNK_LENGTH = struct.Struct(">I")
+TAG_SIZE = 16
+
+
+class VaultKey:
+    """One key version: the Fernet cipher for fields, the AES-GCM cipher for streams
+    and a MAC key for content addressing."""
+
+    __slots__ = ("version", "key_id", "fernet", "aead", "mac_key")
+
+    def __init__(self, version, key):
+        key = key.encode() if isinstance(key, str) else key
+        self.version = version
+        self.key_id = hashlib.sha256(key).digest()[:8]
+        self.fernet = Fernet(key)
+        stream_key = HKDF(algorithm=hashes.SHA256(), length=32, salt=None,
+                          info=b"quantum-vault-stream").derive(key)
+        self.aead = AESGCM(stream_key)
+        self.mac_key = HKDF(algorithm=hashes.SHA256(), length=32, salt=None,
+                            info=b"quantum-vault-mac").derive(key)
+
+
+def read_full(src, size):
+    """Read exactly ``size`` bytes, fewer only at EOF; pipes and sockets may return short reads."""
+    data = src.read(size)
+    if len(data) == size or not data:
+        return data
+    parts = [data]
+    missing = size - len(data)
+    while missing:
+        data = src.read(missing)
+        if not data:
+            break
+        parts.append(data)
+        missing -= len(data)
+    return b"".join(parts)
+
+
+def chunk_nonce(prefix, index, final):
+    # STREAM: رقم القطعة وعلامة القطعة الأخيرة داخل الـ nonce يمنعان إعادة الترتيب والبتر
+    return prefix + struct.pack(">IB", index, 1 if final else 0)
+
+
+class QuantumVault:
+    """Field and stream encryption over a list of key versions (newest first).
+
+    Ciphers are built once per key version and reused for every call.
+    Fields are Fernet tokens, so values written before a rotation still
+    decrypt through ``MultiFernet``. Streams are cut into independently
+    authenticated AES-GCM chunks whose header names the key by id, so memory
+    stays bounded by ``chunk_size`` whatever the payload size.
+    """
+
+    def __init__(self, keys=None, chunk_size=STREAM_CHUNK_SIZE):
+        keys = list(keys) if keys else [Fernet.generate_key()]
+        self.chunk_size = chunk_size
+        self._raw_keys = keys
+        self.keys = [VaultKey(len(keys) - i, key) for i, key in enumerate(keys)]
+        self._by_id = {key.key_id: key for key in self.keys}
+        self._fernet = MultiFernet([key.fernet for key in self.keys])
+        self.bytes_encrypted = monitoring.counter("vault_stream_bytes_encrypted_total",
+                                                  "Plaintext bytes encrypted by QuantumVault streams")
+
+    @classmethod
+    def from_env(cls):
+        """Current key from ``QUANTUM_VAULT_KEY``, older versions from ``QUANTUM_VAULT_OLD_KEYS`` (comma separated).
+
+        ``QUANTUM_VAULT_KEY`` is required and the app refuses to start without
+        it: a random per-process key would make everything encrypted by this
+        process unreadable after a restart.
+        """
+        current = os.getenv("QUANTUM_VAULT_KEY")
+        if not current:
+            raise RuntimeError(
+                "QUANTUM_VAULT_KEY is not set. It is required so encrypted data survives restarts; generate one "
+                "with: python -c \"from cryptography.fernet import Fernet; print(Fernet.generate_key().decode())\" "
+                "and set the same value for every worker.")
+        old = [k for k in os.getenv("QUANTUM_VAULT_OLD_KEYS", "").split(",") if k]
+        return cls([current] + old)
+
+    @property
+    def current(self):
+        return self.keys[0]
+
+    def key_for_id(self, key_id):
+        """The key version whose 8-byte id appears in a stream or container header, or None."""
+        return self._by_id.get(key_id)
+
+    def rotate(self, key=None):
+        """Make ``key`` (or a fresh one) current; older versions remain usable for decryption."""
+        rotated = QuantumVault([key or Fernet.generate_key()] + self._raw_keys, self.chunk_size)
+        # استبدال ذري للحالة: المستدعون الجاريون يرون المجموعة القديمة أو الجديدة كاملة
+        self._raw_keys, self.keys, self._by_id, self._fernet = (
+            rotated._raw_keys, rotated.keys, rotated._by_id, rotated._fernet)
+
+    # ------ الحقول ------
+    def encrypt(self, text):
+        return self.current.fernet.encrypt(text.encode()).decode()
+
+    def decrypt(self, encrypted_text):
+        try:
+            return self._fernet.decrypt(encrypted_text.encode()).decode()
+        except (InvalidToken, AttributeError, UnicodeError) as e:
+            logger.error("Error decrypting text: %s", e)
+            return None
+
+    def encrypt_many(self, values):
+        """Encrypt a list of fields in one call; ``None`` entries are passed through."""
+        encrypt = self.current.fernet.encrypt
+        return [None if value is None else encrypt(
+            (value if isinstance(value, str) else str(value)).encode()).decode() for value in values]
+
+    def decrypt_many(self, values):
+        decrypt = self._fernet.decrypt
+        out = []
+        for value in values:
+            if value is None:
+                out.append(None)
+                continue
+            try:
+                out.append(decrypt(value.encode()).decode())
+            except (InvalidToken, UnicodeError) as e:
+                logger.error("Error decrypting text: %s", e)
+                out.append(None)
+        return out
+
+    def encrypt_record(self, record, fields):
+        """Return a copy of ``record`` with ``fields`` encrypted in one bulk call."""
+        present = [f for f in fields if f in record]
+        encrypted = self.encrypt_many([record[f] for f in present])
+        return {**record, **dict(zip(present, encrypted))}
+
+    # ------ التدفقات ------
+    def encrypt_stream(self, src, dst, chunk_size=None):
+        """Encrypt the readable binary ``src`` into ``dst`` chunk by chunk; returns plaintext bytes."""
+        chunk_size = chunk_size or self.chunk_size
+        key = self.current
+        prefix = os.urandom(7)
+        header = STREAM_HEADER.pack(STREAM_MAGIC, key.key_id, chunk_size, prefix)
+        dst.write(header)
+        total = 0
+        index = 0
+        chunk = read_full(src, chunk_size)
+        while True:
+            # قراءة قطعة مسبقاً لمعرفة ما إذا كانت الحالية هي الأخيرة؛ القطعة الناقصة لا تعني إلا EOF
+            following = read_full(src, chunk_size) if len(chunk) == chunk_size else b""
+            final = not following
+            sealed = key.aead.encrypt(chunk_nonce(prefix, index, final), chunk, header)
+            dst.write(CHUNK_LENGTH.pack(len(sealed)))
+            dst.write(sealed)
+            total += len(chunk)
+            if final:
+                break
+            chunk = following
+            index += 1
+        self.bytes_encrypted.inc(total)
+        return total
+
+    def decrypt_stream(self, src, dst):
+        """Verify and decrypt a stream written by ``encrypt_stream``; raises ``InvalidToken`` on tampering."""
+        header = read_full(src, STREAM_HEADER.size)
+        if len(header) != STREAM_HEADER.size:
+            raise InvalidToken
+        magic, key_id, chunk_size, prefix = STREAM_HEADER.unpack(header)
+        key = self.key_for_id(key_id)
+        if magic != STREAM_MAGIC or key is None:
+            raise InvalidToken
+        total = 0
+        index = 0
+        while True:
+            raw_length = read_full(src, CHUNK_LENGTH.size)
+            if len(raw_length) != CHUNK_LENGTH.size:
+                raise InvalidToken  # بتر قبل القطعة الأخيرة
+            (length,) = CHUNK_LENGTH.unpack(raw_length)
+            if length > chunk_size + TAG_SIZE:
+                raise InvalidToken
+            sealed = read_full(src, length)
+            try:
+                chunk = key.aead.decrypt(chunk_nonce(prefix, index, False), sealed, header)
+                final = False
+            except InvalidTag:
+                try:
+                    chunk = key.aead.decrypt(chunk_nonce(prefix, index, True), sealed, header)
+                except InvalidTag:
+                    raise InvalidToken
+                final = True
+            dst.write(chunk)
+            total += len(chunk)
+            if final:
+                if src.read(1):
+                    raise InvalidToken  # بيانات بعد القطعة الأخيرة
+                return total
+            index += 1
+
+    def encrypt_file(self, src_path, dst_path, chunk_size=None):
+        with open(src_path, "rb") as src, open(dst_path, "wb") as dst:
+            return self.encrypt_stream(src, dst, chunk_size)
+
+    def decrypt_file(self, src_path, dst_path):
+        with open(src_path, "rb") as src, open(dst_path, "wb") as dst:
+            return self.decrypt_stream(src, dst)
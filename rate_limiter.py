@@ -0,0 +1,307 @@
+# rate_limiter.py - تحديد المعدل وقفل تسجيل الدخول بحالة مشتركة بين عمليات gunicorn عبر ذاكرة مشتركة
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+
+import monitoring
+
+_SHM_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+RATE_LIMIT_PATH = os.getenv("RATE_LIMIT_PATH", os.path.join(_SHM_DIR, "btec_rate_limit"))
+RATE_LIMIT_SLOTS = int(os.getenv("RATE_LIMIT_SLOTS", "65536"))
+RATE_LIMIT_PROBES = 8
+LOCKOUT_PATH = os.getenv("LOCKOUT_PATH", RATE_LIMIT_PATH + "_login")
+LOCKOUT_SLOTS = int(os.getenv("LOCKOUT_SLOTS", "16384"))
+RATE_LIMIT = os.getenv("RATE_LIMIT", "100/minute")  # production.rate_limit في config.yaml
+USER_RATE_LIMIT = os.getenv("USER_RATE_LIMIT", "300/minute")
+ENDPOINT_RATE_LIMIT = os.getenv("ENDPOINT_RATE_LIMIT", "3000/minute")
+MAX_LOGIN_ATTEMPTS = int(os.getenv("MAX_LOGIN_ATTEMPTS", "5"))  # security.max_login_attempts
+LOCKOUT_DURATION = int(os.getenv("LOCKOUT_DURATION_MINUTES", "15")) * 60  # security.lockout_duration_minutes
+_KEY_CACHE_SIZE = 65536
+
+_MAGIC = b"BRL1"
+_HEADER = struct.Struct("<4sI")
+# key hash | updated | a | b | c — معنى الحقول الثلاثة الأخيرة يحدده نوع العداد
+_SLOT = struct.Struct("<Qdddd")
+_HEADER_SIZE = _HEADER.size
+_SLOT_SIZE = _SLOT.size
+_unpack_slot = _SLOT.unpack_from
+_pack_slot = _SLOT.pack_into
+_PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+
+def parse_rate(rate):
+    """``"100/minute"`` -> ``(100, 60.0)``."""
+    count, _, period = rate.partition("/")
+    period = period.strip().rstrip("s") or "second"
+    if period not in _PERIODS:
+        raise ValueError(f"unknown rate period: {rate}")
+    return int(count), float(_PERIODS[period])
+
+
+_key_hashes = {}
+
+
+def _key_hash(key):
+    # hash() يختلف بين العمليات، فالمفتاح يحتاج بصمة ثابتة؛ الصفر محجوز للخانة الفارغة
+    h = _key_hashes.get(key)
+    if h is None:
+        if len(_key_hashes) >= _KEY_CACHE_SIZE:
+            _key_hashes.clear()
+        h = int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "little") or 1
+        _key_hashes[key] = h
+    return h
+
+
+class SharedTable:
+    """Fixed-size open-addressed table in a memory-mapped file shared by all workers.
+
+    Every read-modify-write happens inside ``with table:``, which holds a
+    thread lock and an ``flock`` on the file; a request takes it once for all
+    of its counters. When a key's probe window is full, the least recently
+    updated slot is reused, so the table never grows; ``pinned(a, b, c, now)``
+    marks slots that are only reused when every slot in the window is pinned.
+    """
+
+    def __init__(self, path=RATE_LIMIT_PATH, slots=RATE_LIMIT_SLOTS, pinned=None):
+        self.path = path
+        self.slots = slots
+        self.pinned = pinned
+        self._size = _HEADER.size + slots * _SLOT.size
+        self._open()
+        # flock يتبع وصف الملف المفتوح، فالعملية الابنة بعد fork تحتاج وصفاً خاصاً بها
+        os.register_at_fork(after_in_child=self._reopen)
+
+    def _open(self):
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(self._fd).st_size != self._size:
+                os.ftruncate(self._fd, 0)
+                os.ftruncate(self._fd, self._size)
+                os.pwrite(self._fd, _HEADER.pack(_MAGIC, self.slots), 0)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._map = mmap.mmap(self._fd, self._size)
+        if _HEADER.unpack_from(self._map, 0) != (_MAGIC, self.slots):
+            raise ValueError(f"rate limit table {self.path} has an incompatible layout")
+        self._lock = threading.Lock()
+
+    def _reopen(self):
+        if self._fd is not None:
+            self._map.close()
+            os.close(self._fd)
+            self._open()
+
+    # الجدول نفسه مدير سياق: أرخص من contextmanager المبني على المولّدات في المسار الساخن
+    def __enter__(self):
+        self._lock.acquire()
+        try:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        except BaseException:
+            self._lock.release()
+            raise
+        return self
+
+    def __exit__(self, *exc):
+        try:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        finally:
+            self._lock.release()
+
+    def apply(self, key, fn, now):
+        """Apply ``fn(found, a, b, c, now) -> (result, a, b, c)`` to ``key``'s slot; call while holding the table."""
+        h = _key_hashes.get(key) or _key_hash(key)
+        m = self._map
+        slots = self.slots
+        start = h % slots
+        offset = _HEADER_SIZE + start * _SLOT_SIZE
+        key_hash, updated, a, b, c = _unpack_slot(m, offset)
+        # المسار الشائع: المفتاح في خانته الأولى أو الخانة فارغة
+        if key_hash != h and key_hash != 0:
+            offset, key_hash, a, b, c = self._probe(h, start, now)
+        found = key_hash == h
+        if not found:
+            a = b = c = 0.0
+        result, a, b, c = fn(found, a, b, c, now)
+        _pack_slot(m, offset, h, now, a, b, c)
+        return result
+
+    def _probe(self, h, start, now):
+        # النافذة ممتلئة بمفاتيح أخرى: ابحث عن المفتاح أو خانة فارغة، وإلا فأقدم خانة غير مثبتة
+        m = self._map
+        pinned = self.pinned
+        oldest = oldest_pinned = None
+        for i in range(RATE_LIMIT_PROBES):
+            probe = _HEADER_SIZE + ((start + i) % self.slots) * _SLOT_SIZE
+            key_hash, updated, a, b, c = _unpack_slot(m, probe)
+            if key_hash == h or key_hash == 0:
+                return probe, key_hash, a, b, c
+            if pinned is not None and pinned(a, b, c, now):
+                if oldest_pinned is None or updated < oldest_pinned[1]:
+                    oldest_pinned = probe, updated
+            elif oldest is None or updated < oldest[1]:
+                oldest = probe, updated
+        return (oldest or oldest_pinned)[0], 0, 0.0, 0.0, 0.0
+
+    def peek(self, key, fn, now):
+        """Return ``fn``'s result for ``key`` without writing; a missing key is never allocated."""
+        h = _key_hashes.get(key) or _key_hash(key)
+        with self:
+            m = self._map
+            for i in range(RATE_LIMIT_PROBES):
+                key_hash, _, a, b, c = _unpack_slot(m, _HEADER_SIZE + ((h + i) % self.slots) * _SLOT_SIZE)
+                if key_hash == h:
+                    return fn(True, a, b, c, now)[0]
+                if key_hash == 0:
+                    break
+        return fn(False, 0.0, 0.0, 0.0, now)[0]
+
+    def update(self, key, fn, now):
+        with self:
+            return self.apply(key, fn, now)
+
+    def clear(self):
+        with self:
+            self._map[_HEADER.size:] = bytes(self._size - _HEADER.size)
+
+    def close(self):
+        self._map.close()
+        os.close(self._fd)
+        self._fd = None
+
+
+# ------ العدادات: كل منها O(1) في الزمن والذاكرة لكل مفتاح ------
+def _token_bucket(rate, burst):
+    # a = الرموز المتبقية، b = آخر تعبئة
+    def fn(found, tokens, last, c, now):
+        tokens = burst if not found else min(burst, tokens + (now - last) * rate)
+        if tokens >= 1:
+            return True, tokens - 1, now, c
+        return False, tokens, now, c
+    return fn
+
+
+def _sliding_window(limit, window):
+    # a = عدد النافذة الحالية، b = عدد النافذة السابقة، c = بداية النافذة الحالية
+    def fn(found, current, previous, window_start, now):
+        elapsed = now - window_start
+        if not found or elapsed >= window:
+            # نافذة جديدة: السابقة هي الحالية فقط إذا كانت متجاورة معها
+            previous = current if found and elapsed < 2 * window else 0.0
+            current = 0.0
+            window_start = now - now % window
+            elapsed = now - window_start
+        if previous * (window - elapsed) / window + current >= limit:
+            return False, current, previous, window_start
+        return True, current + 1, previous, window_start
+    return fn
+
+
+def _login_failure(max_attempts, duration):
+    # a = عدد المحاولات الفاشلة، b = نهاية القفل، c = أول فشل في الفترة الحالية
+    def fn(found, failures, locked_until, first, now):
+        if not found or now - first > duration:
+            failures, first = 0.0, now
+        failures += 1
+        if failures >= max_attempts:
+            return True, 0.0, now + duration, now
+        return False, failures, locked_until, first
+    return fn
+
+
+def _lock_status(found, failures, locked_until, first, now):
+    return (locked_until - now if found and locked_until > now else 0.0), failures, locked_until, first
+
+
+def _locked(failures, locked_until, first, now):
+    return locked_until > now
+
+
+def _reset(found, a, b, c, now):
+    return None, 0.0, 0.0, 0.0
+
+
+class RateLimiter:
+    """Per-IP, per-user and per-endpoint limits plus login lockout over a ``SharedTable``.
+
+    IPs and users use sliding-window counters (two fixed windows weighted by
+    overlap); endpoints use token buckets so short bursts up to the limit are
+    absorbed. All gunicorn workers on a host see the same counts. Login
+    failures live in their own ``lockout_table`` where active lockouts are
+    pinned, so request traffic can never evict them.
+    """
+
+    def __init__(self, table=None, ip_rate=RATE_LIMIT, user_rate=USER_RATE_LIMIT,
+                 endpoint_rate=ENDPOINT_RATE_LIMIT, max_login_attempts=MAX_LOGIN_ATTEMPTS,
+                 lockout_duration=LOCKOUT_DURATION, lockout_table=None):
+        self.table = table or SharedTable()
+        self.lockout_table = lockout_table or SharedTable(LOCKOUT_PATH, LOCKOUT_SLOTS, pinned=_locked)
+        self._ip = _sliding_window(*parse_rate(ip_rate))
+        self._user = _sliding_window(*parse_rate(user_rate))
+        count, period = parse_rate(endpoint_rate)
+        self._endpoint = _token_bucket(count / period, count)
+        self._login_failure = _login_failure(max_login_attempts, lockout_duration)
+        self.rejections = {scope: monitoring.counter(f"rate_limit_{scope}_rejections_total",
+                                                     f"Requests rejected by the per-{scope} rate limit")
+                           for scope in ("ip", "user", "endpoint")}
+        self.lockouts = monitoring.counter("login_lockouts_total", "Accounts locked after repeated login failures")
+        self.locked_rejections = monitoring.counter("login_locked_rejections_total",
+                                                    "Login attempts refused during a lockout")
+
+    def check(self, ip=None, user=None, endpoint=None, now=None):
+        """Count one request; returns the scope that rejected it (``"ip"``, ``"user"``, ``"endpoint"``) or ``None``."""
+        now = time.time() if now is None else now
+        table = self.table
+        apply = table.apply
+        rejected = None
+        # قفل واحد لكل طلب يغطي العدادات الثلاثة
+        with table:
+            if ip is not None and not apply("ip:" + ip, self._ip, now):
+                rejected = "ip"
+            elif user is not None and not apply(f"user:{user}", self._user, now):
+                rejected = "user"
+            elif endpoint is not None and not apply("endpoint:" + endpoint, self._endpoint, now):
+                rejected = "endpoint"
+        if rejected is not None:
+            self.rejections[rejected].inc()
+        return rejected
+
+    def limit_exceeded(self, remote_addr):
+        return self.check(ip=remote_addr) is not None
+
+    # ------ قفل تسجيل الدخول ------
+    def lockout_remaining(self, user, now=None):
+        """Seconds left on ``user``'s lockout, ``0`` when not locked."""
+        now = time.time() if now is None else now
+        remaining = self.lockout_table.peek(f"login:{user}", _lock_status, now)
+        if remaining:
+            self.locked_rejections.inc()
+        return remaining
+
+    def record_login_failure(self, user, now=None):
+        """Returns ``True`` when this failure locked the account."""
+        locked = self.lockout_table.update(f"login:{user}", self._login_failure, time.time() if now is None else now)
+        if locked:
+            self.lockouts.inc()
+        return locked
+
+    def record_login_success(self, user):
+        self.lockout_table.update(f"login:{user}", _reset, time.time())
+
+
+_limiter = None
+_init_lock = threading.Lock()
+
+
+def get_limiter():
+    global _limiter
+    if _limiter is None:
+        with _init_lock:
+            if _limiter is None:
+                _limiter = RateLimiter()
+    return _limiter
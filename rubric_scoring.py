@@ -0,0 +1,45 @@
+# rubric_scoring.py - تقييم كل معايير الـ rubric في استدعاء واحد مجمّع بدلاً من استدعاء لكل معيار
+RUBRIC_BATCH_SIZE = 16
+
+
+def score_rubric(classifier, text, criteria, batch_size=RUBRIC_BATCH_SIZE, **kwargs):
+    """Score every criterion's dimensions with one zero-shot call.
+
+    With ``multi_label=True`` the zero-shot pipeline scores each label on its
+    own (entailment vs. contradiction for that label only), so the union of
+    all criteria's labels can go through a single call and be split back per
+    criterion without changing any score. Each criterion gets the same
+    ``{'sequence', 'labels', 'scores'}`` dict the per-criterion call returned.
+
+    The NLI model is a cross-encoder, so nothing is shared between pairs:
+    the text is re-encoded with every label and the compute per pair is
+    unchanged. The saving is pipeline overhead paid once instead of per
+    criterion, pairs stacked ``batch_size`` at a time into fewer forward
+    calls, and labels shared between criteria scored once. A dimension
+    listed twice in one criterion is kept once.
+    """
+    labels = []
+    seen = set()
+    for criterion in criteria:
+        for label in criterion['dimensions']:
+            if label not in seen:
+                seen.add(label)
+                labels.append(label)
+    if not labels:
+        return {criterion['name']: {'sequence': text, 'labels': [], 'scores': []}
+                for criterion in criteria}
+
+    result = classifier(text, candidate_labels=labels, multi_label=True,
+                        batch_size=batch_size, **kwargs)
+    scores = dict(zip(result['labels'], result['scores']))
+
+    analysis = {}
+    for criterion in criteria:
+        # dict.fromkeys يزيل تكرار البعد داخل المعيار مع الحفاظ على ترتيبه
+        ranked = sorted(dict.fromkeys(criterion['dimensions']), key=lambda label: scores[label], reverse=True)
+        analysis[criterion['name']] = {
+            'sequence': text,
+            'labels': ranked,
+            'scores': [scores[label] for label in ranked],
+        }
+    return analysis
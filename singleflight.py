@@ -0,0 +1,116 @@
+# singleflight.py - دمج الطلبات المتزامنة المتطابقة في استدعاء واحد
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+import monitoring
+
+
+class _Call:
+    __slots__ = ("future", "waiters")
+
+    def __init__(self, future):
+        self.future = future
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Concurrent ``do(key, ...)`` calls share one execution of ``fn``.
+
+    The function runs on a worker thread, so each caller waits with its own
+    timeout. A caller that gives up does not affect the others; if every caller
+    gives up before the call has started, it is cancelled.
+    """
+
+    def __init__(self, max_workers=32, name="singleflight"):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._calls = {}
+        # RLock: إلغاء المستقبل يستدعي _forget فوراً في نفس الخيط
+        self._lock = threading.RLock()
+        self.executed = monitoring.counter(f"{name}_executed_total", "Upstream calls actually executed")
+        self.coalesced = monitoring.counter(f"{name}_coalesced_total", "Callers that joined an in-flight call")
+        self.timeouts = monitoring.counter(f"{name}_timeouts_total", "Callers that stopped waiting on a call")
+        self.cancelled = monitoring.counter(f"{name}_cancelled_total", "Calls cancelled after every caller left")
+
+    def do(self, key, fn, *args, timeout=None):
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = _Call(self._executor.submit(fn, *args))
+                self._calls[key] = call
+                call.future.add_done_callback(lambda _f, key=key, call=call: self._forget(key, call))
+                self.executed.inc()
+            else:
+                self.coalesced.inc()
+            call.waiters += 1
+        try:
+            return call.future.result(timeout)
+        except FutureTimeout:
+            self.timeouts.inc()
+            raise TimeoutError(f"call for {key!r} did not finish within {timeout}s")
+        finally:
+            self._leave(key, call)
+
+    def _leave(self, key, call):
+        with self._lock:
+            call.waiters -= 1
+            # لا أحد ينتظر: إلغاء الاستدعاء إن لم يبدأ بعد
+            if call.waiters == 0 and not call.future.done() and call.future.cancel():
+                self.cancelled.inc()
+
+    def _forget(self, key, call):
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+
+class AsyncSingleFlight:
+    """``SingleFlight`` for coroutines on one event loop.
+
+    The shared call runs as a task; each caller waits on it through ``shield``
+    with its own timeout, and the task is cancelled once every caller has left.
+    """
+
+    def __init__(self, name="async_singleflight"):
+        self._calls = {}
+        self.executed = monitoring.counter(f"{name}_executed_total", "Upstream calls actually executed")
+        self.coalesced = monitoring.counter(f"{name}_coalesced_total", "Callers that joined an in-flight call")
+        self.timeouts = monitoring.counter(f"{name}_timeouts_total", "Callers that stopped waiting on a call")
+        self.cancelled = monitoring.counter(f"{name}_cancelled_total", "Calls cancelled after every caller left")
+
+    async def do(self, key, fn, *args, timeout=None):
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.ensure_future(fn(*args)))
+            self._calls[key] = call
+            call.future.add_done_callback(lambda _f, key=key, call=call: self._forget(key, call))
+            self.executed.inc()
+        else:
+            self.coalesced.inc()
+        call.waiters += 1
+        try:
+            return await asyncio.wait_for(asyncio.shield(call.future), timeout)
+        except asyncio.TimeoutError:
+            self.timeouts.inc()
+            raise TimeoutError(f"call for {key!r} did not finish within {timeout}s")
+        finally:
+            call.waiters -= 1
+            # لا أحد ينتظر (انتهت المهلة أو انقطع العميل): لا داعي لإكمال الاستدعاء
+            if call.waiters == 0 and not call.future.done() and call.future.cancel():
+                # ردّ done في المهمة يأتي في دورة لاحقة؛ الإزالة الآن تمنع مستدعياً جديداً من الانضمام لمهمة ملغاة
+                self._forget(key, call)
+                self.cancelled.inc()
+
+    def _forget(self, key, call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    def in_flight(self):
+        return len(self._calls)
@@ -0,0 +1,160 @@
+# task_analytics.py - تجميع في SQL وعدادات مادية تُحدَّث تزايدياً ومخطط مخزّن حسب إصدار البيانات
+import base64
+import io
+import re
+import threading
+
+import db_pool
+import monitoring
+
+TRACKED_DIMENSIONS = ("approved", "grade")
+_IDENTIFIER = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+_SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS task_counters (
+        dimension TEXT NOT NULL,
+        value_key TEXT NOT NULL,
+        value,
+        count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (dimension, value_key))""",
+    """CREATE TABLE IF NOT EXISTS task_analytics_version (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER NOT NULL)""",
+    "INSERT OR IGNORE INTO task_analytics_version (id, version) VALUES (1, 0)",
+)
+
+_BUMP = "UPDATE task_analytics_version SET version = version + 1 WHERE id = 1;"
+_INCREMENT = ("INSERT INTO task_counters (dimension, value_key, value, count) "
+              "VALUES ('{col}', quote(NEW.{col}), NEW.{col}, 1) "
+              "ON CONFLICT (dimension, value_key) DO UPDATE SET count = count + 1;")
+_DECREMENT = ("UPDATE task_counters SET count = count - 1 "
+              "WHERE dimension = '{col}' AND value_key = quote(OLD.{col});")
+
+
+def task_columns(conn):
+    return {row[1] for row in conn.execute("PRAGMA table_info(tasks)")}
+
+
+def ensure_schema(conn, dimensions=TRACKED_DIMENSIONS):
+    """Create counter tables, indexes and triggers for the ``dimensions`` that exist on ``tasks``.
+
+    Triggers keep the counters exact for every writer of the table, including
+    raw SQL elsewhere in the app; a new dimension is backfilled once with a
+    ``GROUP BY`` over its index. Everything runs in one ``BEGIN IMMEDIATE``
+    transaction, so workers starting together install and backfill once.
+    Returns the dimensions being tracked.
+    """
+    if not conn.in_transaction:
+        conn.execute("BEGIN IMMEDIATE")
+    columns = task_columns(conn)
+    tracked = [d for d in dimensions if d in columns and _IDENTIFIER.match(d)]
+    for statement in _SCHEMA:
+        conn.execute(statement)
+    for col in tracked:
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_tasks_{col} ON tasks ({col})")
+        exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = ?",
+                              (f"trg_task_counters_{col}_ins",)).fetchone()
+        if exists:
+            continue
+        conn.execute(f"CREATE TRIGGER IF NOT EXISTS trg_task_counters_{col}_ins AFTER INSERT ON tasks BEGIN "
+                     f"{_INCREMENT.format(col=col)} {_BUMP} END")
+        conn.execute(f"CREATE TRIGGER IF NOT EXISTS trg_task_counters_{col}_upd AFTER UPDATE OF {col} ON tasks "
+                     f"WHEN OLD.{col} IS NOT NEW.{col} BEGIN "
+                     f"{_DECREMENT.format(col=col)} {_INCREMENT.format(col=col)} {_BUMP} END")
+        conn.execute(f"CREATE TRIGGER IF NOT EXISTS trg_task_counters_{col}_del AFTER DELETE ON tasks BEGIN "
+                     f"{_DECREMENT.format(col=col)} {_BUMP} END")
+        rebuild_counters(conn, col)
+    conn.commit()
+    return tracked
+
+
+def rebuild_counters(conn, dimension):
+    """Recompute one dimension's counters from ``tasks`` with a single indexed ``GROUP BY``."""
+    conn.execute("DELETE FROM task_counters WHERE dimension = ?", (dimension,))
+    conn.execute(f"INSERT INTO task_counters (dimension, value_key, value, count) "
+                 f"SELECT ?, quote({dimension}), {dimension}, COUNT(*) FROM tasks GROUP BY {dimension}",
+                 (dimension,))
+    conn.execute(_BUMP)
+
+
+def counts(conn, dimension):
+    """``(value, count)`` pairs, most frequent first; NULLs are left out as in pandas ``value_counts``."""
+    rows = conn.execute("SELECT value, count FROM task_counters WHERE dimension = ? AND count > 0 "
+                        "AND value IS NOT NULL ORDER BY count DESC, value_key", (dimension,)).fetchall()
+    return [(value, count) for value, count in rows]
+
+
+def data_version(conn):
+    return conn.execute("SELECT version FROM task_analytics_version WHERE id = 1").fetchone()[0]
+
+
+def render_bar_chart(pairs, title, xlabel, ylabel="Count"):
+    """PNG of a bar chart as base64, drawn with matplotlib's Agg backend."""
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(figsize=(10, 6))
+    try:
+        ax.bar([str(value) for value, _ in pairs], [count for _, count in pairs])
+        ax.set_title(title)
+        ax.set_xlabel(xlabel)
+        ax.set_ylabel(ylabel)
+        buf = io.BytesIO()
+        fig.savefig(buf, format="png")
+    finally:
+        plt.close(fig)
+    return base64.b64encode(buf.getvalue()).decode("utf-8")
+
+
+class TaskAnalytics:
+    """Dashboard aggregates served from materialized counters.
+
+    A request reads the version row and, if it matches the cached chart's
+    version, returns the cached PNG without touching ``tasks`` or matplotlib.
+    """
+
+    def __init__(self, db_path=db_pool.DB_PATH, dimensions=TRACKED_DIMENSIONS, renderer=render_bar_chart):
+        self.pool = db_pool.ConnectionPool(db_path, size=2)
+        self.renderer = renderer
+        with self.pool.connection() as conn:
+            self.dimensions = ensure_schema(conn, dimensions)
+        self._charts = {}
+        self._lock = threading.Lock()
+        self.chart_hits = monitoring.counter("analytics_chart_cache_hits_total", "Dashboard charts served from cache")
+        self.chart_renders = monitoring.counter("analytics_chart_renders_total", "Dashboard charts rendered")
+
+    def counts(self, dimension="approved"):
+        if dimension not in self.dimensions:
+            raise ValueError(f"dimension is not tracked: {dimension}")
+        with self.pool.connection() as conn:
+            return counts(conn, dimension)
+
+    def version(self):
+        with self.pool.connection() as conn:
+            return data_version(conn)
+
+    def chart(self, dimension="approved", title="Task Approvals", xlabel="Approval Status"):
+        """Base64 PNG for ``dimension``; re-rendered only when the data version moves."""
+        if dimension not in self.dimensions:
+            raise ValueError(f"dimension is not tracked: {dimension}")
+        with self.pool.connection() as conn:
+            version = data_version(conn)
+            cached = self._charts.get(dimension)
+            if cached is not None and cached[0] == version:
+                self.chart_hits.inc()
+                return cached[1]
+            pairs = counts(conn, dimension)
+        with self._lock:
+            cached = self._charts.get(dimension)
+            if cached is not None and cached[0] >= version:
+                self.chart_hits.inc()
+                return cached[1]
+            plot = self.renderer(pairs, title, xlabel)
+            self._charts[dimension] = (version, plot)
+            self.chart_renders.inc()
+            return plot
+
+    def close(self):
+        self.pool.close()
@@ -0,0 +1,5 @@
+# conftest.py - تشغيل الاختبارات من جذر المستودع دون تثبيت حزمة
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
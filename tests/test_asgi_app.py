@@ -0,0 +1,81 @@
+# test_asgi_app.py - طلبات HTTP مشوهة عبر uvicorn: رد 400 واحد ولا طلب مهرّب
+import socket
+import threading
+import time
+
+import pytest
+
+uvicorn = pytest.importorskip("uvicorn")
+
+import asgi_app
+
+
+@pytest.fixture(scope="module")
+def port():
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    sock.listen(16)
+    app = asgi_app.AsyncEvaluationApp(secret_key="test-secret")
+    server = uvicorn.Server(uvicorn.Config(app, fd=sock.fileno(), lifespan="off", log_level="error"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 10
+    while not server.started:
+        assert time.monotonic() < deadline, "uvicorn did not start"
+        time.sleep(0.02)
+    yield sock.getsockname()[1]
+    server.should_exit = True
+    thread.join(10)
+    sock.close()
+
+
+def exchange(port, raw):
+    """Send ``raw`` and return everything the server writes before closing or going quiet."""
+    with socket.create_connection(("127.0.0.1", port)) as conn:
+        conn.sendall(raw)
+        conn.settimeout(2)
+        out = b""
+        try:
+            while True:
+                data = conn.recv(65536)
+                if not data:
+                    break
+                out += data
+        except socket.timeout:
+            pass
+    return out
+
+
+def status_lines(response):
+    return [line for line in response.split(b"\r\n") if line.startswith(b"HTTP/1.1 ")]
+
+
+@pytest.mark.parametrize("raw", [
+    b"POST /api/v1/evaluate HTTP/1.1\r\nHost: x\r\nContent-Length: -3\r\n\r\n"
+    b"GET /metrics HTTP/1.1\r\nHost: x\r\n\r\n",
+    b"POST /api/v1/evaluate HTTP/1.1\r\nHost: x\r\nContent-Length: 0\r\nContent-Length: 40\r\n\r\n"
+    b"GET /metrics HTTP/1.1\r\nHost: x\r\n\r\n",
+    b"GARBAGE\r\n\r\n",
+    b"GET /api/v1/audit HTTP/1.1\r\nHost: x\r\nBad Header\r\n\r\n",
+], ids=["negative-length", "duplicate-length", "bad-request-line", "bad-header"])
+def test_malformed_request_gets_one_400(port, raw):
+    lines = status_lines(exchange(port, raw))
+    assert len(lines) == 1
+    assert lines[0].startswith(b"HTTP/1.1 400")
+
+
+def test_chunked_body_wins_over_content_length(port):
+    # RFC 9112: Transfer-Encoding يتقدم على Content-Length، ولا يُنفَّذ ما بعد الجسم المجزأ كطلب مهرّب
+    lines = status_lines(exchange(port, b"POST /api/v1/evaluate HTTP/1.1\r\nHost: x\r\nContent-Length: 5\r\n"
+                                        b"Transfer-Encoding: chunked\r\n\r\n0\r\n\r\n"
+                                        b"GET /metrics HTTP/1.1\r\nHost: x\r\n\r\n"))
+    assert len(lines) == 1
+    assert lines[0].split()[1] == b"401"
+
+
+def test_well_formed_requests_reach_the_app(port):
+    response = exchange(port, b"POST /api/v1/evaluate HTTP/1.1\r\nHost: x\r\nContent-Length: 2\r\n\r\n{}")
+    assert [line.split()[1] for line in status_lines(response)] == [b"401"]
+    assert b"Token missing" in response
+    response = exchange(port, b"GET /nowhere HTTP/1.1\r\nHost: x\r\nConnection: close\r\n\r\n")
+    assert [line.split()[1] for line in status_lines(response)] == [b"404"]
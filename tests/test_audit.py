@@ -0,0 +1,64 @@
+# test_audit.py - كتابة سجلات التدقيق عبر خط الأنابيب وقراءتها بالتصفية والترقيم
+import pytest
+
+import audit_pipeline
+import audit_store
+import db_pool
+
+# نفس مخطط init_secure_db قبل أن يضيف audit_store عمود details والفهارس
+SCHEMA = '''CREATE TABLE audit_log
+            (id INTEGER PRIMARY KEY,
+             user_id INTEGER,
+             action TEXT,
+             timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP)'''
+
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = db_pool.ConnectionPool(str(tmp_path / "audit.db"), size=2)
+    with pool.connection() as conn:
+        conn.execute(SCHEMA)
+        audit_store.ensure_schema(conn)
+        conn.commit()
+    yield pool
+    pool.close()
+
+
+def write_events(pool, events):
+    pipeline = audit_pipeline.AuditPipeline(audit_pipeline.SQLiteAuditSink(pool), batch_size=7,
+                                            flush_interval=0.05, name="test_audit")
+    for user, action, details in events:
+        assert pipeline.enqueue(user, action, details)
+    pipeline.close()
+
+
+def test_written_events_come_back_filtered(pool):
+    events = [(i % 3, "login" if i % 2 else "evaluate", f"event {i}") for i in range(40)]
+    write_events(pool, events)
+
+    with pool.connection() as conn:
+        rows, cursor = audit_store.fetch_page(conn, user_id=1, action="login", limit=1000)
+    assert cursor is None
+    expected = {details for user, action, details in events if user == 1 and action == "login"}
+    assert {row["details"] for row in rows} == expected
+    assert all(row["user_id"] == 1 and row["action"] == "login" and row["timestamp"] for row in rows)
+
+
+def test_pages_cover_every_row_once(pool):
+    write_events(pool, [(7, "evaluate", f"task {i}") for i in range(25)])
+
+    seen, cursor = [], None
+    with pool.connection() as conn:
+        while True:
+            rows, cursor = audit_store.fetch_page(conn, action="evaluate", cursor=cursor, limit=10)
+            seen.extend(row["id"] for row in rows)
+            if cursor is None:
+                break
+        streamed = [row["id"] for row in audit_store.iter_rows(conn, user_id=7)]
+    assert len(seen) == len(set(seen)) == 25
+    assert streamed == seen
+
+
+def test_invalid_cursor_is_rejected(pool):
+    with pool.connection() as conn, pytest.raises(ValueError):
+        audit_store.fetch_page(conn, cursor="not-a-cursor")
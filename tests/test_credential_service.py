@@ -0,0 +1,52 @@
+# test_credential_service.py - مسارات التحقق القديمة: نص صريح وwerkzeug وصيغ غير مدعومة
+import hashlib
+
+import pytest
+
+import credential_service as cs
+
+PARAMS = cs.current_params("pbkdf2_sha256")
+
+
+def werkzeug_pbkdf2(password, salt="s4lt", iterations=1000):
+    digest = hashlib.pbkdf2_hmac("sha256", password.encode(), salt.encode(), iterations).hex()
+    return f"pbkdf2:sha256:{iterations}${salt}${digest}"
+
+
+@pytest.mark.parametrize("password", ["plain", "Pa$$word", "$not-a-prefix"])
+def test_plaintext_password_verifies_and_upgrades(password):
+    ok, new_hash = cs._verify(password, password, PARAMS)
+    assert ok
+    assert new_hash.startswith("$pbkdf2-sha256$")
+    assert cs._verify(password, new_hash, PARAMS) == (True, None)
+
+
+def test_wrong_plaintext_password_fails():
+    assert cs._verify("nope", "Pa$$word", PARAMS) == (False, None)
+
+
+def test_werkzeug_hash_verifies_and_upgrades():
+    stored = werkzeug_pbkdf2("secret")
+    ok, new_hash = cs._verify("secret", stored, PARAMS)
+    assert ok and new_hash.startswith("$pbkdf2-sha256$")
+    assert cs._verify("wrong", stored, PARAMS) == (False, None)
+
+
+def test_current_hash_is_not_rehashed():
+    stored = cs._hash("secret", PARAMS)
+    assert cs._verify("secret", stored, PARAMS) == (True, None)
+    assert cs._verify("wrong", stored, PARAMS) == (False, None)
+
+
+@pytest.mark.parametrize("stored", [
+    "$2b$12$abcdefghijklmnopqrstuv",
+    "$argon2id$v=19$m=65536,t=3,p=4$c2FsdA$aGFzaA",
+    "$scrypt$broken",
+    "pbkdf2:sha256:1000$zz$nothex",
+])
+def test_unsupported_or_broken_hash_never_matches_as_plaintext(stored):
+    assert cs._verify(stored, stored, PARAMS) == (False, None)
+
+
+def test_unknown_user_fails():
+    assert cs._verify("secret", None, PARAMS) == (False, None)
@@ -0,0 +1,111 @@
+# test_restore.py - الاستعادة بينما المجمع يحمل اتصالات، في هذه العملية وفي عملية أخرى
+import os
+import sqlite3
+import threading
+import time
+
+import pytest
+
+import backup_engine
+import db_pool
+from quantum_vault import QuantumVault
+
+
+@pytest.fixture
+def setup(tmp_path):
+    path = str(tmp_path / "live.db")
+    pool = db_pool.ConnectionPool(path, size=2)
+    with pool.connection() as conn:
+        conn.execute("CREATE TABLE t (v)")
+        conn.execute("INSERT INTO t VALUES ('backup')")
+        conn.commit()
+    engine = backup_engine.BackupEngine(QuantumVault(), backup_engine.LocalTarget(str(tmp_path / "backups")),
+                                        db_path=path)
+    manifest = engine.backup()
+    with pool.connection() as conn:
+        conn.execute("UPDATE t SET v = 'after'")
+        conn.commit()
+    yield path, pool, engine, manifest["id"]
+    pool.close()
+
+
+def value(pool):
+    with pool.connection() as conn:
+        return conn.execute("SELECT v FROM t").fetchone()[0]
+
+
+@pytest.mark.parametrize("backup_id", [None, ""])
+def test_restore_requires_backup_id(setup, backup_id):
+    _, pool, engine, _ = setup
+    with pytest.raises(backup_engine.BackupError):
+        engine.restore(backup_id)
+    assert value(pool) == "after"
+
+
+def test_restore_waits_for_borrowed_connection(setup):
+    _, pool, engine, backup_id = setup
+    held, finished = threading.Event(), []
+
+    def borrower():
+        with pool.connection() as conn:
+            held.set()
+            time.sleep(0.5)
+            finished.append(conn.execute("SELECT v FROM t").fetchone()[0])
+
+    thread = threading.Thread(target=borrower)
+    thread.start()
+    held.wait()
+    start = time.monotonic()
+    engine.restore(backup_id)
+    thread.join()
+    assert time.monotonic() - start >= 0.4
+    # الاتصال المعار أنهى عمله على الملف القديم قبل الاستبدال
+    assert finished == ["after"]
+    assert value(pool) == "backup"
+
+
+def test_busy_pool_times_out_without_replacing(setup):
+    path, pool, _, _ = setup
+    ran = []
+    with pool.connection():
+        with pytest.raises(TimeoutError):
+            db_pool.reopen(lambda: ran.append(True), path=path, timeout=0.2)
+    assert ran == []
+    assert value(pool) == "after"
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs fork")
+def test_other_process_sees_restore_and_stale_writer_is_fenced(setup):
+    path, pool, engine, backup_id = setup
+    ready_r, ready_w = os.pipe()
+    go_r, go_w = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        # عامل آخر: مجمع استُعمل قبل الاستعادة واتصال خام مفتوح لحظة الاستبدال
+        try:
+            child = db_pool.ConnectionPool(path, size=2)
+            with child.connection() as conn:
+                conn.execute("SELECT 1").fetchall()
+            stale = sqlite3.connect(path, timeout=0.5, isolation_level=None)
+            stale.execute("SELECT * FROM t").fetchall()
+            os.write(ready_w, b"x")
+            os.read(go_r, 1)
+            with child.connection() as conn:
+                seen = conn.execute("SELECT v FROM t").fetchone()[0]
+            try:
+                stale.execute("INSERT INTO t VALUES ('lost')")
+                late = "written"
+            except sqlite3.OperationalError:
+                late = "fenced"
+            os.write(ready_w, f"{seen}|{late}".encode())
+        finally:
+            os._exit(0)
+    os.read(ready_r, 1)
+    engine.restore(backup_id)
+    os.write(go_w, b"x")
+    result = os.read(ready_r, 100).decode()
+    os.waitpid(pid, 0)
+    for fd in (ready_r, ready_w, go_r, go_w):
+        os.close(fd)
+    assert result == "backup|fenced"
+    assert value(pool) == "backup"